@@ -1,6 +1,126 @@
-from .enl import *
-from .interpolate import *
-from .spatial_denoise import *
-from .ratio_denoise import *
-from .rio_tools import *
-from .nd_tools import *
+"""
+The public functions of the submodules are available from the top-level
+package, e.g. `rabasar.scale_img`. The submodules are only imported when one
+of their names is first accessed (PEP 562) so that `import rabasar` does not
+pull in astropy, bm3d, rasterio, etc. unless they are needed.
+"""
+import importlib
+
+_submodule_attrs = {
+    'enl': ['get_enl_img',
+            'get_enl_mode',
+            'get_enl_mask',
+            'get_enl_sampled',
+            'get_enl_imgs',
+            'get_enl_modes'],
+    'interpolate': ['interpolate_nn'],
+    'spatial_denoise': ['admm_spatial_denoise',
+                        'newton_lklhd_iter'],
+    'ratio_denoise': ['admm_ratio_denoise',
+                      'ratio_lklhd_iter'],
+    'rio_tools': ['generate_shapes_from_array',
+                  'get_geopandas_features_from_array',
+                  'generate_geopandas_features_from_array',
+                  'polygonize_array_to_shapefile',
+                  'rasterize_shapes_to_array',
+                  'rasterize_shapes_to_multiband_array',
+                  'rasterize_shapes_to_tif',
+                  'reproject_arr_to_match_profile',
+                  'get_cropped_profile',
+                  'get_bounds_dict',
+                  'get_window_from_slices',
+                  'get_window_from_profile',
+                  'read_window',
+                  'read_windows',
+                  'reproject_profile_to_new_crs',
+                  'reproject_arr_to_new_crs',
+                  'convert_4326_to_utm'],
+    'nd_tools': ['scale_img',
+                 'StreamingHistogram',
+                 'get_percentile_bounds'],
+    'geo_array': ['GeoArray'],
+    'checkpoint': ['ADMMCheckpointer'],
+    'admm': ['get_denoiser',
+             'run_admm'],
+    'kernels': ['admm_likelihood_update'],
+    'acceleration': ['ADMMAccelerator',
+                     'get_denoiser_calls',
+                     'benchmark_admm_accelerations'],
+    'ingest': ['DownloadManifest',
+               'get_urls_from_file',
+               'download_file',
+               'download_files',
+               'get_file_checksum',
+               'get_zip_members',
+               'get_vsizip_path',
+               'get_alos1_date_from_xml',
+               'get_alos1_date_from_zip',
+               'get_profile_from_zip',
+               'ingest_alos1_zip',
+               'ingest_alos1_zips'],
+    'catalog': ['SceneCatalog',
+                'get_date_from_path',
+                'get_polarization_from_path'],
+    'uavsar': ['read_uavsar_annotation',
+               'get_uavsar_profile',
+               'convert_uavsar_grid',
+               'convert_uavsar_scene',
+               'convert_uavsar_scenes'],
+    'temporal_stats': ['RunningTemporalStatistics',
+                       'get_temporal_statistics',
+                       'write_temporal_statistics'],
+    'quantize': ['get_db_scale_offset',
+                 'encode_db_uint16',
+                 'decode_db_uint16',
+                 'write_quantized',
+                 'read_product',
+                 'benchmark_quantized_storage'],
+    'pipeline': ['prefetch',
+                 'write_behind',
+                 'run_pipelined',
+                 'denoise_rasters_pipelined'],
+    'planner': ['estimate_peak_memory',
+                'ExecutionPlan',
+                'plan_execution',
+                'run_plan'],
+    'profiling': ['PipelineProfiler',
+                  'profile_stage'],
+    'quicklook': ['get_rgb_bands',
+                  'get_rgb_percentile_bounds',
+                  'scale_rgb_to_uint8',
+                  'write_rgb_cog',
+                  'write_rgb_png',
+                  'make_rgb_quicklooks',
+                  'write_gif'],
+    'temporal': ['RunningTemporalAverage',
+                 'get_temporal_average',
+                 'despeckle_temporal_average',
+                 'rabasar_denoise_one',
+                 'get_dates_to_rerun',
+                 'incremental_rabasar_update',
+                 'get_windowed_temporal_averages',
+                 'windowed_rabasar_denoise'],
+}
+
+_attr_to_submodule = {attr: submodule
+                      for submodule, attrs in _submodule_attrs.items()
+                      for attr in attrs}
+
+__all__ = list(_attr_to_submodule.keys())
+
+
+def __getattr__(name: str):
+    if name in _attr_to_submodule:
+        module = importlib.import_module(f'.{_attr_to_submodule[name]}',
+                                         __name__)
+        value = getattr(module, name)
+        # Cache on the package so __getattr__ is only hit once per name
+        globals()[name] = value
+        return value
+    if name in _submodule_attrs:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__ + list(_submodule_attrs))
@@ -0,0 +1,277 @@
+from typing import Callable
+import numpy as np
+
+ACCELERATIONS = [None, 'relaxation', 'anderson', 'residual_balancing']
+
+
+class ADMMAccelerator(object):
+    """
+    The penalty (beta) update and the optional acceleration of the
+    plug-and-play ADMM loops. With the variables of the loops (the denoiser
+    gives z_kp1 from x_k - u_k, then u and x are updated by
+    `admm_likelihood_update`) the schemes are:
+
+        + None: beta grows by `gamma` whenever the residual does not decrease
+          by a factor `eta` (the heuristic of mulog / Chan et al.).
+        + `relaxation`: over-relaxation [1, 3.4.3]; x_k is replaced by
+          `alpha * x_k + (1 - alpha) * z_k` in the denoiser input and the u
+          update only (x_k is the output of the likelihood step, i.e. the
+          first ADMM step in [1]); the residual is still computed from x_k so
+          that it is comparable across schemes. beta is updated as for None.
+        + `anderson`: Anderson acceleration (type-II, memory `memory`) of the
+          fixed point iteration (x_k, u_k) -> (x_kp1, u_kp1); z is the output
+          of the denoiser so it follows. Safeguarded by a restart: if the
+          fixed point residual grows by more than `restart_factor`, the
+          history is cleared and the plain ADMM step is taken. The history is
+          also cleared whenever beta (updated as for None) changes, since the
+          fixed point map changes with it. Keeps `2 * memory + 4`
+          preallocated float64 copies of (x, u) in memory (the history of
+          differences in ring buffers); see `estimate_peak_memory`.
+        + `residual_balancing`: beta is increased (decreased) by `tau` if the
+          primal residual |z_kp1 - x_k| is more than `mu` times larger
+          (smaller) than the dual residual beta |z_kp1 - z_k| and u is
+          rescaled accordingly [1, 3.4.1].
+
+    None of the schemes adds denoiser calls. The Anderson history is not
+    checkpointed; a resumed run restarts it.
+
+    [1] https://stanford.edu/~boyd/papers/pdf/admm_distr_stats.pdf
+
+    Parameters
+    ----------
+    acceleration : str
+        One of `ACCELERATIONS`. Default is None.
+    eta : float
+        See None above. Default is 0.95.
+    gamma : float
+        See None above. Default is 1.05.
+    alpha : float
+        The relaxation parameter in (0, 2). Default is 1.6.
+    memory : int
+        The Anderson memory. Default is 5.
+    restart_factor : float
+        The Anderson restart threshold. Default is 1.
+    mu : float
+        The residual balancing threshold. Default is 10.
+    tau : float
+        The residual balancing factor. Default is 2.
+    """
+
+    def __init__(self,
+                 acceleration: str = None,
+                 eta: float = 0.95,
+                 gamma: float = 1.05,
+                 alpha: float = 1.6,
+                 memory: int = 5,
+                 restart_factor: float = 1.,
+                 mu: float = 10.,
+                 tau: float = 2.):
+        if acceleration not in ACCELERATIONS:
+            raise ValueError(f'acceleration must be one of {ACCELERATIONS}')
+        self.acceleration = acceleration
+        self.eta = eta
+        self.gamma = gamma
+        self.alpha = alpha
+        self.memory = memory
+        self.restart_factor = restart_factor
+        self.mu = mu
+        self.tau = tau
+        self.n_restarts = 0
+        self._g = None
+        self._reset_history()
+
+    def _reset_history(self):
+        self._n_history = 0
+        self._history_index = 0
+        self._has_prev = False
+        self._f_norm_prev = np.inf
+
+    def _allocate_buffers(self, size: int):
+        # (x, u) stacked; allocated once and reused across iterations
+        self._g, self._f, self._g_prev, self._f_prev = np.empty((4, size))
+        self._delta_f = np.empty((self.memory, size))
+        self._delta_g = np.empty((self.memory, size))
+
+    def relax(self,
+              x_k: np.ndarray,
+              z_k: np.ndarray,
+              u_k: np.ndarray,
+              denoiser_input: np.ndarray) -> tuple:
+        """
+        The (over-relaxed) x_k used by the z and u updates and the denoiser
+        input.
+
+        Returns
+        -------
+        tuple:
+            (x_relaxed, denoiser_input)
+        """
+        if self.acceleration != 'relaxation':
+            return x_k, denoiser_input
+        x_relaxed = self.alpha * x_k + (1 - self.alpha) * z_k
+        return x_relaxed, x_relaxed - u_k
+
+    def update(self,
+               x_k: np.ndarray,
+               z_k: np.ndarray,
+               u_k: np.ndarray,
+               x_kp1: np.ndarray,
+               z_kp1: np.ndarray,
+               u_kp1: np.ndarray,
+               denoiser_input: np.ndarray,
+               beta: float,
+               block_diff: float,
+               block_diff_old: float) -> tuple:
+        """
+        Update beta and (for `anderson` and `residual_balancing`) the ADMM
+        variables after `admm_likelihood_update`.
+
+        Returns
+        -------
+        tuple:
+            (x_kp1, u_kp1, denoiser_input, beta)
+        """
+        if self.acceleration == 'residual_balancing':
+            primal_residual = np.linalg.norm(u_kp1 - u_k)
+            dual_residual = beta * np.linalg.norm(z_kp1 - z_k)
+            if primal_residual > self.mu * dual_residual:
+                scale = self.tau
+            elif dual_residual > self.mu * primal_residual:
+                scale = 1 / self.tau
+            else:
+                scale = 1
+            if scale != 1:
+                beta = beta * scale
+                # the scaled dual variable is y / beta
+                u_kp1 = u_kp1 / scale
+                denoiser_input = x_kp1 - u_kp1
+            return x_kp1, u_kp1, denoiser_input, beta
+
+        beta_kp1 = beta
+        if block_diff > self.eta * block_diff_old:
+            beta_kp1 = self.gamma * beta
+        if self.acceleration == 'anderson':
+            x_kp1, u_kp1 = self._anderson_step(x_k, u_k, x_kp1, u_kp1)
+            denoiser_input = x_kp1 - u_kp1
+            if beta_kp1 != beta:
+                self._reset_history()
+        return x_kp1, u_kp1, denoiser_input, beta_kp1
+
+    def _anderson_step(self,
+                       x_k: np.ndarray,
+                       u_k: np.ndarray,
+                       x_kp1: np.ndarray,
+                       u_kp1: np.ndarray) -> tuple:
+        x_size = x_k.size
+        if self._g is None or self._g.size != x_size + u_k.size:
+            self._allocate_buffers(x_size + u_k.size)
+        g, f = self._g, self._f
+        g[:x_size] = x_kp1.ravel()
+        g[x_size:] = u_kp1.ravel()
+        np.subtract(g[:x_size], x_k.ravel(), out=f[:x_size])
+        np.subtract(g[x_size:], u_k.ravel(), out=f[x_size:])
+        f_norm = np.linalg.norm(f)
+
+        if f_norm > self.restart_factor * self._f_norm_prev:
+            self._reset_history()
+            self.n_restarts += 1
+        elif self._has_prev:
+            # the history is a ring buffer; the order of the differences
+            # does not matter for the least squares problem
+            index = self._history_index
+            np.subtract(f, self._f_prev, out=self._delta_f[index])
+            np.subtract(g, self._g_prev, out=self._delta_g[index])
+            self._history_index = (index + 1) % self.memory
+            self._n_history = min(self._n_history + 1, self.memory)
+        # swap rather than copy; the previous buffers are free until the
+        # next step
+        self._g, self._g_prev = self._g_prev, g
+        self._f, self._f_prev = self._f_prev, f
+        self._has_prev = True
+        self._f_norm_prev = f_norm
+        if self._n_history == 0:
+            return x_kp1, u_kp1
+
+        # min |f - delta_f.T @ weights| (regularized normal equations)
+        delta_f = self._delta_f[:self._n_history]
+        gram = delta_f @ delta_f.T
+        gram += 1e-10 * np.trace(gram) * np.eye(gram.shape[0])
+        weights = np.linalg.solve(gram, delta_f @ f)
+        s_kp1 = self._g
+        np.dot(weights, self._delta_g[:self._n_history], out=s_kp1)
+        np.subtract(g, s_kp1, out=s_kp1)
+
+        x_kp1 = s_kp1[:x_size].reshape(x_kp1.shape).astype(x_kp1.dtype)
+        u_kp1 = s_kp1[x_size:].reshape(u_kp1.shape).astype(u_kp1.dtype)
+        return x_kp1, u_kp1
+
+
+def get_denoiser_calls(block_diff_list: list, residual: float) -> int:
+    """
+    The number of denoiser calls of an ADMM run (one for the initialization
+    and one per iteration) until its residual is below `residual`; None if it
+    never is.
+    """
+    for k, block_diff in enumerate(block_diff_list):
+        if block_diff < residual:
+            return k + 2
+    return None
+
+
+def benchmark_admm_accelerations(denoise_func: Callable,
+                                 img: np.ndarray,
+                                 *args,
+                                 residual: float = 1e-2,
+                                 accelerations: list = None,
+                                 max_admm_iterations: int = 50,
+                                 **kwargs) -> dict:
+    """
+    Compare the acceleration schemes of `ADMMAccelerator` on an image by the
+    number of denoiser calls (the dominant cost) needed to reach a residual:
+
+        benchmark_admm_accelerations(admm_spatial_denoise,
+                                     img,
+                                     L,
+                                     'tv',
+                                     {'weight': 1},
+                                     residual=1e-2)
+
+    Parameters
+    ----------
+    denoise_func : Callable
+        `admm_spatial_denoise`, `admm_ratio_denoise` or `midal_denoise`.
+    img : np.ndarray
+        The image.
+    *args
+        The positional arguments of denoise_func after the image.
+    residual : float
+        The residual (block_diff) to reach. Default is 1e-2.
+    accelerations : list
+        The schemes to compare. Default is None, which uses all of
+        `ACCELERATIONS`.
+    max_admm_iterations : int
+        Default is 50.
+    **kwargs
+        Keyword arguments of denoise_func e.g. `acceleration_params`.
+
+    Returns
+    -------
+    dict:
+        Per scheme, `{'denoiser_calls': int or None, 'block_diff_list': list,
+        'final_block_diff': float}`.
+    """
+    accelerations = ACCELERATIONS if accelerations is None else accelerations
+    results = {}
+    for acceleration in accelerations:
+        _, block_diff_list = denoise_func(img,
+                                          *args,
+                                          max_admm_iterations=(
+                                              max_admm_iterations),
+                                          convergence_crit=residual,
+                                          acceleration=acceleration,
+                                          **kwargs)
+        results[acceleration] = {
+            'denoiser_calls': get_denoiser_calls(block_diff_list, residual),
+            'block_diff_list': block_diff_list,
+            'final_block_diff': block_diff_list[-1]}
+    return results
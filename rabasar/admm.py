@@ -0,0 +1,194 @@
+from skimage.restoration import denoise_tv_bregman
+from typing import Callable, Tuple
+import numpy as np
+from tqdm import tqdm
+import bm3d
+from .acceleration import ADMMAccelerator
+from .checkpoint import ADMMCheckpointer
+
+REGULARIZERS = ['tv', 'bm3d']
+
+
+def get_denoiser(regularizer: str,
+                 regularizer_params: dict,
+                 denoiser_iterations: int = 10) -> Tuple[Callable, float]:
+    """
+    The plug-and-play denoiser `denoiser(X, lamb)` of a regularizer and its
+    weight.
+
+    Parameters
+    ----------
+    regularizer : str
+        `tv` (split-Bregman) or `bm3d`.
+    regularizer_params : dict
+        `{'weight': float}` and, for `tv`, optionally `isotropic`.
+    denoiser_iterations : int
+        The number of iterations of `tv`. Default is 10.
+
+    Returns
+    -------
+    Tuple[Callable, float]:
+        (denoiser, weight)
+    """
+    if regularizer not in REGULARIZERS:
+        raise NotImplementedError('''Only bm3d and tv (using split-bregman)
+                                     is implemented''')
+    lamb_param = regularizer_params['weight']
+    if regularizer == 'tv':
+        isotropic = regularizer_params.get('isotropic', True)
+
+        def denoiser(X, lamb):
+            # the number of iterations is passed positionally since the
+            # keyword was renamed (max_iter -> max_num_iter) in skimage 0.19
+            return denoise_tv_bregman(X,
+                                      lamb,
+                                      denoiser_iterations,
+                                      isotropic=isotropic)
+    else:
+        def denoiser(X, lamb):
+            return bm3d.bm3d(X, lamb)
+    return denoiser, lamb_param
+
+
+def run_admm(img_db: np.ndarray,
+             likelihood_update: Callable,
+             denoiser: Callable,
+             lamb_param: float,
+             beta: float,
+             max_admm_iterations: int = 10,
+             convergence_crit: float = 1e-5,
+             x_init: np.ndarray = None,
+             checkpoint_path: str = None,
+             checkpoint_every: int = 1,
+             checkpoint_interval: float = None,
+             run_params: dict = None,
+             acceleration: str = None,
+             acceleration_params: dict = None) -> Tuple[np.ndarray, list]:
+    """
+    The plug-and-play ADMM loop shared by `admm_spatial_denoise`,
+    `admm_ratio_denoise` and `midal_denoise`, which only differ in the
+    likelihood, the initial beta and their parameters. Each iteration is
+
+        z_kp1 = denoiser(x_k - u_k, lamb_param * beta)
+        x_kp1, u_kp1, denoiser_input, block_diff = likelihood_update(...)
+
+    followed by the beta update and the acceleration (see `ADMMAccelerator`),
+    until `block_diff < convergence_crit` or `max_admm_iterations`.
+
+    If `checkpoint_path` is specified, the state is saved with
+    `ADMMCheckpointer` on its schedule and always after the last iteration
+    (converged or not), and a run with the same image and `run_params` is
+    resumed from it.
+
+    Parameters
+    ----------
+    img_db : np.ndarray
+        The log10 image.
+    likelihood_update : Callable
+        `likelihood_update(x_k, u_k, z_kp1, z_k, beta, x_relaxed)` returning
+        `(x_kp1, u_kp1, denoiser_input, block_diff)` e.g.
+        `admm_likelihood_update` with the image and ENL(s) bound.
+    denoiser : Callable
+        `denoiser(X, lamb)`; see `get_denoiser`.
+    lamb_param : float
+        The weight of the regularizer.
+    beta : float
+        The initial ADMM penalty.
+    max_admm_iterations : int
+        Default is 10.
+    convergence_crit : float
+        Default is 1e-5.
+    x_init : np.ndarray
+        The initial x_k (log10 scale). Default is None, which uses img_db.
+    checkpoint_path : str
+        See `ADMMCheckpointer`. Default is None, which does not checkpoint.
+    checkpoint_every : int
+        See `ADMMCheckpointer`. Default is 1.
+    checkpoint_interval : float
+        See `ADMMCheckpointer`. Default is None.
+    run_params : dict
+        The parameters identifying the run in the checkpoint fingerprint.
+    acceleration : str
+        See `ADMMAccelerator`. Default is None.
+    acceleration_params : dict
+        Keyword arguments of `ADMMAccelerator`. Default is None.
+
+    Returns
+    -------
+    Tuple[np.ndarray, list]:
+        (x_k, block_diff_list)
+    """
+    # Parameters
+    # Selected as in
+    # https://bitbucket.org/charles_deledalle/mulog/src/8a1172795c1ed598e4c7d1fe989876774fbded64/mulog/admm.m#lines-127:129
+    # They reference the Plug-and-Play paper by Chan et al.
+    accelerator = ADMMAccelerator(acceleration,
+                                  eta=0.95,
+                                  gamma=1.05,
+                                  **(acceleration_params or {}))
+
+    block_diff_old = np.inf
+    block_diff_list = []
+
+    checkpointer = None
+    state = None
+    if checkpoint_path is not None:
+        checkpointer = ADMMCheckpointer(
+                                    checkpoint_path,
+                                    img_db,
+                                    run_params or {},
+                                    checkpoint_every=checkpoint_every,
+                                    checkpoint_interval=checkpoint_interval)
+        state = checkpointer.load()
+
+    if state is None:
+        if x_init is None:
+            x_k = img_db.copy()
+        else:
+            x_k = x_init.copy()
+        z_k = denoiser(x_k, lamb_param)
+        u_k = z_k - x_k
+        start_iteration = 0
+        converged = False
+    else:
+        x_k, z_k, u_k = state['x_k'], state['z_k'], state['u_k']
+        beta = state['beta']
+        block_diff_old = state['block_diff_old']
+        block_diff_list = state['block_diff_list']
+        start_iteration = state['iteration']
+        converged = state['converged']
+
+    admm_iterations = range(start_iteration,
+                            max_admm_iterations if not converged
+                            else start_iteration)
+    denoiser_input = x_k - u_k
+    for k in tqdm(admm_iterations, desc='admm_iterations'):
+
+        # the over-relaxed x_k (if enabled) for the z and u updates
+        x_relaxed, denoiser_input = accelerator.relax(x_k, z_k, u_k,
+                                                      denoiser_input)
+        z_kp1 = denoiser(denoiser_input, (lamb_param * beta))
+        # the u and x updates, the next denoiser input and the residuals
+        # in one pass
+        x_kp1, u_kp1, denoiser_input, block_diff = \
+            likelihood_update(x_k, u_k, z_kp1, z_k, beta, x_relaxed)
+        # the beta update and acceleration
+        x_kp1, u_kp1, denoiser_input, beta = \
+            accelerator.update(x_k, z_k, u_k, x_kp1, z_kp1, u_kp1,
+                               denoiser_input, beta, block_diff,
+                               block_diff_old)
+        z_k = z_kp1
+        u_k = u_kp1
+        x_k = x_kp1
+        block_diff_old = block_diff
+        block_diff_list.append(block_diff)
+        converged = block_diff < convergence_crit
+        if checkpointer is not None:
+            # the last iteration is saved even if it is off the schedule
+            checkpointer.save(k + 1, x_k, z_k, u_k, beta, block_diff_old,
+                              block_diff_list, converged=converged,
+                              force=(k + 1 == max_admm_iterations))
+        if converged:
+            break
+
+    return x_k, block_diff_list
@@ -0,0 +1,344 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+import datetime
+import json
+import os
+import re
+import sqlite3
+import warnings
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+from .ingest import get_alos1_date_from_xml, get_file_checksum
+
+_COLUMNS = ['path',
+            'sensor',
+            'site',
+            'date',
+            'year',
+            'month',
+            'polarization',
+            'crs',
+            'transform',
+            'width',
+            'height',
+            'west',
+            'south',
+            'east',
+            'north',
+            'checksum',
+            'size',
+            'mtime']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    path TEXT PRIMARY KEY,
+    sensor TEXT,
+    site TEXT,
+    date TEXT,
+    year INTEGER,
+    month INTEGER,
+    polarization TEXT,
+    crs TEXT,
+    transform TEXT,
+    width INTEGER,
+    height INTEGER,
+    west REAL,
+    south REAL,
+    east REAL,
+    north REAL,
+    checksum TEXT,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS scenes_stack
+    ON scenes (sensor, site, polarization, date);
+CREATE INDEX IF NOT EXISTS scenes_month ON scenes (month);
+CREATE INDEX IF NOT EXISTS scenes_bounds ON scenes (west, east, south, north);
+"""
+
+
+def get_date_from_path(path: str) -> datetime.date:
+    """
+    The acquisition date of a scene from its name or metadata:
+
+    1. `..._RTC_<yyyymmdd>.tif` as written by the reprojection notebook and
+       `ingest_alos1_zip`,
+    2. UAVSAR names e.g. `gulfco_27802_19070_010_190930_L090HHHH_...` or
+    3. the `*iso.xml` metadata in the same directory (ALOS-1 RTC).
+    """
+    path = Path(path)
+    match = re.search(r'_RTC_(\d{4})(\d{2})(\d{2})', path.name)
+    if match:
+        return datetime.date(*map(int, match.groups()))
+    match = re.search(r'_(\d{2})(\d{2})(\d{2})_L\d{3}', path.name)
+    if match:
+        year, month, day = map(int, match.groups())
+        return datetime.date(2000 + year, month, day)
+    xml_paths = sorted(path.parent.glob('*iso.xml'))
+    if xml_paths:
+        return get_alos1_date_from_xml(xml_paths[0].read_bytes())
+    raise ValueError(f'Could not determine the date of {path}')
+
+
+def get_polarization_from_path(path: str) -> str:
+    """
+    The polarization (e.g. `HV`) from the file name; UAVSAR names such as
+    `HVHV` are also recognized.
+    """
+    match = re.search(r'(?<![A-Za-z])(HH|HV|VH|VV)(?:\1)?(?![A-Za-z])',
+                      Path(path).name,
+                      flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'Could not determine the polarization of {path}')
+    return match.group(1).upper()
+
+
+class SceneCatalog(object):
+    """
+    A persistent SQLite catalog of scenes (path, sensor, site, date,
+    polarization, CRS, transform, footprint, checksum) so that stacks can be
+    assembled and filtered without globbing directories or opening rasters:
+
+        catalog = SceneCatalog('scenes.db')
+        catalog.add_scenes(tif_paths, 'uavsar', 'waxlake')
+        paths = catalog.get_paths(polarization='HV',
+                                  months=range(5, 10),
+                                  bbox=(-91.5, 29.4, -91.3, 29.6))
+
+    Filling is incremental: a scene is only read again if its size or
+    modification time changed. Footprints are stored as bounds in EPSG:4326
+    so that scenes in different CRSs can be queried together.
+
+    Parameters
+    ----------
+    db_path : str
+        The database file; created if it does not exist.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'SceneCatalog':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM scenes') \
+                              .fetchone()[0]
+
+    def _is_up_to_date(self, path: str) -> bool:
+        row = self.connection.execute('SELECT size, mtime FROM scenes '
+                                      'WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(path)
+        return (row['size'] == stat.st_size) and (row['mtime'] ==
+                                                  stat.st_mtime)
+
+    def add_scenes(self,
+                   paths: list,
+                   sensor: str,
+                   site: str,
+                   date_func: Callable = get_date_from_path,
+                   polarization_func: Callable = get_polarization_from_path,
+                   checksum: bool = False,
+                   n_workers: int = 4) -> int:
+        """
+        Add (or update) scenes; unchanged scenes already in the catalog are
+        skipped. The profiles (and optionally checksums) are read with
+        `n_workers` threads. Paths that do not exist are skipped with a
+        warning (see `remove_missing` for the scenes already catalogued).
+
+        Parameters
+        ----------
+        paths : list
+            The raster paths.
+        sensor : str
+            e.g. `uavsar` or `alos1`.
+        site : str
+            e.g. `waxlake`.
+        date_func : Callable
+            Path -> datetime.date. Default is `get_date_from_path`.
+        polarization_func : Callable
+            Path -> polarization. Default is `get_polarization_from_path`.
+        checksum : bool
+            Whether to record the md5 of each file. Default is False.
+        n_workers : int
+            The number of threads. Default is 4.
+
+        Returns
+        -------
+        int:
+            The number of scenes added or updated.
+        """
+        paths = [str(Path(path).resolve()) for path in paths]
+        missing_paths = [path for path in paths if not os.path.exists(path)]
+        if missing_paths:
+            warnings.warn(f'Skipping {len(missing_paths)} missing scene(s): '
+                          f'{", ".join(missing_paths)}')
+            missing_paths = set(missing_paths)
+            paths = [path for path in paths if path not in missing_paths]
+        new_paths = [path for path in paths if not self._is_up_to_date(path)]
+
+        def read_record(path):
+            return _get_scene_record(path,
+                                     sensor,
+                                     site,
+                                     date_func,
+                                     polarization_func,
+                                     checksum)
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            records = list(executor.map(read_record, new_paths))
+
+        placeholders = ', '.join('?' * len(_COLUMNS))
+        with self.connection:
+            self.connection.executemany(f'INSERT OR REPLACE INTO scenes '
+                                        f'({", ".join(_COLUMNS)}) '
+                                        f'VALUES ({placeholders})',
+                                        [[record[column]
+                                          for column in _COLUMNS]
+                                         for record in records])
+        return len(records)
+
+    def remove_missing(self) -> int:
+        """
+        Remove the scenes whose files no longer exist. Returns the number
+        removed.
+        """
+        paths = [row['path'] for row in
+                 self.connection.execute('SELECT path FROM scenes')]
+        missing = [(path,) for path in paths if not os.path.exists(path)]
+        with self.connection:
+            self.connection.executemany('DELETE FROM scenes WHERE path = ?',
+                                        missing)
+        return len(missing)
+
+    def query(self,
+              sensor: str = None,
+              site: str = None,
+              polarization: str = None,
+              months: list = None,
+              start_date: datetime.date = None,
+              end_date: datetime.date = None,
+              bbox: tuple = None,
+              bbox_crs: str = 'EPSG:4326') -> list:
+        """
+        The scenes matching all of the specified filters ordered by date.
+
+        Parameters
+        ----------
+        sensor : str
+        site : str
+        polarization : str
+            e.g. `HV`.
+        months : list
+            The months (1 - 12) to keep e.g. `range(5, 10)`.
+        start_date : datetime.date
+            Inclusive.
+        end_date : datetime.date
+            Inclusive.
+        bbox : tuple
+            (west, south, east, north); scenes whose footprint intersects it
+            are kept.
+        bbox_crs : str
+            The CRS of the bbox. Default is `EPSG:4326`.
+
+        Returns
+        -------
+        list:
+            A dictionary per scene with the catalog columns; `date` is a
+            datetime.date, `transform` an Affine and `crs` a CRS.
+        """
+        conditions, params = [], []
+        for column, value in [('sensor', sensor),
+                              ('site', site),
+                              ('polarization', polarization)]:
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value.upper() if column == 'polarization'
+                              else value)
+        if months is not None:
+            months = list(months)
+            conditions.append(f'month IN ({", ".join("?" * len(months))})')
+            params.extend(months)
+        if start_date is not None:
+            conditions.append('date >= ?')
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            conditions.append('date <= ?')
+            params.append(end_date.isoformat())
+        if bbox is not None:
+            if bbox_crs != 'EPSG:4326':
+                bbox = transform_bounds(bbox_crs, 'EPSG:4326', *bbox)
+            west, south, east, north = bbox
+            conditions.append('west <= ? AND east >= ? AND '
+                              'south <= ? AND north >= ?')
+            params.extend([east, west, north, south])
+
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self.connection.execute(f'SELECT * FROM scenes {where} '
+                                       'ORDER BY date, path', params)
+        return [_row_to_scene(row) for row in rows]
+
+    def get_paths(self, **query_kwargs) -> list:
+        """
+        The paths of the scenes of `query(**query_kwargs)` ordered by date.
+        """
+        return [scene['path'] for scene in self.query(**query_kwargs)]
+
+
+def _get_scene_record(path: str,
+                      sensor: str,
+                      site: str,
+                      date_func: Callable,
+                      polarization_func: Callable,
+                      checksum: bool) -> dict:
+    with rasterio.open(path) as ds:
+        crs, transform = ds.crs, ds.transform
+        width, height = ds.width, ds.height
+        bounds = ds.bounds
+    if crs is not None:
+        west, south, east, north = transform_bounds(crs, 'EPSG:4326', *bounds)
+    else:
+        west, south, east, north = bounds.left, bounds.bottom, \
+                                   bounds.right, bounds.top
+    date = date_func(path)
+    stat = os.stat(path)
+    return {'path': path,
+            'sensor': sensor,
+            'site': site,
+            'date': date.isoformat(),
+            'year': date.year,
+            'month': date.month,
+            'polarization': polarization_func(path),
+            'crs': crs.to_string() if crs is not None else None,
+            'transform': json.dumps(list(transform)[:6]),
+            'width': width,
+            'height': height,
+            'west': west,
+            'south': south,
+            'east': east,
+            'north': north,
+            'checksum': get_file_checksum(path) if checksum else None,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime}
+
+
+def _row_to_scene(row: sqlite3.Row) -> dict:
+    scene = dict(row)
+    scene['date'] = datetime.date.fromisoformat(scene['date'])
+    scene['transform'] = rasterio.Affine(*json.loads(scene['transform']))
+    if scene['crs'] is not None:
+        scene['crs'] = CRS.from_string(scene['crs'])
+    return scene
@@ -0,0 +1,151 @@
+from pathlib import Path
+import json
+import os
+import shutil
+import time
+import zlib
+import numpy as np
+
+
+class ADMMCheckpointer(object):
+    """
+    Saves and restores the state of the plug-and-play ADMM loops
+    (x_k, z_k, u_k, beta, iteration and residual history) so that a killed
+    run can be resumed exactly, e.g. on a different node.
+
+    The checkpoint is a directory with the arrays saved as memory-mapped
+    `.npy` files (in their original dtype) in `iteration_<iteration>/` and
+    the scalars in `meta.json`. The metadata is replaced atomically after the
+    arrays are flushed, so a crash while checkpointing leaves the previous
+    checkpoint intact.
+
+    A checkpoint is only resumed if it was made with the same image and
+    parameters (recorded as a fingerprint); otherwise a ValueError is raised.
+
+    Parameters
+    ----------
+    checkpoint_path : str
+        The checkpoint directory.
+    img : np.ndarray
+        The (log) image being denoised; used for the fingerprint.
+    params : dict
+        The parameters of the run (ENL, regularizer, etc.); used for the
+        fingerprint. Must be json serializable.
+    checkpoint_every : int
+        Save every `checkpoint_every` ADMM iterations. Default is 1.
+    checkpoint_interval : float
+        If specified, a save on the `checkpoint_every` schedule is skipped
+        unless at least `checkpoint_interval` seconds have passed since the
+        last save, i.e. both conditions must hold; with `checkpoint_every=1`
+        the state is saved purely by time. Saves with `force` or `converged`
+        (e.g. after the last iteration, see `run_admm`) ignore both.
+    """
+
+    def __init__(self,
+                 checkpoint_path: str,
+                 img: np.ndarray,
+                 params: dict,
+                 checkpoint_every: int = 1,
+                 checkpoint_interval: float = None):
+        self.checkpoint_path = Path(checkpoint_path)
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.fingerprint = _get_fingerprint(img, params)
+        self._last_save_time = time.monotonic()
+
+    def load(self) -> dict:
+        """
+        Returns
+        -------
+        dict:
+            The saved state with keys x_k, z_k, u_k, beta, iteration,
+            block_diff_old, block_diff_list and converged or None if there is
+            no checkpoint.
+        """
+        meta_path = self.checkpoint_path / 'meta.json'
+        if not meta_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text())
+        if meta['fingerprint'] != self.fingerprint:
+            raise ValueError(f'The checkpoint in {self.checkpoint_path} was '
+                             'made with a different image or parameters')
+
+        state_dir = self.checkpoint_path / meta['state_dir']
+        state = {key: np.array(np.load(state_dir / f'{key}.npy',
+                                       mmap_mode='r'))
+                 for key in ['x_k', 'z_k', 'u_k']}
+        # the scalars are numpy floats in the ADMM loops
+        state.update({'beta': np.float64(meta['beta']),
+                      'iteration': meta['iteration'],
+                      'block_diff_old': np.float64(meta['block_diff_old']),
+                      'block_diff_list': meta['block_diff_list'],
+                      'converged': meta['converged']})
+        return state
+
+    def save(self,
+             iteration: int,
+             x_k: np.ndarray,
+             z_k: np.ndarray,
+             u_k: np.ndarray,
+             beta: float,
+             block_diff_old: float,
+             block_diff_list: list,
+             converged: bool = False,
+             force: bool = False):
+        """
+        Save the state after `iteration` ADMM iterations have completed if
+        the checkpoint schedule (or `force`) requires it.
+        """
+        due = (iteration % self.checkpoint_every == 0)
+        if self.checkpoint_interval is not None:
+            elapsed = time.monotonic() - self._last_save_time
+            due = due and (elapsed >= self.checkpoint_interval)
+        if not (due or force or converged):
+            return
+
+        self.checkpoint_path.mkdir(exist_ok=True, parents=True)
+        meta_path = self.checkpoint_path / 'meta.json'
+        old_state_dir = None
+        if meta_path.exists():
+            old_state_dir = json.loads(meta_path.read_text())['state_dir']
+
+        state_dir = f'iteration_{iteration}'
+        if state_dir == old_state_dir:
+            # the same iteration is already saved
+            return
+        (self.checkpoint_path / state_dir).mkdir(exist_ok=True)
+        for key, arr in zip(['x_k', 'z_k', 'u_k'], [x_k, z_k, u_k]):
+            path = self.checkpoint_path / state_dir / f'{key}.npy'
+            state_arr = np.lib.format.open_memmap(str(path),
+                                                  mode='w+',
+                                                  dtype=arr.dtype,
+                                                  shape=arr.shape)
+            state_arr[:] = arr
+            state_arr.flush()
+            del state_arr
+
+        meta = {'fingerprint': self.fingerprint,
+                'state_dir': state_dir,
+                'iteration': iteration,
+                'beta': float(beta),
+                'block_diff_old': float(block_diff_old),
+                'block_diff_list': [float(b) for b in block_diff_list],
+                'converged': bool(converged)}
+        tmp_meta_path = self.checkpoint_path / 'meta.json.tmp'
+        tmp_meta_path.write_text(json.dumps(meta))
+        os.replace(tmp_meta_path, meta_path)
+
+        if old_state_dir is not None:
+            shutil.rmtree(self.checkpoint_path / old_state_dir)
+        self._last_save_time = time.monotonic()
+
+
+def _get_fingerprint(img: np.ndarray, params: dict) -> str:
+    img = np.ascontiguousarray(img)
+    crc = zlib.crc32(memoryview(img).cast('B'))
+    return json.dumps({'shape': list(img.shape),
+                       'dtype': str(img.dtype),
+                       'crc32': crc,
+                       'params': params},
+                      sort_keys=True,
+                      default=str)
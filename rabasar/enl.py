@@ -1,8 +1,11 @@
 from astropy.convolution import convolve
 import numpy as np
+import scipy.ndimage
 import scipy.stats
+from .profiling import profile_stage
 
 
+@profile_stage('get_enl_img')
 def get_enl_img(img: np.ndarray,
                 window_size: int,
                 enl_max: int = 20,
@@ -65,6 +68,12 @@ def get_enl_img(img: np.ndarray,
                             boundary='extend',
                             nan_treatment='interpolate',
                             preserve_nan=True)
+    return _get_enl_from_moments(img_mean, img_sqr_mean, enl_max)
+
+
+def _get_enl_from_moments(img_mean: np.ndarray,
+                          img_sqr_mean: np.ndarray,
+                          enl_max: int) -> np.ndarray:
     img_variance = img_sqr_mean - img_mean**2
 
     enl_img = img_mean**2 / np.clip(img_variance, .0001, 1./enl_max)
@@ -73,6 +82,121 @@ def get_enl_img(img: np.ndarray,
     return enl_img
 
 
+def _get_integral_image(arr: np.ndarray) -> np.ndarray:
+    # zero first row and column so that window sums are 4 lookups
+    integral = np.zeros((arr.shape[0] + 1, arr.shape[1] + 1),
+                        dtype=np.float64)
+    np.cumsum(arr, axis=0, dtype=np.float64, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return integral
+
+
+def _get_window_sums(integral: np.ndarray,
+                     pad: int,
+                     window_size: int,
+                     shape: tuple) -> np.ndarray:
+    radius = window_size // 2
+    height, width = shape
+    lo = pad - radius
+    hi = pad + radius + 1
+    return (integral[hi: hi + height, hi: hi + width] -
+            integral[lo: lo + height, hi: hi + width] -
+            integral[hi: hi + height, lo: lo + width] +
+            integral[lo: lo + height, lo: lo + width])
+
+
+@profile_stage('get_enl_imgs')
+def get_enl_imgs(img: np.ndarray,
+                 window_sizes: list,
+                 enl_max: int = 20,
+                 mask: np.ndarray = None) -> dict:
+    """
+    The ENL images of `get_enl_img` for several window sizes (e.g.
+    `[7, 15, 31, 63]`) from one set of integral (cumulative sum) images of the
+    valid pixels, their squares and their count. Each window sum is then four
+    lookups per pixel regardless of the window size, so all the windows cost
+    about as much as one window with `get_enl_img` (whose direct convolutions
+    scale with the window area). nodata is treated as in `get_enl_img`:
+    window means are over the valid pixels, the edges are extended and
+    np.nan is preserved.
+
+    The integral images are float64 and the size of the image padded by half
+    the largest window.
+
+    Parameters
+    ----------
+    img : np.ndarray
+        The backscatter image with np.nan as nodata.
+    window_sizes : list
+        The odd window sizes.
+    enl_max : int
+        See `get_enl_img`. Default is 20.
+    mask : np.ndarray
+        The mask to ignore with True indicating areas to ignore.
+
+    Returns
+    -------
+    dict:
+        window size -> ENL per-pixel image
+    """
+    if any(window_size % 2 == 0 for window_size in window_sizes):
+        raise ValueError('The window sizes must be odd')
+    nodata_mask = np.isnan(img)
+    if mask is not None:
+        nodata_mask = nodata_mask | mask
+
+    pad = max(window_sizes) // 2
+    nodata_padded = np.pad(nodata_mask, pad, mode='edge')
+    img_padded = np.pad(np.where(nodata_mask, 0, img), pad, mode='edge')
+    integral_count = _get_integral_image(~nodata_padded)
+    integral_sum = _get_integral_image(img_padded)
+    integral_sqr_sum = _get_integral_image(img_padded.astype(np.float64)**2)
+    del img_padded, nodata_padded
+
+    enl_imgs = {}
+    for window_size in window_sizes:
+        window_sums = [_get_window_sums(integral,
+                                        pad,
+                                        window_size,
+                                        img.shape)
+                       for integral in [integral_count,
+                                        integral_sum,
+                                        integral_sqr_sum]]
+        count, img_sum, img_sqr_sum = window_sums
+        # windows with no valid pixels are np.nan (and the center is nodata)
+        count[nodata_mask] = np.nan
+        img_mean = img_sum / count
+        img_sqr_mean = img_sqr_sum / count
+        enl_imgs[window_size] = _get_enl_from_moments(img_mean,
+                                                      img_sqr_mean,
+                                                      enl_max)
+    return enl_imgs
+
+
+@profile_stage('get_enl_modes')
+def get_enl_modes(img: np.ndarray,
+                  window_sizes: list,
+                  enl_min: int = 1,
+                  enl_max: int = 20,
+                  mask: np.ndarray = None) -> dict:
+    """
+    The ENL modes (see `get_enl_mode`) of the ENL images of `get_enl_imgs`
+    e.g. to choose the window size or check that the ENL is stable across
+    window sizes.
+
+    Returns
+    -------
+    dict:
+        window size -> ENL mode
+    """
+    enl_imgs = get_enl_imgs(img, window_sizes, enl_max=enl_max, mask=mask)
+    return {window_size: get_enl_mode(enl_img,
+                                      enl_min=enl_min,
+                                      enl_max=enl_max)
+            for window_size, enl_img in enl_imgs.items()}
+
+
+@profile_stage('get_enl_mode')
 def get_enl_mode(enl_img: np.ndarray,
                  enl_min: int = 1,
                  enl_max: int = 20) -> float:
@@ -99,11 +223,7 @@ def get_enl_mode(enl_img: np.ndarray,
         raise ValueError('enl_min must be > 1')
 
     data_ = enl_img[~np.isnan(enl_img)]
-
-    int_max = int(np.ceil(data_.max()))
-    data_max = min(int_max, enl_max)
-    n_bins = (data_max - enl_min) * 10 + 1
-    bins = np.linspace(enl_min, data_max, n_bins)
+    bins = _get_enl_bins(data_, enl_min, enl_max)
 
     result = scipy.stats.binned_statistic(data_,
                                           data_,
@@ -113,6 +233,14 @@ def get_enl_mode(enl_img: np.ndarray,
     return bins[np.argmax(counts)]
 
 
+def _get_enl_bins(data: np.ndarray, enl_min: int, enl_max: int) -> np.ndarray:
+    int_max = int(np.ceil(data.max()))
+    data_max = min(int_max, enl_max)
+    n_bins = (data_max - enl_min) * 10 + 1
+    return np.linspace(enl_min, data_max, n_bins)
+
+
+@profile_stage('get_enl_mask')
 def get_enl_mask(img: np.ndarray,
                  db_min: float = -18,
                  additional_mask: np.ndarray = None) -> np.ndarray:
@@ -145,3 +273,178 @@ def get_enl_mask(img: np.ndarray,
     if additional_mask is not None:
         enl_mask = enl_mask | additional_mask
     return enl_mask
+
+
+def _sample_window_centers(shape: tuple,
+                           radius: int,
+                           n_windows: int,
+                           stratified: bool,
+                           rng: np.random.Generator) -> tuple:
+    # centers are at least `radius` from the edges so windows need no padding
+    n_rows, n_cols = shape[0] - 2 * radius, shape[1] - 2 * radius
+    if not stratified:
+        return (rng.integers(0, n_rows, n_windows) + radius,
+                rng.integers(0, n_cols, n_windows) + radius)
+    # one center per cell of a grid of ~n_windows cells
+    n_cells_y = min(n_rows, max(1, int(round(np.sqrt(n_windows *
+                                                     n_rows / n_cols)))))
+    n_cells_x = min(n_cols, max(1, int(round(n_windows / n_cells_y))))
+    edges_y = np.linspace(0, n_rows, n_cells_y + 1)
+    edges_x = np.linspace(0, n_cols, n_cells_x + 1)
+    cell_y, cell_x = [index.ravel() for index in
+                      np.indices((n_cells_y, n_cells_x))]
+    rows = edges_y[cell_y] + rng.random(cell_y.size) * np.diff(edges_y)[cell_y]
+    cols = edges_x[cell_x] + rng.random(cell_x.size) * np.diff(edges_x)[cell_x]
+    return (rows.astype(int) + radius, cols.astype(int) + radius)
+
+
+@profile_stage('get_enl_sampled')
+def get_enl_sampled(img: np.ndarray,
+                    window_size: int = 31,
+                    n_windows: int = 5000,
+                    enl_min: int = 1,
+                    enl_max: int = 20,
+                    mask: np.ndarray = None,
+                    db_min: float = None,
+                    stratified: bool = True,
+                    smoothing: float = 2.,
+                    n_bootstrap: int = 1000,
+                    confidence: float = .95,
+                    max_rounds: int = 10,
+                    random_state: int = None) -> dict:
+    """
+    Estimate the ENL mode of a (large) scene from a sample of windows instead
+    of `get_enl_mode(get_enl_img(img, window_size, mask=mask))` over the full
+    image. Window centers are drawn at random (one per cell of a grid if
+    `stratified`) among the valid pixels and E^2 / V is computed from the
+    valid pixels of those windows only. The cost depends on `n_windows`, not
+    on the image size.
+
+    The centers are kept at least `window_size // 2` pixels from the edges so
+    that every window lies within the image. Hence, the pixels near the edges
+    are never sampled and the edge-extended values of `get_enl_img` there are
+    not reproduced; each sample equals `get_enl_img` (with the same mask) at
+    its center up to floating point rounding and the estimate is of the mode
+    over the interior of the image.
+
+    The mode is the peak of the histogram of the samples in the .1 bins of
+    `get_enl_mode`, smoothed by a Gaussian of `smoothing` bins since there are
+    far fewer samples than pixels. The confidence interval is from
+    bootstrapping the samples (resampling the histogram counts).
+
+    Parameters
+    ----------
+    img : np.ndarray
+        The linear-scale backscatter image with np.nan as nodata.
+    window_size : int
+        The `n x n` window. Must be odd. Default is 31.
+    n_windows : int
+        The number of windows. Default is 5000.
+    enl_min : int
+        See `get_enl_mode`. Default is 1.
+    enl_max : int
+        See `get_enl_img`. Default is 20.
+    mask : np.ndarray
+        The mask with True indicating areas to ignore e.g. from
+        `get_enl_mask`. Default is None.
+    db_min : float
+        If specified, pixels below db_min are also ignored as in
+        `get_enl_mask` (applied to the sampled windows only, which is much
+        cheaper than masking the scene). Default is None.
+    stratified : bool
+        Whether to draw one window per cell of a grid (rather than uniformly)
+        to cover the scene evenly. Default is True.
+    smoothing : float
+        The standard deviation in bins of the Gaussian smoothing the
+        histogram; 0 uses the raw histogram. Default is 2.
+    n_bootstrap : int
+        The number of bootstrap resamples. Default is 1000.
+    confidence : float
+        The confidence level of the interval. Default is .95.
+    max_rounds : int
+        The maximum number of rounds of drawing centers to replace those that
+        are nodata or masked. Default is 10.
+    random_state : int
+        The seed. Default is None.
+
+    Returns
+    -------
+    dict:
+        `enl` (the mode), `confidence_interval` (low, high), `std_error` (of
+        the bootstrapped modes), `n_windows` (the number sampled) and
+        `enl_samples`.
+    """
+    if enl_min < 1:
+        raise ValueError('enl_min must be > 1')
+    if window_size % 2 == 0:
+        raise ValueError('window_size must be odd')
+    radius = window_size // 2
+    if min(img.shape) < window_size:
+        raise ValueError('The image is smaller than the window')
+    rng = np.random.default_rng(random_state)
+
+    def is_valid(values, mask_values):
+        valid = ~np.isnan(values)
+        if mask_values is not None:
+            valid &= ~mask_values
+        if db_min is not None:
+            valid &= (values >= 10 ** (db_min / 10))
+        return valid
+
+    rows, cols = [], []
+    n_sampled = 0
+    for _ in range(max_rounds):
+        rows_, cols_ = _sample_window_centers(img.shape,
+                                              radius,
+                                              n_windows,
+                                              stratified,
+                                              rng)
+        valid = is_valid(img[rows_, cols_],
+                         mask[rows_, cols_] if mask is not None else None)
+        rows.append(rows_[valid])
+        cols.append(cols_[valid])
+        n_sampled += valid.sum()
+        if n_sampled >= n_windows:
+            break
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    if rows.size == 0:
+        raise ValueError('No valid windows were found')
+    if rows.size > n_windows:
+        keep = rng.choice(rows.size, n_windows, replace=False)
+        rows, cols = rows[keep], cols[keep]
+
+    # (n_windows, window_size, window_size) patches
+    offsets = np.arange(-radius, radius + 1)
+    patch_rows = rows[:, np.newaxis, np.newaxis] + offsets[:, np.newaxis]
+    patch_cols = cols[:, np.newaxis, np.newaxis] + offsets
+    patches = np.asarray(img[patch_rows, patch_cols], dtype=np.float64)
+    valid = is_valid(patches,
+                     mask[patch_rows, patch_cols] if mask is not None
+                     else None)
+    patches[~valid] = np.nan
+    patch_mean = np.nanmean(patches, axis=(1, 2))
+    patch_sqr_mean = np.nanmean(patches ** 2, axis=(1, 2))
+    enl_samples = _get_enl_from_moments(patch_mean, patch_sqr_mean, enl_max)
+
+    bins = _get_enl_bins(enl_samples, enl_min, enl_max)
+    counts, _ = np.histogram(enl_samples, bins=bins)
+    n_counted = counts.sum()
+    if n_counted == 0:
+        raise ValueError('All ENL samples are outside [enl_min, enl_max]')
+    bootstrap_counts = rng.multinomial(n_counted,
+                                       counts / n_counted,
+                                       size=n_bootstrap)
+    counts = np.vstack([counts, bootstrap_counts]).astype(np.float64)
+    if smoothing > 0:
+        counts = scipy.ndimage.gaussian_filter1d(counts,
+                                                 smoothing,
+                                                 axis=1,
+                                                 mode='nearest')
+    modes = bins[np.argmax(counts, axis=1)]
+    alpha = (1 - confidence) / 2
+    return {'enl': modes[0],
+            'confidence_interval': tuple(np.quantile(modes[1:],
+                                                     [alpha, 1 - alpha])),
+            'std_error': modes[1:].std(),
+            'n_windows': enl_samples.size,
+            'enl_samples': enl_samples}
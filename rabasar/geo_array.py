@@ -0,0 +1,208 @@
+import numpy as np
+import rasterio
+from typing import Union
+from .rio_tools import (get_cropped_profile,
+                        get_window_from_slices,
+                        reproject_arr_to_match_profile,
+                        reproject_arr_to_new_crs)
+from .profiling import profile_stage
+from .quantize import (get_decoded_profile,
+                       read_dataset,
+                       write_quantized)
+
+
+class GeoArray(object):
+    """
+    A lightweight pairing of an array with its rasterio profile. The array is
+    either `(height, width)` or `(bands, height, width)`.
+
+    Slicing returns a GeoArray whose array is a numpy view (no pixel data is
+    copied) and whose profile is the matching cropped profile (see
+    `get_cropped_profile`) e.g.
+
+        geo_arr = GeoArray.from_file(path)
+        geo_arr_crop = geo_arr[500:1400, 2430:3530]
+
+    The spatial (last two) indices must be slices with step 1. A GeoArray can
+    be passed directly to numpy functions and to the denoisers, since it
+    exposes `__array__`.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        The array.
+    profile : dict
+        The rasterio profile of arr.
+    """
+    __slots__ = ('arr', 'profile')
+
+    def __init__(self, arr: np.ndarray, profile: dict):
+        if arr.ndim not in [2, 3]:
+            raise ValueError('arr must be 2d or 3d (bands, height, width)')
+        if arr.shape[-2:] != (profile['height'], profile['width']):
+            raise ValueError('arr shape does not match profile dimensions')
+        self.arr = arr
+        self.profile = profile
+
+    @property
+    def shape(self) -> tuple:
+        return self.arr.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.arr.dtype
+
+    @property
+    def ndim(self) -> int:
+        return self.arr.ndim
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        # NumPy 2 protocol: copy=None copies only if needed, copy=True always
+        # copies and copy=False raises if a copy is needed
+        dtype = self.arr.dtype if dtype is None else np.dtype(dtype)
+        if copy is False and dtype != self.arr.dtype:
+            raise ValueError(f'Unable to avoid a copy to convert from '
+                             f'{self.arr.dtype} to {dtype}')
+        return self.arr.astype(dtype, copy=bool(copy))
+
+    def __repr__(self) -> str:
+        return (f'GeoArray(shape={self.shape}, dtype={self.dtype}, '
+                f'crs={self.profile.get("crs")})')
+
+    def __getitem__(self, key) -> 'GeoArray':
+        key = _normalize_key(key, self.arr.ndim)
+        slice_y, slice_x = _get_positive_slices(key[-2:], self.arr.shape[-2:])
+
+        profile_cropped = get_cropped_profile(self.profile, slice_x, slice_y)
+        arr_cropped = self.arr[key[:-2] + (slice_y, slice_x)]
+        if arr_cropped.ndim == 3:
+            profile_cropped['count'] = arr_cropped.shape[0]
+        else:
+            profile_cropped['count'] = 1
+        return GeoArray(arr_cropped, profile_cropped)
+
+    def with_array(self, arr: np.ndarray) -> 'GeoArray':
+        """
+        Pair a new array (e.g. a denoised image) on the same grid with a copy
+        of this profile.
+        """
+        profile = self.profile.copy()
+        profile['count'] = arr.shape[0] if arr.ndim == 3 else 1
+        profile['dtype'] = str(arr.dtype)
+        return GeoArray(arr, profile)
+
+    @classmethod
+    @profile_stage('GeoArray.from_file')
+    def from_file(cls,
+                  path: str,
+                  slice_x: slice = None,
+                  slice_y: slice = None) -> 'GeoArray':
+        """
+        Read all bands of a raster. Single band rasters are read as 2d arrays.
+        If slices are specified, only that window of the raster is read (see
+        `get_window_from_slices`). Quantized products (see `write_quantized`)
+        are decoded to float32 linear-scale values.
+        """
+        with rasterio.open(path) as ds:
+            indexes = 1 if ds.count == 1 else None
+            profile = get_decoded_profile(ds)
+            if (slice_x is None) and (slice_y is None):
+                arr = read_dataset(ds, indexes)
+                return cls(arr, profile)
+
+            slice_y, slice_x = _get_positive_slices((slice_y or np.s_[:],
+                                                     slice_x or np.s_[:]),
+                                                    (ds.height, ds.width))
+            window = get_window_from_slices(profile, slice_x, slice_y)
+            arr = read_dataset(ds, indexes, window=window)
+        return cls(arr, get_cropped_profile(profile, slice_x, slice_y))
+
+    @profile_stage('GeoArray.to_file')
+    def to_file(self, path: str, **profile_updates):
+        """
+        Write the array with its profile. Additional keyword arguments update
+        the profile used for writing e.g. `compress='lzw'`.
+        """
+        profile = self.profile.copy()
+        profile.update(profile_updates)
+        arr = self.arr if self.arr.ndim == 3 else self.arr[np.newaxis, ...]
+        profile['count'] = arr.shape[0]
+        with rasterio.open(path, 'w', **profile) as ds:
+            ds.write(arr.astype(profile['dtype'], copy=False))
+
+    def to_quantized_file(self, path: str, **quantize_kwargs):
+        """
+        Write the (linear-scale backscatter) array as a compact uint16 dB
+        product (see `write_quantized`).
+        """
+        write_quantized(self.arr, self.profile, path, **quantize_kwargs)
+
+    def reproject_to_profile(self,
+                             ref_profile: dict,
+                             resampling: str = 'bilinear',
+                             nodata: str = None) -> 'GeoArray':
+        """
+        See `reproject_arr_to_match_profile`.
+        """
+        arr = self.arr if self.arr.ndim == 3 else self.arr[np.newaxis, ...]
+        arr_r, profile_r = reproject_arr_to_match_profile(
+                                                        arr,
+                                                        self.profile,
+                                                        ref_profile,
+                                                        nodata=nodata,
+                                                        resampling=resampling)
+        if self.arr.ndim == 2:
+            arr_r = arr_r[0, ...]
+        return GeoArray(arr_r, profile_r)
+
+    def reproject_to_crs(self,
+                         dst_crs: str,
+                         resampling: str = 'bilinear',
+                         target_resolution: Union[float, int] = None) \
+            -> 'GeoArray':
+        """
+        See `reproject_arr_to_new_crs`.
+        """
+        arr = self.arr if self.arr.ndim == 3 else self.arr[np.newaxis, ...]
+        profile = self.profile.copy()
+        profile['count'] = arr.shape[0]
+        tr = target_resolution
+        arr_r, profile_r = reproject_arr_to_new_crs(arr,
+                                                    profile,
+                                                    dst_crs,
+                                                    resampling=resampling,
+                                                    target_resolution=tr)
+        if self.arr.ndim == 2:
+            arr_r = arr_r[0, ...]
+        return GeoArray(arr_r, profile_r)
+
+
+def _normalize_key(key, ndim: int) -> tuple:
+    """
+    Expand the index into a tuple with one entry per dimension.
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is Ellipsis for k in key):
+        i = [k is Ellipsis for k in key].index(True)
+        n_missing = ndim - (len(key) - 1)
+        key = key[:i] + (slice(None),) * n_missing + key[i + 1:]
+    if len(key) > ndim:
+        raise IndexError('Too many indices for GeoArray')
+    return key + (slice(None),) * (ndim - len(key))
+
+
+def _get_positive_slices(spatial_key: tuple, spatial_shape: tuple) -> tuple:
+    """
+    Convert the spatial slices to slices with explicit, non-negative start and
+    stop so the cropped profile can be computed.
+    """
+    slices = []
+    for s, n in zip(spatial_key, spatial_shape):
+        if not isinstance(s, slice):
+            raise IndexError('Spatial indices of a GeoArray must be slices')
+        start, stop, step = s.indices(n)
+        if step != 1:
+            raise IndexError('Spatial slices of a GeoArray must have step 1')
+        slices.append(slice(start, max(start, stop)))
+    return tuple(slices)
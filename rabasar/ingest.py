@@ -0,0 +1,487 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+import datetime
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+import numpy as np
+import rasterio
+from tqdm import tqdm
+from .rio_tools import reproject_arr_to_match_profile
+
+
+class DownloadManifest(object):
+    """
+    A json record of the completed downloads (url, size and checksum keyed
+    by the local path) so that a bulk download can be rerun and skip what is
+    already done. The manifest is rewritten atomically after each completed
+    file and can be shared by the threads of `download_files`.
+
+    Parameters
+    ----------
+    manifest_path : str
+        The json file; created if it does not exist.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = Path(manifest_path)
+        self._lock = threading.Lock()
+        if self.manifest_path.exists():
+            self.records = json.loads(self.manifest_path.read_text())
+        else:
+            self.records = {}
+
+    def is_complete(self, url: str, dest_path: str) -> bool:
+        """
+        Whether `url` was downloaded to `dest_path` and the file still has the
+        recorded size.
+        """
+        record = self.records.get(str(dest_path))
+        if (record is None) or (record['url'] != url):
+            return False
+        path = Path(dest_path)
+        return path.exists() and (path.stat().st_size == record['size'])
+
+    def add(self, url: str, dest_path: str, size: int, checksum: str = None):
+        with self._lock:
+            self.records[str(dest_path)] = {'url': url,
+                                            'size': size,
+                                            'checksum': checksum}
+            self.manifest_path.parent.mkdir(exist_ok=True, parents=True)
+            tmp_path = self.manifest_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.records, indent=2))
+            os.replace(tmp_path, self.manifest_path)
+
+
+def get_urls_from_file(path: str) -> list:
+    """
+    Extract the http(s) urls from a text file in their order of appearance
+    e.g. a wget script (like `download_uavsar_waxlake.sh`), an ASF csv or
+    metalink.
+    """
+    text = Path(path).read_text()
+    urls = re.findall(r'https?://[^\s"\'<>,]+', text)
+    # remove duplicates preserving the order
+    return list(dict.fromkeys(urls))
+
+
+def get_file_checksum(path: str,
+                      algorithm: str = 'md5',
+                      chunk_size: int = 2**20) -> str:
+    """
+    The hex digest of a file with any algorithm of `hashlib`, read in chunks.
+    """
+    file_hash = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, HTTPError):
+        return error.code >= 500 or error.code == 429
+    return isinstance(error, (URLError, ConnectionError, TimeoutError))
+
+
+def download_file(url: str,
+                  dest_path: str,
+                  expected_size: int = None,
+                  checksum: str = None,
+                  checksum_algorithm: str = 'md5',
+                  headers: dict = None,
+                  chunk_size: int = 2**20,
+                  timeout: float = 60,
+                  max_retries: int = 3) -> str:
+    """
+    Download `url` to `dest_path`. The data is streamed to
+    `<dest_path>.part` which is renamed once complete and verified. If a
+    partial file exists (e.g. from an interrupted run or a dropped
+    connection), the download is resumed with an HTTP Range request; if the
+    server does not support ranges, it restarts. Connection errors and 5xx
+    responses are retried with exponential backoff.
+
+    Parameters
+    ----------
+    url : str
+        The url.
+    dest_path : str
+        The local path.
+    expected_size : int
+        If specified, the size in bytes is verified. Otherwise, it is
+        verified against the Content-Length if the server reports it.
+    checksum : str
+        If specified, the hex digest of the file is verified.
+    checksum_algorithm : str
+        Any algorithm of `hashlib`. Default is `md5` (as in ASF metadata).
+    headers : dict
+        Additional request headers e.g. `{'Authorization': 'Bearer <token>'}`
+        for Earthdata.
+    chunk_size : int
+        The read size in bytes. Default is 1 MB.
+    timeout : float
+        The socket timeout in seconds. Default is 60.
+    max_retries : int
+        The number of retries. Default is 3.
+
+    Returns
+    -------
+    str:
+        dest_path; raises a ValueError if the verification fails (the file
+        is then removed).
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(exist_ok=True, parents=True)
+    part_path = dest_path.with_name(dest_path.name + '.part')
+
+    for attempt in range(max_retries + 1):
+        try:
+            total_size = _download_to_part(url,
+                                           part_path,
+                                           headers or {},
+                                           chunk_size,
+                                           timeout)
+            break
+        except Exception as e:
+            if (attempt == max_retries) or not _is_retryable(e):
+                raise
+            time.sleep(2 ** attempt)
+
+    expected_size = expected_size if expected_size is not None else total_size
+    size = part_path.stat().st_size
+    if (expected_size is not None) and (size != expected_size):
+        part_path.unlink()
+        raise ValueError(f'{url}: downloaded {size} bytes, '
+                         f'expected {expected_size}')
+    if checksum is not None:
+        file_checksum = get_file_checksum(part_path, checksum_algorithm)
+        if file_checksum.lower() != checksum.lower():
+            part_path.unlink()
+            raise ValueError(f'{url}: {checksum_algorithm} checksum '
+                             f'{file_checksum} does not match {checksum}')
+    os.replace(part_path, dest_path)
+    return str(dest_path)
+
+
+def _download_to_part(url: str,
+                      part_path: Path,
+                      headers: dict,
+                      chunk_size: int,
+                      timeout: float) -> int:
+    """
+    Stream url to part_path resuming from its current size. Returns the total
+    size reported by the server or None.
+    """
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    request_headers = dict(headers)
+    if offset:
+        request_headers['Range'] = f'bytes={offset}-'
+    request = Request(url, headers=request_headers)
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        # the partial file is already complete
+        if e.code == 416 and offset:
+            return None
+        raise
+
+    with response:
+        if offset and response.status == 206:
+            mode = 'ab'
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rpartition('/')[2]
+            total_size = int(total) if total.isdigit() else None
+        else:
+            # the server ignored the range; restart
+            mode = 'wb'
+            length = response.headers.get('Content-Length')
+            total_size = int(length) if length is not None else None
+        with open(part_path, mode) as f:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                f.write(chunk)
+    # a dropped connection can end the stream early without an error
+    if (total_size is not None) and part_path.stat().st_size < total_size:
+        raise ConnectionError(f'{url}: connection closed before the end of '
+                              'the file')
+    return total_size
+
+
+def download_files(urls: list,
+                   dest_dir: str = None,
+                   dest_paths: list = None,
+                   sizes: dict = None,
+                   checksums: dict = None,
+                   checksum_algorithm: str = 'md5',
+                   manifest_path: str = None,
+                   headers: dict = None,
+                   n_workers: int = 8,
+                   max_retries: int = 3,
+                   timeout: float = 60) -> list:
+    """
+    Download many files concurrently with `n_workers` threads, so a large
+    stack is limited by bandwidth rather than per-request latency. Each file
+    is downloaded with `download_file` (resumed, retried and verified).
+    Completed files are recorded in a manifest (see `DownloadManifest`) and
+    skipped when rerun.
+
+    All files are attempted; failures are reported together at the end with
+    a RuntimeError.
+
+    Parameters
+    ----------
+    urls : list
+        The urls e.g. from `get_urls_from_file`.
+    dest_dir : str
+        The directory of the files, which are named after the urls. Ignored
+        if `dest_paths` is specified.
+    dest_paths : list
+        The local path for each url.
+    sizes : dict
+        Expected sizes in bytes keyed by url. Default is None.
+    checksums : dict
+        Expected hex digests keyed by url. Default is None.
+    checksum_algorithm : str
+        Default is `md5`.
+    manifest_path : str
+        Default is None, which uses `<dest_dir>/download_manifest.json` if
+        `dest_dir` is specified and no manifest otherwise.
+    headers : dict
+        Additional request headers (e.g. authorization).
+    n_workers : int
+        The number of concurrent downloads. Default is 8.
+    max_retries : int
+        See `download_file`. Default is 3.
+    timeout : float
+        See `download_file`. Default is 60.
+
+    Returns
+    -------
+    list:
+        The local paths in the order of the urls.
+    """
+    if dest_paths is None:
+        if dest_dir is None:
+            raise ValueError('dest_dir or dest_paths must be specified')
+        dest_paths = [str(Path(dest_dir) / Path(urlparse(url).path).name)
+                      for url in urls]
+    if len(dest_paths) != len(urls):
+        raise ValueError('urls and dest_paths must have the same length')
+    if (manifest_path is None) and (dest_dir is not None):
+        manifest_path = str(Path(dest_dir) / 'download_manifest.json')
+    manifest = DownloadManifest(manifest_path) if manifest_path else None
+    sizes = sizes or {}
+    checksums = checksums or {}
+
+    def download(url, dest_path):
+        if (manifest is not None) and manifest.is_complete(url, dest_path):
+            return dest_path
+        download_file(url,
+                      dest_path,
+                      expected_size=sizes.get(url),
+                      checksum=checksums.get(url),
+                      checksum_algorithm=checksum_algorithm,
+                      headers=headers,
+                      timeout=timeout,
+                      max_retries=max_retries)
+        if manifest is not None:
+            manifest.add(url,
+                         dest_path,
+                         Path(dest_path).stat().st_size,
+                         checksums.get(url))
+        return dest_path
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(download, url, dest_path): url
+                   for url, dest_path in zip(urls, dest_paths)}
+        for future in tqdm(as_completed(futures),
+                           total=len(futures),
+                           desc='downloads'):
+            try:
+                future.result()
+            except Exception as e:
+                failures[futures[future]] = e
+
+    if failures:
+        lines = [f'{url}: {e!r}' for url, e in failures.items()]
+        raise RuntimeError(f'{len(failures)} of {len(urls)} downloads '
+                           'failed:\n' + '\n'.join(lines))
+    return list(dest_paths)
+
+
+def get_zip_members(zip_path: str, pattern: str) -> list:
+    """
+    The sorted names of the members of a zip matching a glob pattern (on the
+    file name) e.g. `*HH*.tif`.
+    """
+    with zipfile.ZipFile(zip_path) as zf:
+        names = [name for name in zf.namelist()
+                 if fnmatch.fnmatch(Path(name).name, pattern)]
+    return sorted(names)
+
+
+def get_vsizip_path(zip_path: str, member: str) -> str:
+    """
+    The GDAL virtual file system path of a zip member, which can be opened
+    with rasterio without extracting the zip.
+    """
+    return f'/vsizip/{Path(zip_path).resolve()}/{member}'
+
+
+def get_alos1_date_from_xml(xml: bytes) -> datetime.date:
+    """
+    The acquisition date from the contents of an ASF `*iso.xml` metadata
+    file (the `gml:beginPosition` element).
+    """
+    root = ET.fromstring(xml)
+    # the gml namespace differs between versions of the metadata
+    elements = [element for element in root.iter()
+                if element.tag.rpartition('}')[2] == 'beginPosition']
+    if len(elements) != 1:
+        raise ValueError('Expected one gml:beginPosition element')
+    text = elements[0].text
+    return datetime.date(int(text[:4]), int(text[5:7]), int(text[8:10]))
+
+
+def get_alos1_date_from_zip(zip_path: str) -> datetime.date:
+    """
+    The acquisition date of an ASF RTC zip from its `*iso.xml` metadata read
+    directly from the zip.
+    """
+    members = get_zip_members(zip_path, '*iso.xml')
+    if not members:
+        raise ValueError(f'No *iso.xml metadata in {zip_path}')
+    with zipfile.ZipFile(zip_path) as zf:
+        return get_alos1_date_from_xml(zf.read(members[0]))
+
+
+def get_profile_from_zip(zip_path: str, pattern: str = '*HH*.tif') -> dict:
+    """
+    The profile of the first raster of a zip matching the pattern e.g. to
+    derive a reference profile with `get_cropped_profile`.
+    """
+    members = get_zip_members(zip_path, pattern)
+    if not members:
+        raise ValueError(f'No member matching {pattern} in {zip_path}')
+    with rasterio.open(get_vsizip_path(zip_path, members[0])) as ds:
+        profile = ds.profile
+    profile['driver'] = 'GTiff'
+    profile['nodata'] = np.nan
+    return profile
+
+
+def ingest_alos1_zip(zip_path: str,
+                     ref_profile: dict,
+                     out_dir: str,
+                     site: str,
+                     pols: tuple = ('HH', 'HV'),
+                     db_bounds: tuple = (-40, 0),
+                     resampling: str = 'bilinear',
+                     sensor: str = 'alos1') -> dict:
+    """
+    Ingest an ASF RTC zip without extracting it: the rasters and the
+    `*iso.xml` metadata are read through GDAL's `/vsizip/` virtual file
+    system, the images are reprojected to the reference grid and written to
+    the stack at
+
+        <out_dir>/<pol>/<sensor>_<site>_<pol>_RTC_<yyyymmdd>.tif
+
+    as in the `0 - Rename and Reproject Time Series` notebook. Zeros are
+    nodata (np.nan) and the backscatter is clipped to `db_bounds`.
+
+    Parameters
+    ----------
+    zip_path : str
+        The downloaded zip.
+    ref_profile : dict
+        The profile of the reference grid.
+    out_dir : str
+        The stack directory.
+    site : str
+        The site name used in the file names.
+    pols : tuple
+        The polarizations; the rasters are the members matching `*<pol>*.tif`.
+        Default is ('HH', 'HV').
+    db_bounds : tuple
+        The (lower, upper) dB clipping bounds. Default is (-40, 0).
+    resampling : str
+        See `reproject_arr_to_match_profile`. Default is `bilinear`.
+    sensor : str
+        The sensor name used in the file names. Default is `alos1`.
+
+    Returns
+    -------
+    dict:
+        The written path of each polarization.
+    """
+    date = get_alos1_date_from_zip(zip_path)
+    lower, upper = np.power(10, np.array(db_bounds) / 10.)
+    profile_out = ref_profile.copy()
+    profile_out.update({'driver': 'GTiff',
+                        'count': 1,
+                        'dtype': 'float32',
+                        'nodata': np.nan})
+
+    dest_paths = {}
+    for pol in pols:
+        members = get_zip_members(zip_path, f'*{pol}*.tif')
+        if not members:
+            raise ValueError(f'No {pol} raster in {zip_path}')
+        with rasterio.open(get_vsizip_path(zip_path, members[0])) as ds:
+            img = ds.read(1).astype(np.float32)
+            profile_src = ds.profile
+        img[img == 0] = np.nan
+        profile_src.update({'nodata': np.nan, 'dtype': 'float32'})
+
+        img_r, _ = reproject_arr_to_match_profile(img,
+                                                  profile_src,
+                                                  ref_profile,
+                                                  resampling=resampling)
+        img_r = np.clip(img_r, lower, upper)
+
+        dest_dir = Path(out_dir) / pol.lower()
+        dest_dir.mkdir(exist_ok=True, parents=True)
+        dest_path = (dest_dir /
+                     f'{sensor}_{site}_{pol.lower()}_RTC_'
+                     f'{date.year}{date.month:02d}{date.day:02d}.tif')
+        with rasterio.open(dest_path, 'w', **profile_out) as ds:
+            ds.write(img_r.astype(np.float32))
+        dest_paths[pol] = str(dest_path)
+    return dest_paths
+
+
+def ingest_alos1_zips(zip_paths: list,
+                      ref_profile: dict,
+                      out_dir: str,
+                      site: str,
+                      n_workers: int = 4,
+                      **ingest_kwargs) -> list:
+    """
+    Ingest many zips concurrently with `ingest_alos1_zip`. GDAL releases the
+    GIL while decompressing and warping so threads are used.
+
+    Returns
+    -------
+    list:
+        The dictionary of written paths of each zip.
+    """
+    def ingest(zip_path):
+        return ingest_alos1_zip(zip_path,
+                                ref_profile,
+                                out_dir,
+                                site,
+                                **ingest_kwargs)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        return list(tqdm(executor.map(ingest, zip_paths),
+                         total=len(zip_paths),
+                         desc='ingest'))
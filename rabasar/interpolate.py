@@ -1,7 +1,9 @@
 import numpy as np
 import scipy.ndimage as nd
+from .profiling import profile_stage
 
 
+@profile_stage('interpolate_nn')
 def interpolate_nn(data: np.array) -> np.array:
     """
     Function to fill nan values in a 2D array using nearest neighbor
@@ -0,0 +1,237 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _newton_step_numpy(x: np.ndarray,
+                       a: np.ndarray,
+                       y: np.ndarray,
+                       L: float,
+                       Lm: float,
+                       beta: float) -> np.ndarray:
+    """
+    One Newton step of `newton_lklhd_iter` (Lm is None) or `ratio_lklhd_iter`.
+    """
+    exp_diff = np.exp(y - x)
+    if Lm is None:
+        numer = beta * (x - a) + L * (1 - exp_diff)
+        denom = beta + L * exp_diff
+    else:
+        c = (Lm + L) * exp_diff / (Lm + L * exp_diff)
+        numer = beta * (x - a) + L * (1 - c)
+        denom = beta + L * c * (1 - L / (Lm + L) * c)
+    return x - numer / denom
+
+
+def _update_chunk_numpy(x_k, u_k, z_kp1, z_k, img_db, x_relaxed, L, Lm,
+                        beta, newton_iterations, newton_tol, x_kp1, u_kp1,
+                        denoiser_input):
+    np.add(u_k, z_kp1, out=u_kp1)
+    u_kp1 -= x_relaxed
+    a_k = z_kp1 + u_kp1
+    x_new = x_k
+    if newton_tol is None:
+        for i in range(newton_iterations):
+            x_new = _newton_step_numpy(x_new, a_k, img_db, L, Lm, beta)
+    else:
+        # only the pixels whose last step exceeded the tolerance are updated
+        x_new = x_k.copy()
+        active = np.arange(x_k.size)
+        for i in range(newton_iterations):
+            x_active = x_new[active]
+            x_step = _newton_step_numpy(x_active, a_k[active],
+                                        img_db[active], L, Lm, beta)
+            x_new[active] = x_step
+            active = active[np.abs(x_step - x_active) > newton_tol]
+            if active.size == 0:
+                break
+    x_kp1[:] = x_new
+    np.subtract(x_kp1, u_kp1, out=denoiser_input)
+
+    sq_sums = []
+    for old, new in [(x_k, x_kp1), (u_k, u_kp1), (z_k, z_kp1)]:
+        diff = np.subtract(old, new, out=a_k)
+        sq_sums.append(np.dot(diff, diff))
+    return np.array(sq_sums)
+
+
+def _update_numpy(x_k, u_k, z_kp1, z_k, img_db, x_relaxed, L, Lm, beta,
+                  newton_iterations, newton_tol, x_kp1, u_kp1,
+                  denoiser_input, n_threads, chunk_size=2**18):
+    """
+    The fused update on chunks of the flattened arrays in a thread pool
+    (NumPy releases the GIL) so temporaries are only chunk-sized.
+    """
+    arrays = (x_k, u_k, z_kp1, z_k, img_db, x_relaxed)
+    outputs = (x_kp1, u_kp1, denoiser_input)
+
+    def update_chunk(start):
+        chunk = np.s_[start: start + chunk_size]
+        return _update_chunk_numpy(*[arr[chunk] for arr in arrays],
+                                   L, Lm, beta, newton_iterations,
+                                   newton_tol,
+                                   *[out[chunk] for out in outputs])
+
+    starts = range(0, x_k.size, chunk_size)
+    if n_threads == 1 or len(starts) == 1:
+        return sum(map(update_chunk, starts))
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return sum(executor.map(update_chunk, starts))
+
+
+# numba caches compiled kernels next to the source (i.e. in the package
+# __pycache__) unless NUMBA_CACHE_DIR is set, so the kernel is only cached
+# when a cache directory is configured
+NUMBA_CACHE = bool(os.environ.get('NUMBA_CACHE_DIR'))
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=NUMBA_CACHE)
+    def _update_numba(x_k, u_k, z_kp1, z_k, img_db, x_relaxed, L, Lm, beta,
+                      newton_iterations, newton_tol, x_kp1, u_kp1,
+                      denoiser_input):
+        # Lm <= 0 denotes the (spatial) log-gamma likelihood and
+        # newton_tol < 0 a fixed number of Newton iterations
+        sq_x = 0.
+        sq_u = 0.
+        sq_z = 0.
+        for i in numba.prange(x_k.size):
+            u_new = u_k[i] + z_kp1[i] - x_relaxed[i]
+            a = z_kp1[i] + u_new
+            x = x_k[i]
+            for j in range(newton_iterations):
+                exp_diff = np.exp(img_db[i] - x)
+                if Lm <= 0:
+                    numer = beta * (x - a) + L * (1 - exp_diff)
+                    denom = beta + L * exp_diff
+                else:
+                    c = (Lm + L) * exp_diff / (Lm + L * exp_diff)
+                    numer = beta * (x - a) + L * (1 - c)
+                    denom = beta + L * c * (1 - L / (Lm + L) * c)
+                step = numer / denom
+                x = x - step
+                if abs(step) <= newton_tol:
+                    break
+            x_kp1[i] = x
+            u_kp1[i] = u_new
+            denoiser_input[i] = x - u_new
+            sq_x += (x_k[i] - x) ** 2
+            sq_u += (u_k[i] - u_new) ** 2
+            sq_z += (z_k[i] - z_kp1[i]) ** 2
+        return np.array([sq_x, sq_u, sq_z])
+
+
+def admm_likelihood_update(x_k: np.ndarray,
+                           u_k: np.ndarray,
+                           z_kp1: np.ndarray,
+                           z_k: np.ndarray,
+                           img_db: np.ndarray,
+                           L: float,
+                           beta: float,
+                           newton_iterations: int,
+                           newton_tol: float = None,
+                           Lm: float = None,
+                           x_relaxed: np.ndarray = None,
+                           n_threads: int = None,
+                           use_numba: bool = None) -> tuple:
+    """
+    The steps of a plug-and-play ADMM iteration after the denoiser fused in a
+    single pass over the pixels:
+
+        u_kp1 = u_k + z_kp1 - x_k
+        x_kp1 = newton iterations of the likelihood from x_k towards
+                z_kp1 + u_kp1 (see `newton_lklhd_iter` and `ratio_lklhd_iter`)
+        denoiser_input = x_kp1 - u_kp1  (the input of the next denoiser call)
+        block_diff = |x_k - x_kp1| + |u_k - u_kp1| + |z_k - z_kp1|
+
+    If numba is installed (the optional `numba` extra), this is a parallel
+    (prange) kernel with no temporaries; otherwise the NumPy fallback
+    processes chunks in a thread pool. The results agree with the NumPy
+    expressions up to floating point rounding. The compiled kernel is cached
+    on disk only if the environment variable `NUMBA_CACHE_DIR` is set (and
+    then in that directory); otherwise it is compiled once per process.
+
+    Parameters
+    ----------
+    x_k, u_k, z_kp1, z_k : np.ndarray
+        The ADMM variables (log10 scale).
+    img_db : np.ndarray
+        The log10 image.
+    L : float
+        The ENL of the image.
+    beta : float
+        The ADMM penalty.
+    newton_iterations : int
+        The number of Newton iterations or, if `newton_tol` is specified,
+        the maximum number.
+    newton_tol : float
+        If specified, the Newton iterations of a pixel stop once its step is
+        at most `newton_tol` (log10 scale). Only the pixels that have not
+        converged are updated: the NumPy fallback compacts them into an
+        array of active indices after each step and the numba kernel stops
+        per pixel. Default is None, which always takes `newton_iterations`
+        steps.
+    Lm : float
+        The ENL of the temporal average for the ratio likelihood. Default is
+        None, which uses the likelihood of `admm_spatial_denoise`.
+    x_relaxed : np.ndarray
+        The over-relaxed x_k used in the u update instead of x_k (see
+        `ADMMAccelerator`); the Newton iterations start from x_k and the
+        residual is |x_k - x_kp1| regardless. Default is None, which uses
+        x_k.
+    n_threads : int
+        The number of threads. Default is None, which uses all cores (for
+        numba, `numba.get_num_threads()`).
+    use_numba : bool
+        Whether to use numba. Default is None, which uses numba if installed.
+
+    Returns
+    -------
+    tuple:
+        (x_kp1, u_kp1, denoiser_input, block_diff)
+    """
+    if use_numba is None:
+        use_numba = numba is not None
+    if use_numba and numba is None:
+        raise ImportError('numba is not installed')
+
+    shape = x_k.shape
+    dtype = np.result_type(x_k, u_k, z_kp1, z_k, img_db)
+    x_relaxed = x_k if x_relaxed is None else x_relaxed
+    dtype = np.result_type(dtype, x_relaxed)
+    arrays = [np.ascontiguousarray(arr, dtype=dtype).reshape(-1)
+              for arr in [x_k, u_k, z_kp1, z_k, img_db, x_relaxed]]
+    outputs = [np.empty(x_k.size, dtype=dtype) for _ in range(3)]
+
+    if use_numba:
+        n_threads_prev = numba.get_num_threads()
+        if n_threads is not None:
+            numba.set_num_threads(n_threads)
+        try:
+            sq_sums = _update_numba(*arrays,
+                                    float(L),
+                                    -1. if Lm is None else float(Lm),
+                                    float(beta),
+                                    newton_iterations,
+                                    -1. if newton_tol is None
+                                    else float(newton_tol),
+                                    *outputs)
+        finally:
+            numba.set_num_threads(n_threads_prev)
+    else:
+        sq_sums = _update_numpy(*arrays,
+                                L,
+                                Lm,
+                                beta,
+                                newton_iterations,
+                                newton_tol,
+                                *outputs,
+                                n_threads=n_threads or os.cpu_count() or 1)
+
+    x_kp1, u_kp1, denoiser_input = [out.reshape(shape) for out in outputs]
+    block_diff = float(np.sqrt(sq_sums).sum())
+    return x_kp1, u_kp1, denoiser_input, block_diff
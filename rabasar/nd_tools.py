@@ -1,29 +1,176 @@
 import numpy as np
+from typing import Iterable, Tuple, Union
 
 
 def scale_img(img: np.ndarray,
               new_min: int = 0,
-              new_max: int = 1) -> np.ndarray:
+              new_max: int = 1,
+              i_min: float = None,
+              i_max: float = None,
+              out: np.ndarray = None) -> np.ndarray:
     """
     Scale an image by the absolute max and min in the array to have dynamic
     range new_min to new_max. Useful for visualization.
 
+    The min and max can be specified instead e.g. robust percentiles from
+    `StreamingHistogram` or `get_percentile_bounds`, in which case values
+    outside are clipped. The result is computed in place in `out` (which may
+    be `img` itself or a memory-mapped array) without full-size temporaries.
+
     Parameters
     ----------
     img : np.ndarray
     new_min : int
     new_max : int
+    i_min : float
+        The value mapped to new_min. Default is None, which uses
+        `np.nanmin(img)`.
+    i_max : float
+        The value mapped to new_max. Default is None, which uses
+        `np.nanmax(img)`.
+    out : np.ndarray
+        The output array. Default is None, which allocates a new array.
 
     Returns
     -------
     np.ndarray:
        New image with shape equal to img, scaled to [new_min, new_max]
     """
-    i_min = np.nanmin(img)
-    i_max = np.nanmax(img)
+    if i_min is None:
+        i_min = np.nanmin(img)
+    if i_max is None:
+        i_max = np.nanmax(img)
     if i_min == i_max:
         # then image is constant image and clip between new_min and new_max
-        return np.clip(img, new_min, new_max)
-    img_scaled = (img - i_min) / (i_max - i_min) * (new_max - new_min)
+        return np.clip(img, new_min, new_max, out=out)
+    is_float = np.issubdtype(np.asarray(img).dtype, np.floating)
+    if (out is None) and not is_float:
+        out = np.empty(np.shape(img), dtype=np.float64)
+    img_scaled = np.subtract(img, i_min, out=out)
+    img_scaled /= (i_max - i_min)
+    img_scaled *= (new_max - new_min)
     img_scaled += new_min
+    np.clip(img_scaled, new_min, new_max, out=img_scaled)
     return img_scaled
+
+
+class StreamingHistogram(object):
+    """
+    Accumulates nan-aware exact min/max and a fixed-size histogram of the data
+    in one streamed pass e.g. over the tiles of a large raster or over the
+    images of a stack. The histogram range grows as needed by doubling the bin
+    width (merging neighboring bins), so no range needs to be known
+    beforehand. Quantiles are interpolated within the bins and hence accurate
+    to about (max - min) / n_bins.
+
+    Parameters
+    ----------
+    n_bins : int
+        The number of bins; must be even. Default is 4096.
+    """
+
+    def __init__(self, n_bins: int = 4096):
+        if n_bins % 2:
+            raise ValueError('n_bins must be even')
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.bin_start = None
+        self.bin_width = None
+        self.min = np.inf
+        self.max = -np.inf
+        self.n = 0
+
+    def update(self, arr: np.ndarray, chunk_size: int = 2**22):
+        """
+        Add the data in arr; np.nan and +/-np.inf (e.g. the dB of 0) are
+        ignored. The array is processed in chunks of `chunk_size` elements so
+        memory-mapped arrays are never loaded at once.
+        """
+        arr = np.asarray(arr).reshape(-1)
+        for start in range(0, arr.size, chunk_size):
+            self._update_chunk(arr[start: start + chunk_size])
+
+    def _update_chunk(self, data: np.ndarray):
+        data = data[np.isfinite(data)].astype(np.float64)
+        if data.size == 0:
+            return
+        data_min, data_max = data.min(), data.max()
+        self.min = min(self.min, data_min)
+        self.max = max(self.max, data_max)
+        self.n += data.size
+
+        if self.bin_start is None:
+            self.bin_start = data_min
+            span = data_max - data_min
+            self.bin_width = (span / self.n_bins * (1 + 1e-9) if span > 0
+                              else max(abs(data_min), 1.) * 1e-9)
+        while data_min < self.bin_start:
+            self._double_bin_width(extend_left=True)
+        while data_max >= self.bin_start + self.bin_width * self.n_bins:
+            self._double_bin_width(extend_left=False)
+
+        indices = ((data - self.bin_start) / self.bin_width).astype(np.int64)
+        np.clip(indices, 0, self.n_bins - 1, out=indices)
+        self.counts += np.bincount(indices, minlength=self.n_bins)
+
+    def _double_bin_width(self, extend_left: bool):
+        half = self.n_bins // 2
+        merged = self.counts[0::2] + self.counts[1::2]
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        if extend_left:
+            self.counts[half:] = merged
+            self.bin_start -= self.bin_width * self.n_bins
+        else:
+            self.counts[:half] = merged
+        self.bin_width *= 2
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[float,
+                                                             np.ndarray]:
+        """
+        Approximate quantile(s) with q in [0, 1].
+        """
+        if self.n == 0:
+            raise ValueError('No data has been accumulated')
+        q = np.asarray(q, dtype=np.float64)
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        edges = self.bin_start + self.bin_width * np.arange(self.n_bins + 1)
+        values = np.interp(q * self.n, cumulative, edges)
+        values = np.clip(values, self.min, self.max)
+        return values if values.ndim else float(values)
+
+    def percentile(self, p: Union[float, np.ndarray]) -> Union[float,
+                                                               np.ndarray]:
+        """
+        Approximate percentile(s) with p in [0, 100].
+        """
+        return self.quantile(np.asarray(p) / 100.)
+
+
+def get_percentile_bounds(imgs: Iterable,
+                          percentiles: Tuple[float, float] = (2, 98),
+                          n_bins: int = 4096) -> Tuple[float, float]:
+    """
+    Approximate (lower, upper) percentiles over an iterable of arrays (e.g.
+    tiles or the images of a stack) in one streamed pass for use with
+    `scale_img(img, i_min=lower, i_max=upper)`. See `StreamingHistogram`.
+
+    Parameters
+    ----------
+    imgs : Iterable
+        The arrays (np.nan and +/-np.inf are ignored). A single array may be
+        passed within a list.
+    percentiles : Tuple[float, float]
+        The lower and upper percentiles. Default is (2, 98).
+    n_bins : int
+        Number of histogram bins. Default is 4096.
+
+    Returns
+    -------
+    Tuple[float, float]:
+        (lower, upper)
+    """
+    histogram = StreamingHistogram(n_bins=n_bins)
+    for img in imgs:
+        histogram.update(img)
+    lower, upper = histogram.percentile(percentiles)
+    return lower, upper
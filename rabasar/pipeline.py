@@ -0,0 +1,206 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+import numpy as np
+from .geo_array import GeoArray
+
+
+def prefetch(items: Iterable,
+             read_func: Callable,
+             n_prefetch: int = 2,
+             n_threads: int = 2) -> Iterator:
+    """
+    Yield `read_func(item)` for each item in order while the next
+    `n_prefetch` items are read on I/O threads. At most `n_prefetch` results
+    are held in memory ahead of the consumer.
+
+    Since the pipeline functions take iterables of images, a prefetched
+    stack can be passed directly e.g.
+
+        imgs = prefetch(paths, lambda path: GeoArray.from_file(path).arr)
+        windowed_rabasar_denoise(imgs, k, ...)
+
+    Parameters
+    ----------
+    items : Iterable
+        The items to read e.g. paths or windows.
+    read_func : Callable
+        Reads one item; must be thread-safe (e.g. opens its own dataset).
+    n_prefetch : int
+        The number of items read ahead. Default is 2.
+    n_threads : int
+        The number of reader threads. Default is 2.
+
+    Returns
+    -------
+    Iterator:
+        The read results in the order of the items.
+    """
+    if n_prefetch < 1:
+        raise ValueError('n_prefetch must be at least 1')
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(read_func, item))
+            if len(pending) > n_prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_behind(results: Iterable,
+                 write_func: Callable,
+                 max_pending: int = 2,
+                 n_threads: int = 1) -> list:
+    """
+    Consume `results` and call `write_func(*result)` for each on writer
+    threads so that the compression and flushing of one output overlaps the
+    computation of the next (when `results` is a lazy iterator). If
+    `max_pending` writes are outstanding, we wait for the oldest to finish
+    before computing the next result, which bounds the memory held by the
+    queue. Exceptions raised by the writes are re-raised here.
+
+    Parameters
+    ----------
+    results : Iterable
+        Tuples of the arguments of `write_func` e.g. `(dest_path, arr)`.
+    write_func : Callable
+        Writes one result.
+    max_pending : int
+        The maximum number of outstanding writes. Default is 2.
+    n_threads : int
+        The number of writer threads. Default is 1.
+
+    Returns
+    -------
+    list:
+        The return values of `write_func` in order.
+    """
+    if max_pending < 1:
+        raise ValueError('max_pending must be at least 1')
+    outputs = []
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        pending = deque()
+        for result in results:
+            if len(pending) >= max_pending:
+                outputs.append(pending.popleft().result())
+            pending.append(executor.submit(write_func, *result))
+        while pending:
+            outputs.append(pending.popleft().result())
+    return outputs
+
+
+def run_pipelined(items: Iterable,
+                  read_func: Callable,
+                  process_func: Callable,
+                  write_func: Callable,
+                  n_prefetch: int = 2,
+                  max_pending_writes: int = 2,
+                  n_read_threads: int = 2,
+                  n_write_threads: int = 1) -> list:
+    """
+    Run `write_func(item, process_func(read_func(item)))` for each item with
+    the reads prefetched (see `prefetch`) and the writes behind (see
+    `write_behind`) so that `process_func`, run in the calling thread, does
+    not wait on disk. At most `n_prefetch` inputs and `max_pending_writes`
+    outputs are in memory besides the one being processed.
+
+    Parameters
+    ----------
+    items : Iterable
+        The items e.g. the dates, paths or tiles.
+    read_func : Callable
+        Reads one item.
+    process_func : Callable
+        Processes the read data e.g. a denoiser.
+    write_func : Callable
+        Called with the item and the processed data.
+    n_prefetch : int
+        The number of items read ahead. Default is 2.
+    max_pending_writes : int
+        The maximum number of outstanding writes. Default is 2.
+    n_read_threads : int
+        The number of reader threads. Default is 2.
+    n_write_threads : int
+        The number of writer threads. Default is 1.
+
+    Returns
+    -------
+    list:
+        The return values of `write_func` in order.
+    """
+    items = list(items)
+    data = prefetch(items,
+                    read_func,
+                    n_prefetch=n_prefetch,
+                    n_threads=n_read_threads)
+    results = ((item, process_func(datum)) for item, datum in zip(items, data))
+    return write_behind(results,
+                        write_func,
+                        max_pending=max_pending_writes,
+                        n_threads=n_write_threads)
+
+
+def denoise_rasters_pipelined(src_paths: list,
+                              dest_paths: list,
+                              denoise_func: Callable,
+                              n_prefetch: int = 2,
+                              max_pending_writes: int = 2,
+                              **profile_updates) -> list:
+    """
+    Denoise a list of single band rasters with prefetched reads and
+    write-behind (see `run_pipelined`).
+
+    Parameters
+    ----------
+    src_paths : list
+        The rasters to denoise.
+    dest_paths : list
+        The output paths.
+    denoise_func : Callable
+        Takes an array and returns the denoised array or a tuple whose first
+        entry is the denoised array (like the ADMM denoisers) e.g.
+        `lambda img: admm_spatial_denoise(img, L, 'bm3d', {'weight': 1})`.
+    n_prefetch : int
+        The number of rasters read ahead. Default is 2.
+    max_pending_writes : int
+        The maximum number of outstanding writes. Default is 2.
+    **profile_updates
+        Updates of the output profile e.g. `compress='lzw'`. The outputs are
+        written with the dtype of the source if it is a float and float32
+        otherwise, unless `dtype` is specified here.
+
+    Returns
+    -------
+    list:
+        dest_paths
+    """
+    if len(src_paths) != len(dest_paths):
+        raise ValueError('src_paths and dest_paths must have the same length')
+
+    def denoise(geo_arr: GeoArray) -> GeoArray:
+        result = denoise_func(geo_arr.arr)
+        if isinstance(result, tuple):
+            result = result[0]
+        # the denoisers return float64; keep the outputs as small as the
+        # source unless the caller specifies the dtype
+        if 'dtype' in profile_updates:
+            dtype = profile_updates['dtype']
+        elif np.issubdtype(geo_arr.dtype, np.floating):
+            dtype = geo_arr.dtype
+        else:
+            dtype = np.float32
+        return geo_arr.with_array(np.asarray(result).astype(dtype,
+                                                            copy=False))
+
+    def write(paths: tuple, geo_arr: GeoArray) -> str:
+        geo_arr.to_file(paths[1], **profile_updates)
+        return paths[1]
+
+    return run_pipelined(zip(src_paths, dest_paths),
+                         lambda paths: GeoArray.from_file(paths[0]),
+                         denoise,
+                         write,
+                         n_prefetch=n_prefetch,
+                         max_pending_writes=max_pending_writes)
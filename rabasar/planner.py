@@ -0,0 +1,449 @@
+from concurrent.futures import (FIRST_COMPLETED,
+                                ProcessPoolExecutor,
+                                wait)
+from typing import Callable, Tuple
+import os
+import numpy as np
+from .acceleration import ACCELERATIONS
+
+# Peak memory per pixel of each stage modeled as
+#     (number of arrays of the working dtype, additional bytes)
+# where the working dtype is that of np.log10(img). Calibrated with
+# tracemalloc on 512 x 512 images; bm3d converts to float64 internally.
+_DENOISER_BYTES_PER_PIXEL = {
+    'admm_spatial_denoise': {'tv': (12, 0), 'bm3d': (6, 110)},
+    'midal_denoise': {'tv': (12, 0), 'bm3d': (6, 110)},
+    'admm_ratio_denoise': {'tv': (14, 0), 'bm3d': (8, 110)},
+}
+# additional arrays of the ADMM acceleration schemes (see ADMMAccelerator):
+# the over-relaxed x of `relaxation` has the working dtype and `anderson`
+# keeps 2 * memory + 4 float64 copies of (x, u) i.e. 16 bytes per pixel each
+_RELAXATION_ARRAYS = 1
+_ANDERSON_BYTES_PER_PIXEL = 16
+_ANDERSON_COPIES = 4
+# astropy convolves in float64
+_ENL_BYTES_PER_PIXEL = 40
+# distance transform indices (int32 per dimension) and the nan mask
+_INTERPOLATE_BYTES_PER_PIXEL = 9
+
+STAGES = list(_DENOISER_BYTES_PER_PIXEL.keys()) + ['get_enl_img',
+                                                   'interpolate_nn']
+
+
+def _get_working_itemsize(dtype) -> int:
+    return np.log10(np.ones(1, dtype=dtype)).dtype.itemsize
+
+
+def estimate_peak_memory(stage: str,
+                         shape: Tuple[int, int],
+                         dtype: str = 'float32',
+                         regularizer: str = 'tv',
+                         mask: bool = False,
+                         acceleration: str = None,
+                         anderson_memory: int = 5,
+                         safety_factor: float = 1.25) -> int:
+    """
+    Estimate the peak memory (in bytes) allocated by one call of a stage on an
+    image of the given shape and dtype, excluding the input image itself.
+
+    The estimates are linear in the number of pixels and include the ADMM
+    state (x_k, z_k, u_k and their updates), the Newton temporaries, the
+    buffers of the acceleration scheme (e.g. the Anderson history) and the
+    internal buffers of the regularizer (e.g. the split-Bregman or BM3D
+    buffers). Memory allocated outside of numpy (e.g. by the BM3D binaries)
+    is not measured and is covered by `safety_factor`.
+
+    Parameters
+    ----------
+    stage : str
+        One of `admm_spatial_denoise`, `admm_ratio_denoise`, `midal_denoise`,
+        `get_enl_img` or `interpolate_nn`.
+    shape : Tuple[int, int]
+        The `(height, width)` of the image.
+    dtype : str
+        The dtype of the image. Default is `float32`.
+    regularizer : str
+        `tv` or `bm3d`; only used for the denoisers. Default is `tv`.
+    mask : bool
+        Whether a mask is passed to `get_enl_img`. Default is False.
+    acceleration : str
+        The `acceleration` of the denoisers (see `ADMMAccelerator`). Default
+        is None.
+    anderson_memory : int
+        The `memory` of the `anderson` acceleration. Default is 5.
+    safety_factor : float
+        The estimate is multiplied by this. Default is 1.25.
+
+    Returns
+    -------
+    int:
+        The estimated peak memory in bytes.
+    """
+    if stage not in STAGES:
+        raise ValueError(f'stage must be one of {STAGES}')
+    if acceleration not in ACCELERATIONS:
+        raise ValueError(f'acceleration must be one of {ACCELERATIONS}')
+    if acceleration is not None and stage not in _DENOISER_BYTES_PER_PIXEL:
+        raise ValueError('acceleration only applies to the denoisers')
+    itemsize = np.dtype(dtype).itemsize
+    working_itemsize = _get_working_itemsize(dtype)
+
+    if stage in _DENOISER_BYTES_PER_PIXEL:
+        if regularizer not in ['tv', 'bm3d']:
+            raise ValueError('regularizer must be tv or bm3d')
+        n_arrays, extra = _DENOISER_BYTES_PER_PIXEL[stage][regularizer]
+        if acceleration == 'relaxation':
+            n_arrays += _RELAXATION_ARRAYS
+        elif acceleration == 'anderson':
+            extra += (_ANDERSON_BYTES_PER_PIXEL *
+                      (2 * anderson_memory + _ANDERSON_COPIES))
+        bytes_per_pixel = n_arrays * working_itemsize + extra
+    elif stage == 'get_enl_img':
+        bytes_per_pixel = _ENL_BYTES_PER_PIXEL + (itemsize if mask else 0)
+    else:
+        # the output has the dtype of the input
+        bytes_per_pixel = _INTERPOLATE_BYTES_PER_PIXEL + 2 * itemsize
+
+    n_pixels = int(np.prod(shape))
+    return int(n_pixels * bytes_per_pixel * safety_factor)
+
+
+class ExecutionPlan(object):
+    """
+    How a stage is run on an image within a memory budget; returned by
+    `plan_execution` and run with `run_plan`. `print(plan)` reports the plan.
+
+    If `tile_size` is None, the image is processed in one call. For the
+    denoisers, `acceleration` and `anderson_memory` are those the memory was
+    planned for and are passed on by `run_plan`.
+    """
+
+    def __init__(self,
+                 stage: str,
+                 shape: Tuple[int, int],
+                 dtype: str,
+                 max_memory: int,
+                 tile_size: int,
+                 overlap: int,
+                 n_workers: int,
+                 peak_memory_per_tile: int,
+                 resident_memory: int,
+                 acceleration: str = None,
+                 anderson_memory: int = 5):
+        self.stage = stage
+        self.shape = tuple(shape)
+        self.dtype = str(np.dtype(dtype))
+        self.max_memory = max_memory
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.n_workers = n_workers
+        self.peak_memory_per_tile = peak_memory_per_tile
+        self.resident_memory = resident_memory
+        self.acceleration = acceleration
+        self.anderson_memory = anderson_memory
+
+    @property
+    def n_tiles(self) -> int:
+        if self.tile_size is None:
+            return 1
+        return len(self.get_tile_slices())
+
+    @property
+    def peak_memory(self) -> int:
+        """
+        Estimated peak memory of the whole run in bytes.
+        """
+        return (self.resident_memory +
+                self.n_workers * self.peak_memory_per_tile)
+
+    def get_tile_slices(self) -> list:
+        """
+        List of `(core_slices, halo_slices)` for each tile where the halo
+        slices include the overlap and are the ones passed to the stage; the
+        core slices are those written to the output.
+        """
+        height, width = self.shape
+        if self.tile_size is None:
+            full = (np.s_[0: height], np.s_[0: width])
+            return [(full, full)]
+        slices = []
+        for row in range(0, height, self.tile_size):
+            for col in range(0, width, self.tile_size):
+                row_stop = min(row + self.tile_size, height)
+                col_stop = min(col + self.tile_size, width)
+                core = (np.s_[row: row_stop], np.s_[col: col_stop])
+                halo = (np.s_[max(row - self.overlap, 0):
+                              min(row_stop + self.overlap, height)],
+                        np.s_[max(col - self.overlap, 0):
+                              min(col_stop + self.overlap, width)])
+                slices.append((core, halo))
+        return slices
+
+    def __repr__(self) -> str:
+        return (f'ExecutionPlan(stage={self.stage}, shape={self.shape}, '
+                f'tile_size={self.tile_size}, n_workers={self.n_workers})')
+
+    def __str__(self) -> str:
+        if self.tile_size is None:
+            tiling = 'none (one call)'
+        else:
+            tiling = (f'{self.tile_size} x {self.tile_size} + {self.overlap} '
+                      f'px overlap ({self.n_tiles} tiles)')
+        lines = [f'stage:               {self.stage}',
+                 f'image:               {self.shape[0]} x {self.shape[1]} '
+                 f'{self.dtype}',
+                 f'tiling:              {tiling}',
+                 f'workers:             {self.n_workers}',
+                 f'peak per tile (MB):  {self.peak_memory_per_tile / 1e6:.1f}',
+                 f'resident (MB):       {self.resident_memory / 1e6:.1f}',
+                 f'estimated peak (MB): {self.peak_memory / 1e6:.1f}',
+                 f'budget (MB):         {self.max_memory / 1e6:.1f}']
+        if self.acceleration is not None:
+            acceleration = self.acceleration
+            if acceleration == 'anderson':
+                acceleration += f' (memory {self.anderson_memory})'
+            lines.insert(4, f'acceleration:        {acceleration}')
+        return '\n'.join(lines)
+
+
+def plan_execution(stage: str,
+                   shape: Tuple[int, int],
+                   max_memory: int,
+                   dtype: str = 'float32',
+                   regularizer: str = 'tv',
+                   mask: bool = False,
+                   acceleration: str = None,
+                   anderson_memory: int = 5,
+                   overlap: int = 32,
+                   max_workers: int = None,
+                   min_tile_size: int = 256,
+                   safety_factor: float = 1.25) -> ExecutionPlan:
+    """
+    Choose the tile size and number of workers so that a stage run on an
+    image stays within `max_memory` bytes (see `estimate_peak_memory`).
+
+    The budget includes the input and output images held by the parent
+    process and the tiles in flight. If one call on the whole image fits in
+    the budget, the image is not tiled. Otherwise, we use as many workers as
+    possible (up to `max_workers`) such that the tiles are at least
+    `min_tile_size`, and the largest tile (a multiple of 64) that fits for
+    that many workers.
+
+    Tiles are processed with `overlap` pixels of context on each side. For the
+    denoisers, the result is then close to, but not identical to, that of the
+    whole image since the ADMM parameters adapt per tile. For `get_enl_img`,
+    an overlap of `window_size // 2` gives identical results. For
+    `interpolate_nn`, holes wider than the overlap are filled from within the
+    tile only.
+
+    Parameters
+    ----------
+    stage : str
+        See `estimate_peak_memory`.
+    shape : Tuple[int, int]
+        The `(height, width)` of the image.
+    max_memory : int
+        The memory budget in bytes.
+    dtype : str
+        The dtype of the image. Default is `float32`.
+    regularizer : str
+        `tv` or `bm3d`. Default is `tv`.
+    mask : bool
+        Whether a mask is passed to `get_enl_img`. Default is False.
+    acceleration : str
+        The `acceleration` the denoiser is run with; see
+        `estimate_peak_memory`. Default is None.
+    anderson_memory : int
+        The `memory` of the `anderson` acceleration. Default is 5.
+    overlap : int
+        The overlap of the tiles in pixels. Default is 32.
+    max_workers : int
+        The maximum number of processes. Default is None, which uses
+        `os.cpu_count()`.
+    min_tile_size : int
+        The smallest tile size used with more than one worker. Default is
+        256.
+    safety_factor : float
+        See `estimate_peak_memory`. Default is 1.25.
+
+    Returns
+    -------
+    ExecutionPlan:
+        The plan; raises a MemoryError if no plan fits in the budget.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    height, width = shape
+    itemsize = np.dtype(dtype).itemsize
+    working_itemsize = _get_working_itemsize(dtype)
+
+    def estimate(tile_shape):
+        return estimate_peak_memory(stage,
+                                    tile_shape,
+                                    dtype=dtype,
+                                    regularizer=regularizer,
+                                    mask=mask,
+                                    acceleration=acceleration,
+                                    anderson_memory=anderson_memory,
+                                    safety_factor=safety_factor)
+
+    # input and output images in the parent process
+    resident_memory = height * width * (itemsize + working_itemsize)
+    peak_memory_per_tile = estimate(shape)
+    if resident_memory + peak_memory_per_tile <= max_memory:
+        return ExecutionPlan(stage, shape, dtype, max_memory, None, 0, 1,
+                             peak_memory_per_tile, resident_memory,
+                             acceleration=acceleration,
+                             anderson_memory=anderson_memory)
+
+    bytes_per_pixel = estimate((1, 1)) or 1
+    for n_workers in range(max_workers, 0, -1):
+        # the parent holds the input and result of up to 2 tiles per worker
+        # (see `run_plan`); solve for the largest square tile that fits
+        per_worker = (max_memory - resident_memory) / n_workers
+        if per_worker <= 0:
+            break
+        tile_pixel_bytes = bytes_per_pixel + 2 * (itemsize + working_itemsize)
+        halo_size = int(np.sqrt(per_worker / tile_pixel_bytes))
+        tile_size = (halo_size - 2 * overlap) // 64 * 64
+        tile_size = min(tile_size, max(height, width))
+        if tile_size < 64 or (tile_size < min_tile_size and n_workers > 1):
+            continue
+        halo_shape = (min(tile_size + 2 * overlap, height),
+                      min(tile_size + 2 * overlap, width))
+        n_tiles = int(np.ceil(height / tile_size) * np.ceil(width / tile_size))
+        n_workers = min(n_workers, n_tiles)
+        tile_bytes = int(np.prod(halo_shape)) * (itemsize + working_itemsize)
+        return ExecutionPlan(stage,
+                             shape,
+                             dtype,
+                             max_memory,
+                             tile_size,
+                             overlap,
+                             n_workers,
+                             estimate(halo_shape),
+                             resident_memory + 2 * n_workers * tile_bytes,
+                             acceleration=acceleration,
+                             anderson_memory=anderson_memory)
+    raise MemoryError(f'{stage} on a {height} x {width} {dtype} image does '
+                      f'not fit in {max_memory / 1e6:.1f} MB')
+
+
+def _apply_to_tile(func: Callable, tile: np.ndarray, args: tuple,
+                   kwargs: dict) -> np.ndarray:
+    result = func(tile, *args, **kwargs)
+    # the denoisers return (img, residuals)
+    if isinstance(result, tuple):
+        result = result[0]
+    return result
+
+
+def _get_acceleration_kwargs(plan: ExecutionPlan, kwargs: dict) -> dict:
+    """
+    The keyword arguments of a denoiser with the acceleration of the plan.
+    """
+    kwargs = kwargs.copy()
+    acceleration = kwargs.get('acceleration', plan.acceleration)
+    if acceleration != plan.acceleration:
+        raise ValueError(f'The plan is for acceleration={plan.acceleration} '
+                         f'not {acceleration}')
+    if acceleration is None:
+        return kwargs
+    kwargs['acceleration'] = acceleration
+    if acceleration == 'anderson':
+        params = dict(kwargs.get('acceleration_params') or {})
+        if 'acceleration_params' not in kwargs:
+            params['memory'] = plan.anderson_memory
+        # the default memory of ADMMAccelerator is 5
+        memory = params.get('memory', 5)
+        if memory != plan.anderson_memory:
+            raise ValueError(f'The plan is for an Anderson memory of '
+                             f'{plan.anderson_memory} not {memory}')
+        kwargs['acceleration_params'] = params
+    return kwargs
+
+
+def run_plan(plan: ExecutionPlan,
+             func: Callable,
+             img: np.ndarray,
+             *args,
+             out: np.ndarray = None,
+             verbose: bool = False,
+             **kwargs) -> np.ndarray:
+    """
+    Run `func(tile, *args, **kwargs)` on the tiles of `img` according to the
+    plan and stitch the results (without the overlap). For the denoisers,
+    only the image is returned (not the residuals).
+
+    For example:
+
+        plan = plan_execution('admm_spatial_denoise', img.shape, 8e9,
+                              dtype=img.dtype, regularizer='bm3d')
+        img_d = run_plan(plan, admm_spatial_denoise, img, L, 'bm3d',
+                         {'weight': 1})
+
+    With more than one worker, `func` is run in a process pool and must be
+    picklable (e.g. a module level function); at most two tiles per worker
+    are in flight.
+
+    For the denoisers, the `acceleration` (and Anderson `memory`) of the plan
+    is passed to `func`; a ValueError is raised if `kwargs` specify a
+    different one, since the plan would not hold for it.
+
+    Parameters
+    ----------
+    plan : ExecutionPlan
+        From `plan_execution`.
+    func : Callable
+        The stage; the first argument is the image.
+    img : np.ndarray
+        The image (can be memory-mapped).
+    out : np.ndarray
+        The output array (can be memory-mapped). Default is None, which
+        allocates an array of the working dtype.
+    verbose : bool
+        Print the plan before running. Default is False; the plan can also be
+        reported with `print(plan)`.
+
+    Returns
+    -------
+    np.ndarray:
+        The stitched result.
+    """
+    if tuple(img.shape) != plan.shape:
+        raise ValueError('img shape does not match the plan')
+    if plan.stage in _DENOISER_BYTES_PER_PIXEL:
+        kwargs = _get_acceleration_kwargs(plan, kwargs)
+    if verbose:
+        print(plan)
+    if out is None:
+        dtype = np.log10(np.ones(1, dtype=img.dtype)).dtype
+        out = np.empty(img.shape, dtype=dtype)
+
+    def write_tile(result, core, halo):
+        core_in_halo = tuple(np.s_[c.start - h.start: c.stop - h.start]
+                             for c, h in zip(core, halo))
+        out[core] = result[core_in_halo]
+
+    tile_slices = plan.get_tile_slices()
+    if plan.n_workers == 1:
+        for core, halo in tile_slices:
+            result = _apply_to_tile(func, np.asarray(img[halo]), args, kwargs)
+            write_tile(result, core, halo)
+        return out
+
+    with ProcessPoolExecutor(max_workers=plan.n_workers) as executor:
+        pending = {}
+        for core, halo in tile_slices:
+            if len(pending) >= 2 * plan.n_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write_tile(future.result(), *pending.pop(future))
+            future = executor.submit(_apply_to_tile,
+                                     func,
+                                     np.asarray(img[halo]),
+                                     args,
+                                     kwargs)
+            pending[future] = (core, halo)
+        for future in pending:
+            write_tile(future.result(), *pending[future])
+    return out
@@ -0,0 +1,275 @@
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+import cProfile
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active_profiler = None
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError):
+    _PAGE_SIZE = 4096
+
+
+def profile_stage(name: str):
+    """
+    Decorator marking a function as a pipeline stage. When a
+    `PipelineProfiler` is active, each call is timed and attributed to the
+    stage `name`; otherwise the function is called directly.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active_profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _get_io_bytes() -> tuple:
+    """
+    (bytes read, bytes written) by the process so far including all threads.
+    Only available on Linux; otherwise (0, 0).
+    """
+    try:
+        with open('/proc/self/io') as f:
+            io_dict = dict(line.split(':') for line in f)
+    except (OSError, ValueError):
+        return 0, 0
+    return int(io_dict['rchar']), int(io_dict['wchar'])
+
+
+def _get_rss_mb() -> float:
+    """
+    Current resident set size of the process in MB from /proc/self/statm on
+    Linux. Elsewhere, the high-water mark of the resident set size, so that
+    differences are the growth of the process peak.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * _PAGE_SIZE / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return float('nan')
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+class PipelineProfiler(object):
+    """
+    Attributes time, I/O and memory to the stages of the RABASAR chain. The
+    library functions decorated with `profile_stage` (e.g. `interpolate_nn`,
+    `get_enl_img`, `get_enl_mode`, `get_temporal_average`,
+    `admm_spatial_denoise`, `admm_ratio_denoise`, reprojection and
+    reading/writing) are recorded automatically while the profiler is active:
+
+        with PipelineProfiler(profile_dir='prof') as profiler:
+            ...  # run the pipeline
+        print(profiler.summary())
+
+    User code can be attributed to a stage with `profiler.stage('name')`.
+
+    For each stage (nested stages are recorded under their parents) we record
+    the number of calls, wall time, CPU time, bytes read and written by the
+    process (from /proc/self/io on Linux; these include other threads) and
+    the peak RSS delta: the largest increase of the process resident set
+    size over its value at the start of a call. The RSS is sampled every
+    `rss_interval` seconds by a background thread (and at the start and end
+    of each call) so allocations freed within a shorter time can be missed;
+    it includes the memory of other threads.
+
+    Parameters
+    ----------
+    profile_dir : str
+        If specified, a profile of each outermost stage is dumped in this
+        directory when the profiler exits.
+    profiler : str
+        `cprofile` (dumps `<stage>.prof` for use with pstats/snakeviz) or
+        `pyinstrument` (dumps `<stage>.html`; requires pyinstrument). Default
+        is `cprofile`.
+    rss_interval : float
+        The RSS sampling interval in seconds. Default is 0.01.
+    """
+
+    def __init__(self,
+                 profile_dir: str = None,
+                 profiler: str = 'cprofile',
+                 rss_interval: float = 0.01):
+        if profiler not in ['cprofile', 'pyinstrument']:
+            raise ValueError('profiler must be cprofile or pyinstrument')
+        self.profile_dir = profile_dir
+        self.profiler = profiler
+        self.rss_interval = rss_interval
+        self.records = {}
+        self._profilers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # the peak RSS of each running call, updated by the sampler
+        self._rss_peaks = {}
+        self._stop_sampler = threading.Event()
+        self._sampler = None
+
+    def __enter__(self) -> 'PipelineProfiler':
+        global _active_profiler
+        _active_profiler = self
+        self._stop_sampler.clear()
+        self._sampler = threading.Thread(target=self._sample_rss,
+                                         daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *args):
+        global _active_profiler
+        _active_profiler = None
+        self._stop_sampler.set()
+        self._sampler.join()
+        if self.profile_dir is not None:
+            self.dump_profiles(self.profile_dir)
+
+    def _sample_rss(self):
+        while not self._stop_sampler.wait(self.rss_interval):
+            self._update_rss_peaks()
+
+    def _update_rss_peaks(self):
+        rss = _get_rss_mb()
+        with self._lock:
+            for key, peak in self._rss_peaks.items():
+                self._rss_peaks[key] = max(peak, rss)
+
+    def _get_stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = self._get_stack()
+        stack.append(name)
+        path = tuple(stack)
+
+        # Only one profiler can be active at a time so the detailed profiles
+        # are of the outermost stages of the main thread.
+        stage_profiler = None
+        is_main_thread = threading.current_thread() is threading.main_thread()
+        if (self.profile_dir is not None) and len(stack) == 1 \
+                and is_main_thread:
+            stage_profiler = self._start_stage_profiler(name)
+
+        rss_key = object()
+        rss_0 = _get_rss_mb()
+        with self._lock:
+            self._rss_peaks[rss_key] = rss_0
+        read_0, written_0 = _get_io_bytes()
+        cpu_0 = time.process_time()
+        wall_0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_0
+            cpu = time.process_time() - cpu_0
+            read_1, written_1 = _get_io_bytes()
+            self._update_rss_peaks()
+            if self.profiler == 'cprofile' and stage_profiler is not None:
+                stage_profiler.disable()
+            elif stage_profiler is not None:
+                stage_profiler.stop()
+            stack.pop()
+
+            with self._lock:
+                rss_delta = self._rss_peaks.pop(rss_key) - rss_0
+                record = self.records.setdefault(path,
+                                                 {'calls': 0,
+                                                  'wall': 0.,
+                                                  'cpu': 0.,
+                                                  'read_bytes': 0,
+                                                  'written_bytes': 0,
+                                                  'peak_rss_delta_mb': 0.})
+                record['calls'] += 1
+                record['wall'] += wall
+                record['cpu'] += cpu
+                record['read_bytes'] += read_1 - read_0
+                record['written_bytes'] += written_1 - written_0
+                record['peak_rss_delta_mb'] = max(
+                                                record['peak_rss_delta_mb'],
+                                                rss_delta)
+
+    def _start_stage_profiler(self, name: str):
+        if self.profiler == 'cprofile':
+            if name not in self._profilers:
+                self._profilers[name] = cProfile.Profile()
+            stage_profiler = self._profilers[name]
+            stage_profiler.enable()
+        else:
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ImportError('pyinstrument is required for '
+                                  'profiler=\'pyinstrument\'')
+            stage_profiler = Profiler()
+            self._profilers.setdefault(name, []).append(stage_profiler)
+            stage_profiler.start()
+        return stage_profiler
+
+    def dump_profiles(self, profile_dir: str):
+        """
+        Write the profiles of the outermost stages to profile_dir.
+        """
+        profile_dir = Path(profile_dir)
+        profile_dir.mkdir(exist_ok=True, parents=True)
+        for name, stage_profilers in self._profilers.items():
+            if self.profiler == 'cprofile':
+                stage_profilers.dump_stats(str(profile_dir / f'{name}.prof'))
+            else:
+                html = '\n'.join(p.output_html() for p in stage_profilers)
+                (profile_dir / f'{name}.html').write_text(html)
+
+    def _get_self_wall(self, path: tuple) -> float:
+        children_wall = sum(record['wall']
+                            for child, record in self.records.items()
+                            if len(child) == len(path) + 1
+                            and child[:-1] == path)
+        return max(self.records[path]['wall'] - children_wall, 0)
+
+    def summary(self) -> str:
+        """
+        A table of the stages with nested stages indented under their parents.
+        """
+        header = (f'{"stage":<40} {"calls":>6} {"wall (s)":>10} '
+                  f'{"self (s)":>10} {"cpu (s)":>10} {"read (MB)":>10} '
+                  f'{"write (MB)":>10} {"peak RSS delta (MB)":>20}')
+        lines = [header, '-' * len(header)]
+        for path in sorted(self.records):
+            record = self.records[path]
+            name = '  ' * (len(path) - 1) + path[-1]
+            lines.append(f'{name:<40} {record["calls"]:>6} '
+                         f'{record["wall"]:>10.3f} '
+                         f'{self._get_self_wall(path):>10.3f} '
+                         f'{record["cpu"]:>10.3f} '
+                         f'{record["read_bytes"] / 1e6:>10.1f} '
+                         f'{record["written_bytes"] / 1e6:>10.1f} '
+                         f'{record["peak_rss_delta_mb"]:>20.1f}')
+        return '\n'.join(lines)
+
+    def to_collapsed_stacks(self) -> str:
+        """
+        The self wall time (ms) of each stage in the "collapsed stack" format
+        (`parent;child value`) used by flamegraph.pl and speedscope.
+        """
+        return '\n'.join(f'{";".join(path)} '
+                         f'{int(round(self._get_self_wall(path) * 1000))}'
+                         for path in sorted(self.records))
@@ -0,0 +1,291 @@
+from pathlib import Path
+from typing import Tuple, Union
+import time
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from .profiling import profile_stage
+
+# the encoding is recorded in the tags so reads can decode transparently
+ENCODING_TAG = 'RABASAR_ENCODING'
+UINT16_DB = 'uint16_db'
+
+
+def get_db_scale_offset(db_min: float = -50,
+                        db_max: float = 15) -> Tuple[float, float]:
+    """
+    The (scale, offset) so that `code * scale + offset` is the dB value of
+    the uint16 code, where the codes 1 - 65535 span [db_min, db_max] and 0 is
+    nodata. The step is ~0.001 dB for the default range.
+    """
+    scale = (db_max - db_min) / 65534
+    return scale, db_min - scale
+
+
+def encode_db_uint16(img: np.ndarray,
+                     db_min: float = -50,
+                     db_max: float = 15) -> np.ndarray:
+    """
+    Quantize a linear-scale backscatter image to uint16 dB codes (see
+    `get_db_scale_offset`). Values outside [db_min, db_max] are clipped and
+    np.nan and non-positive values are nodata (0).
+    """
+    scale, offset = get_db_scale_offset(db_min, db_max)
+    valid = np.isfinite(img) & (img > 0)
+    db = np.full(img.shape, db_min, dtype=np.float64)
+    np.log10(img, out=db, where=valid)
+    np.multiply(db, 10, out=db, where=valid)
+    np.clip(db, db_min, db_max, out=db)
+    codes = np.rint((db - offset) / scale).astype(np.uint16)
+    codes[~valid] = 0
+    return codes
+
+
+def decode_db_uint16(codes: np.ndarray,
+                     scale: float,
+                     offset: float,
+                     linear: bool = True) -> np.ndarray:
+    """
+    Decode uint16 dB codes into float32 linear-scale (or dB) values with
+    np.nan as nodata.
+    """
+    db = codes.astype(np.float32)
+    db *= np.float32(scale)
+    db += np.float32(offset)
+    if linear:
+        db /= 10
+        np.power(np.float32(10), db, out=db)
+    db[codes == 0] = np.nan
+    return db
+
+
+def is_quantized(ds: rasterio.io.DatasetReader) -> bool:
+    return ds.tags().get(ENCODING_TAG) == UINT16_DB
+
+
+def decode_dataset_array(ds: rasterio.io.DatasetReader,
+                         arr: np.ndarray,
+                         indexes: Union[int, list] = None,
+                         linear: bool = True) -> np.ndarray:
+    """
+    Decode an array read from `ds` (the bands `indexes` as in
+    `rasterio.DatasetReader.read`) if it is a quantized product (see
+    `write_quantized`); otherwise return it unchanged.
+    """
+    if not is_quantized(ds):
+        return arr
+    if isinstance(indexes, int):
+        return decode_db_uint16(arr,
+                                ds.scales[indexes - 1],
+                                ds.offsets[indexes - 1],
+                                linear=linear)
+    indexes = range(1, ds.count + 1) if indexes is None else indexes
+    return np.stack([decode_db_uint16(band,
+                                      ds.scales[index - 1],
+                                      ds.offsets[index - 1],
+                                      linear=linear)
+                     for band, index in zip(arr, indexes)])
+
+
+def read_dataset(ds: rasterio.io.DatasetReader,
+                 indexes: Union[int, list] = None,
+                 linear: bool = True,
+                 **read_kwargs) -> np.ndarray:
+    """
+    `ds.read(indexes, **read_kwargs)` (e.g. with `window` or `out_shape`)
+    with quantized products decoded to float32 linear-scale (or dB) values.
+    The readers of the package (`GeoArray.from_file`, `read_window(s)`,
+    `read_product`, the temporal statistics and the quicklooks) read through
+    this function so that quantized products can be used wherever float32
+    products are.
+    """
+    arr = ds.read(indexes, **read_kwargs)
+    return decode_dataset_array(ds, arr, indexes=indexes, linear=linear)
+
+
+def get_decoded_profile(ds: rasterio.io.DatasetReader) -> dict:
+    """
+    The profile of the decoded (float32) data of `ds`.
+    """
+    profile = ds.profile
+    if is_quantized(ds):
+        profile.update({'dtype': 'float32', 'nodata': np.nan})
+        for key in ['predictor', 'compress', 'tiled', 'blockxsize',
+                    'blockysize']:
+            profile.pop(key, None)
+    return profile
+
+
+@profile_stage('write_quantized')
+def write_quantized(img: np.ndarray,
+                    profile: dict,
+                    dest_path: str,
+                    db_min: float = -50,
+                    db_max: float = 15,
+                    tile_size: int = 512,
+                    compress: str = 'deflate') -> str:
+    """
+    Write a linear-scale backscatter image (2d or `(bands, height, width)`)
+    as a compact uint16 dB product: tiled, compressed (with horizontal
+    differencing) GeoTiff with the GDAL scale/offset set, 0 as nodata and the
+    encoding recorded in the tags. The quantization error is at most half a
+    step (~0.0005 dB for the default range).
+
+    The readers of the package (see `read_dataset`) decode it transparently
+    to float32 linear-scale values.
+
+    Parameters
+    ----------
+    img : np.ndarray
+        The linear-scale image with np.nan as nodata.
+    profile : dict
+        The profile of img.
+    dest_path : str
+        The GeoTiff path.
+    db_min : float
+        The lowest representable dB value. Default is -50.
+    db_max : float
+        The highest representable dB value. Default is 15.
+    tile_size : int
+        The block size; multiple of 16. Default is 512.
+    compress : str
+        The compression. Default is `deflate`.
+
+    Returns
+    -------
+    str:
+        dest_path
+    """
+    img = img if img.ndim == 3 else img[np.newaxis, ...]
+    scale, offset = get_db_scale_offset(db_min, db_max)
+    profile = profile.copy()
+    profile.update({'driver': 'GTiff',
+                    'count': img.shape[0],
+                    'dtype': 'uint16',
+                    'nodata': 0,
+                    'tiled': True,
+                    'blockxsize': tile_size,
+                    'blockysize': tile_size,
+                    'compress': compress,
+                    'predictor': 2})
+    with rasterio.open(dest_path, 'w', **profile) as ds:
+        ds.scales = (scale,) * img.shape[0]
+        ds.offsets = (offset,) * img.shape[0]
+        ds.update_tags(**{ENCODING_TAG: UINT16_DB, 'units': 'dB'})
+        ds.write(encode_db_uint16(img, db_min, db_max))
+    return dest_path
+
+
+@profile_stage('read_product')
+def read_product(path: str,
+                 window: Window = None,
+                 indexes: int = 1,
+                 linear: bool = True) -> Tuple[np.ndarray, dict]:
+    """
+    Read a product written either as float32 or with `write_quantized`;
+    quantized products are decoded to float32 linear-scale values (or dB if
+    `linear` is False).
+
+    Parameters
+    ----------
+    path : str
+        The raster.
+    window : Window
+        If specified, only this window is read.
+    indexes : int
+        The band(s) to read as in `rasterio.DatasetReader.read`. Default is
+        1.
+    linear : bool
+        Decode quantized products to linear scale. Default is True.
+
+    Returns
+    -------
+    Tuple[np.ndarray, dict]:
+        (array, profile of the decoded array)
+    """
+    with rasterio.open(path) as ds:
+        arr = read_dataset(ds, indexes, linear=linear, window=window)
+        profile = get_decoded_profile(ds)
+        if window is not None:
+            profile.update({'height': arr.shape[-2],
+                            'width': arr.shape[-1],
+                            'transform': ds.window_transform(window)})
+    return arr, profile
+
+
+def benchmark_quantized_storage(img: np.ndarray,
+                                profile: dict,
+                                out_dir: str,
+                                n_reads: int = 3,
+                                db_min: float = -50,
+                                db_max: float = 15,
+                                compress: str = 'deflate') -> dict:
+    """
+    Compare the float32 GeoTiff currently written by the pipeline with the
+    uint16 dB product (see `write_quantized`) on one image: the bytes on
+    disk, the read throughput (decoded megapixels per second, best of
+    `n_reads`) and the quantization error in dB.
+
+    Parameters
+    ----------
+    img : np.ndarray
+        A representative 2d linear-scale image.
+    profile : dict
+        The profile of img.
+    out_dir : str
+        Directory for the two test files.
+    n_reads : int
+        The number of timed reads. Default is 3.
+    db_min : float
+        See `write_quantized`.
+    db_max : float
+        See `write_quantized`.
+    compress : str
+        The compression of both files. Default is `deflate`.
+
+    Returns
+    -------
+    dict:
+        `{'float32': {...}, 'uint16_db': {...}}` with the keys `bytes`,
+        `read_mpix_per_s`, `max_abs_error_db` and `mean_abs_error_db`.
+    """
+    Path(out_dir).mkdir(exist_ok=True, parents=True)
+    float_path = str(Path(out_dir) / 'benchmark_float32.tif')
+    quantized_path = str(Path(out_dir) / 'benchmark_uint16_db.tif')
+
+    float_profile = profile.copy()
+    float_profile.update({'driver': 'GTiff',
+                          'count': 1,
+                          'dtype': 'float32',
+                          'nodata': np.nan,
+                          'tiled': True,
+                          'blockxsize': 512,
+                          'blockysize': 512,
+                          'compress': compress})
+    with rasterio.open(float_path, 'w', **float_profile) as ds:
+        ds.write(img.astype(np.float32), 1)
+    write_quantized(img,
+                    profile,
+                    quantized_path,
+                    db_min=db_min,
+                    db_max=db_max,
+                    compress=compress)
+
+    valid = np.isfinite(img) & (img > 0)
+    db_true = 10 * np.log10(np.clip(img[valid], 10 ** (db_min / 10),
+                                    10 ** (db_max / 10)))
+    results = {}
+    for name, path in [('float32', float_path),
+                       ('uint16_db', quantized_path)]:
+        read_times = []
+        for _ in range(n_reads):
+            start = time.perf_counter()
+            arr, _ = read_product(path)
+            read_times.append(time.perf_counter() - start)
+        error = np.abs(10 * np.log10(arr[valid].astype(np.float64)) -
+                       db_true)
+        results[name] = {'bytes': Path(path).stat().st_size,
+                         'read_mpix_per_s': img.size / min(read_times) / 1e6,
+                         'max_abs_error_db': float(error.max()),
+                         'mean_abs_error_db': float(error.mean())}
+    return results
@@ -0,0 +1,383 @@
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Tuple
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.shutil import copy as rio_copy
+from rasterio.windows import Window
+from .nd_tools import StreamingHistogram
+from .profiling import profile_stage
+from .quantize import read_dataset
+
+
+def get_rgb_bands(hh: np.ndarray,
+                  hv: np.ndarray,
+                  vv: np.ndarray = None) -> np.ndarray:
+    """
+    The RGB composite from the CEOS SAR interpretation guide. If `vv` is
+    provided (e.g. UAVSAR):
+
+        Red = HH, Green = HV, Blue = VV
+
+    otherwise (e.g. ALOS-1):
+
+        Red = HH, Green = HV, Blue = HH/HV
+
+    Parameters
+    ----------
+    hh : np.ndarray
+        Linear-scale HH backscatter.
+    hv : np.ndarray
+        Linear-scale HV backscatter.
+    vv : np.ndarray
+        Linear-scale VV backscatter. Default is None.
+
+    Returns
+    -------
+    np.ndarray:
+        The unscaled `(3, height, width)` composite.
+    """
+    if vv is None:
+        blue = hh / np.clip(hv, 1e-3, 1)
+    else:
+        blue = vv
+    return np.stack([hh, hv, blue], axis=0)
+
+
+def get_rgb_percentile_bounds(hh_paths: list,
+                              hv_paths: list,
+                              vv_paths: list = None,
+                              percentiles: Tuple[float, float] = (2, 98),
+                              decimation: int = 8) -> np.ndarray:
+    """
+    Robust lower and upper bounds for each channel of the RGB composites of a
+    time series, computed once for the whole stack so all dates are scaled
+    the same way. The percentiles are estimated from reads decimated by
+    `decimation` in each dimension (GDAL uses overviews if they exist), so
+    only a fraction of each image is decoded, and accumulated in a
+    `StreamingHistogram` per channel.
+
+    Parameters
+    ----------
+    hh_paths : list
+        Paths of the HH images.
+    hv_paths : list
+        Paths of the HV images.
+    vv_paths : list
+        Paths of the VV images. Default is None.
+    percentiles : Tuple[float, float]
+        The lower and upper percentiles. Default is (2, 98).
+    decimation : int
+        The decimation factor of the sampled reads. Default is 8.
+
+    Returns
+    -------
+    np.ndarray:
+        The `(3, 2)` array of (lower, upper) bounds per channel.
+    """
+    vv_paths = vv_paths or [None] * len(hh_paths)
+    histograms = [StreamingHistogram() for _ in range(3)]
+    for hh_path, hv_path, vv_path in zip(hh_paths, hv_paths, vv_paths):
+        bands = [_read_decimated(path, decimation)
+                 for path in [hh_path, hv_path, vv_path] if path is not None]
+        rgb = get_rgb_bands(*bands)
+        for histogram, channel in zip(histograms, rgb):
+            histogram.update(channel)
+    return np.array([histogram.percentile(percentiles)
+                     for histogram in histograms])
+
+
+def _read_decimated(path: str, decimation: int) -> np.ndarray:
+    with rasterio.open(path) as ds:
+        out_shape = (max(ds.height // decimation, 1),
+                     max(ds.width // decimation, 1))
+        return read_dataset(ds,
+                            1,
+                            out_shape=out_shape,
+                            resampling=Resampling.nearest).astype(np.float64)
+
+
+def scale_rgb_to_uint8(rgb: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """
+    Linearly scale each channel from its (lower, upper) bounds to 1 - 255
+    (clipping outside the bounds) and reserve 0 for nodata (np.nan).
+
+    Parameters
+    ----------
+    rgb : np.ndarray
+        The `(3, height, width)` composite.
+    bounds : np.ndarray
+        The `(3, 2)` bounds e.g. from `get_rgb_percentile_bounds`.
+
+    Returns
+    -------
+    np.ndarray:
+        The uint8 composite.
+    """
+    lower = bounds[:, 0].reshape(3, 1, 1)
+    upper = bounds[:, 1].reshape(3, 1, 1)
+    scaled = (rgb - lower) / np.maximum(upper - lower, 1e-12)
+    np.clip(scaled, 0, 1, out=scaled)
+    scaled = scaled * 254 + 1
+    nodata_mask = np.isnan(rgb).any(axis=0)
+    scaled[:, nodata_mask] = 0
+    return scaled.astype(np.uint8)
+
+
+@profile_stage('write_rgb_cog')
+def write_rgb_cog(hh_path: str,
+                  hv_path: str,
+                  dest_path: str,
+                  bounds: np.ndarray,
+                  vv_path: str = None,
+                  tile_size: int = 512,
+                  overview_levels: list = None,
+                  compress: str = 'deflate') -> str:
+    """
+    Write the uint8 RGB composite of one date as a Cloud Optimized GeoTiff
+    with overviews. The composite is computed and written tile by tile, so
+    only one `tile_size x tile_size` tile of each polarization is in memory.
+
+    Parameters
+    ----------
+    hh_path : str
+        Path of the HH image.
+    hv_path : str
+        Path of the HV image.
+    dest_path : str
+        The path of the COG.
+    bounds : np.ndarray
+        The `(3, 2)` scaling bounds e.g. from `get_rgb_percentile_bounds`.
+    vv_path : str
+        Path of the VV image. Default is None.
+    tile_size : int
+        The tile (and block) size. Must be a multiple of 16. Default is 512.
+    overview_levels : list
+        The overview decimation factors. Default is [2, 4, 8, 16, 32].
+    compress : str
+        The GeoTiff compression. Default is `deflate`.
+
+    Returns
+    -------
+    str:
+        dest_path
+    """
+    overview_levels = overview_levels or [2, 4, 8, 16, 32]
+    paths = [p for p in [hh_path, hv_path, vv_path] if p is not None]
+    srcs = [rasterio.open(p) for p in paths]
+    try:
+        profile = srcs[0].profile
+        profile.update({'driver': 'GTiff',
+                        'count': 3,
+                        'dtype': 'uint8',
+                        'nodata': 0,
+                        'tiled': True,
+                        'blockxsize': tile_size,
+                        'blockysize': tile_size,
+                        'compress': compress})
+        height, width = profile['height'], profile['width']
+
+        # overviews are built in a temporary tiff that is then copied into
+        # the COG layout (overviews after the full resolution data); it is
+        # removed with its directory also if writing fails
+        with tempfile.TemporaryDirectory(
+                dir=str(Path(dest_path).parent)) as tmp_dir:
+            tmp_path = os.path.join(tmp_dir, 'rgb.tif')
+            with rasterio.open(tmp_path, 'w', **profile) as dst:
+                for row in range(0, height, tile_size):
+                    for col in range(0, width, tile_size):
+                        window = Window(col,
+                                        row,
+                                        min(tile_size, width - col),
+                                        min(tile_size, height - row))
+                        bands = [read_dataset(src, 1, window=window)
+                                 .astype(np.float64) for src in srcs]
+                        rgb = get_rgb_bands(*bands)
+                        dst.write(scale_rgb_to_uint8(rgb, bounds),
+                                  window=window)
+                dst.build_overviews(overview_levels, Resampling.average)
+            rio_copy(tmp_path,
+                     dest_path,
+                     driver='GTiff',
+                     copy_src_overviews=True,
+                     tiled=True,
+                     blockxsize=tile_size,
+                     blockysize=tile_size,
+                     compress=compress)
+    finally:
+        for src in srcs:
+            src.close()
+    return dest_path
+
+
+def write_rgb_png(cog_path: str,
+                  dest_path: str,
+                  max_size: int = 1024) -> str:
+    """
+    Write a reduced resolution PNG quicklook of an RGB COG. The read uses the
+    COG overviews so it is cheap.
+
+    Parameters
+    ----------
+    cog_path : str
+        Path of the uint8 RGB COG.
+    dest_path : str
+        The path of the PNG.
+    max_size : int
+        The maximum width/height of the PNG. Default is 1024.
+
+    Returns
+    -------
+    str:
+        dest_path
+    """
+    with rasterio.open(cog_path) as ds:
+        factor = max(ds.height / max_size, ds.width / max_size, 1)
+        out_shape = (3,
+                     max(int(ds.height / factor), 1),
+                     max(int(ds.width / factor), 1))
+        rgb = ds.read(out_shape=out_shape, resampling=Resampling.average)
+
+    profile = {'driver': 'PNG',
+               'dtype': 'uint8',
+               'count': 3,
+               'height': out_shape[1],
+               'width': out_shape[2]}
+    # the PNG is a browse image and deliberately carries no georeferencing
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', NotGeoreferencedWarning)
+        with rasterio.open(dest_path, 'w', **profile) as dst:
+            dst.write(rgb)
+    return dest_path
+
+
+def _make_one_quicklook(hh_path: str,
+                        hv_path: str,
+                        vv_path: str,
+                        out_dir: str,
+                        bounds: np.ndarray,
+                        tile_size: int,
+                        png_max_size: int) -> Tuple[str, str]:
+    name = Path(hh_path).stem + '_rgb'
+    cog_path = write_rgb_cog(hh_path,
+                             hv_path,
+                             str(Path(out_dir) / f'{name}.tif'),
+                             bounds,
+                             vv_path=vv_path,
+                             tile_size=tile_size)
+    png_path = write_rgb_png(cog_path,
+                             str(Path(out_dir) / f'{name}.png'),
+                             max_size=png_max_size)
+    return cog_path, png_path
+
+
+def make_rgb_quicklooks(hh_paths: list,
+                        hv_paths: list,
+                        out_dir: str,
+                        vv_paths: list = None,
+                        percentiles: Tuple[float, float] = (2, 98),
+                        tile_size: int = 512,
+                        png_max_size: int = 1024,
+                        gif_path: str = None,
+                        gif_duration: int = 500,
+                        n_workers: int = 4) -> list:
+    """
+    Make the browse products of a time series: for each date a uint8 RGB COG
+    (see `write_rgb_cog`) and a reduced resolution PNG, using the same
+    percentile scaling for the whole stack (see `get_rgb_percentile_bounds`).
+    The dates are processed in parallel with `n_workers` processes.
+    Optionally, the PNGs are assembled into an animated GIF (requires
+    Pillow).
+
+    Parameters
+    ----------
+    hh_paths : list
+        Paths of the HH images ordered by date.
+    hv_paths : list
+        Paths of the HV images ordered by date.
+    out_dir : str
+        Directory of the outputs; the files are named after the HH images.
+    vv_paths : list
+        Paths of the VV images. Default is None, which uses HH/HV as blue.
+    percentiles : Tuple[float, float]
+        The lower and upper scaling percentiles. Default is (2, 98).
+    tile_size : int
+        The tile size of the COGs. Default is 512.
+    png_max_size : int
+        The maximum width/height of the PNGs. Default is 1024.
+    gif_path : str
+        If specified, write an animated GIF of the PNGs here.
+    gif_duration : int
+        Duration of each GIF frame in milliseconds. Default is 500.
+    n_workers : int
+        The number of processes. Default is 4.
+
+    Returns
+    -------
+    list:
+        List of (cog_path, png_path) for each date.
+    """
+    Path(out_dir).mkdir(exist_ok=True, parents=True)
+    vv_paths = vv_paths or [None] * len(hh_paths)
+    bounds = get_rgb_percentile_bounds(hh_paths,
+                                       hv_paths,
+                                       vv_paths,
+                                       percentiles=percentiles)
+
+    n = len(hh_paths)
+    args = (hh_paths,
+            hv_paths,
+            vv_paths,
+            [str(out_dir)] * n,
+            [bounds] * n,
+            [tile_size] * n,
+            [png_max_size] * n)
+    if n_workers == 1:
+        results = list(map(_make_one_quicklook, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_make_one_quicklook, *args))
+
+    if gif_path is not None:
+        write_gif([png_path for _, png_path in results],
+                  gif_path,
+                  duration=gif_duration)
+    return results
+
+
+def write_gif(png_paths: list, dest_path: str, duration: int = 500) -> str:
+    """
+    Assemble PNG quicklooks into an animated GIF. Requires Pillow.
+
+    Parameters
+    ----------
+    png_paths : list
+        The PNGs in order; should have the same dimensions.
+    dest_path : str
+        The path of the GIF.
+    duration : int
+        Duration of each frame in milliseconds. Default is 500.
+
+    Returns
+    -------
+    str:
+        dest_path
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError('Writing GIFs requires Pillow; '
+                          'install with `pip install pillow`')
+
+    frames = [Image.open(path).convert('RGB') for path in png_paths]
+    frames[0].save(dest_path,
+                   save_all=True,
+                   append_images=frames[1:],
+                   duration=duration,
+                   loop=0)
+    return dest_path
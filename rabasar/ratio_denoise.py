@@ -1,11 +1,11 @@
-from skimage.restoration import denoise_tv_bregman
 import numpy as np
-from numpy.linalg import norm
 import scipy
-from tqdm import tqdm
-import bm3d
+from .admm import get_denoiser, run_admm
+from .kernels import _newton_step_numpy, admm_likelihood_update
+from .profiling import profile_stage
 
 
+@profile_stage('admm_ratio_denoise')
 def admm_ratio_denoise(img: np.ndarray,
                        L: float,
                        Lm: float,
@@ -15,15 +15,20 @@ def admm_ratio_denoise(img: np.ndarray,
                        newton_iterations: int = 3,
                        denoiser_iterations: int = 10,
                        x_init: np.ndarray = None,
-                       convergence_crit: float = 1e-5) -> np.ndarray:
+                       convergence_crit: float = 1e-5,
+                       checkpoint_path: str = None,
+                       checkpoint_every: int = 1,
+                       checkpoint_interval: float = None,
+                       acceleration: str = None,
+                       acceleration_params: dict = None,
+                       newton_tol: float = None) -> np.ndarray:
     """
     We use the variables using Boyd's ADMM review article in [1].
 
     This is essentially the same implementation as the `admm_spatial_denoise`
     in `spatial_denoise.py` save for the likelihood function used for the noise
-    model as noted in the Rabasar paper [2] and some initialization. It may be
-    good to combine them using the common implementations, but for clarity we
-    leave them separat.
+    model as noted in the Rabasar paper [2] and some initialization; both run
+    the ADMM loop of `run_admm`.
 
     [1] https://stanford.edu/~boyd/papers/pdf/admm_distr_stats.pdf
     [2] https://hal.archives-ouvertes.fr/hal-01791355v2
@@ -63,6 +68,29 @@ def admm_ratio_denoise(img: np.ndarray,
     convergence_crit : float
         The value for the sum of the residuals to be smaller than and to stop
         ADMM. Default = 1e-5
+    checkpoint_path : str
+        If specified, the ADMM state is checkpointed in this directory (see
+        `ADMMCheckpointer`) and, if a checkpoint of the same run exists, the
+        iterations are resumed from it. Default is None.
+    checkpoint_every : int
+        Checkpoint every `checkpoint_every` ADMM iterations; the last
+        iteration is always checkpointed. Default is 1.
+    checkpoint_interval : float
+        If specified, checkpoint at most every `checkpoint_interval` seconds
+        (in addition to `checkpoint_every`; see `ADMMCheckpointer`).
+    acceleration : str
+        The acceleration scheme of the ADMM iterations: None (the default
+        beta heuristic), `relaxation`, `anderson` or `residual_balancing`
+        (see `ADMMAccelerator`). Default is None.
+    acceleration_params : dict
+        Keyword arguments of `ADMMAccelerator` e.g. `{'alpha': 1.5}` for
+        `relaxation`. Default is None.
+    newton_tol : float
+        If specified, the Newton iterations of each pixel stop once its step
+        is at most `newton_tol` (log10 scale) and `newton_iterations` is the
+        maximum; only the pixels that have not converged are updated (see
+        `admm_likelihood_update`). Default is None, which always takes
+        `newton_iterations` steps.
 
     Returns
     -------
@@ -70,11 +98,6 @@ def admm_ratio_denoise(img: np.ndarray,
        Denoised Image
     """
 
-    eta = 0.95
-    gamma = 1.05
-    block_diff = block_diff_old = np.inf
-    block_diff_list = []
-
     # Log
     img_db = np.log10(img)
 
@@ -84,70 +107,47 @@ def admm_ratio_denoise(img: np.ndarray,
     var = float(scipy.special.polygamma(1, L))
     beta = (1 + 2/L + 2/Lm) / var
 
-    ################
-    # Denoiser Setup
-    ################
-
-    if regularizer == 'tv':
-        lamb_param = regularizer_params['weight']
-        isotropic = regularizer_params.get('isotropic', True)
-
-        def denoiser(X, lamb):
-            return denoise_tv_bregman(X,
-                                      lamb,
-                                      max_iter=denoiser_iterations,
-                                      isotropic=isotropic)
-    elif regularizer == 'bm3d':
-        lamb_param = regularizer_params['weight']
-
-        def denoiser(X, lamb):
-            return bm3d.bm3d(X, lamb)
-    else:
-        pass
-
-    ###############################
-    # Begin Plug and Play ADMM Loop
-    ###############################
-
-    if x_init is None:
-        x_k = img_db.copy()
-    else:
-        x_k = x_init.copy()
-    z_k = denoiser(x_k, lamb_param)
-    u_k = z_k - x_k
-
-    for k in tqdm(range(max_admm_iterations), desc='admm_iterations'):
-
-        z_kp1 = denoiser(x_k - u_k, (lamb_param * beta))
-        u_kp1 = u_k + z_kp1 - x_k
-
-        x_kp1 = x_k.copy()
-        for i in range(newton_iterations):
-            x_kp1 = ratio_lklhd_iter(x_kp1, z_kp1 + u_kp1, img_db, L, Lm, beta)
-
-        # Not sure about this, but plug and play?
-        block_diff = (norm(x_k - x_kp1) +
-                      norm(u_k - u_kp1) +
-                      norm(z_k - z_kp1)
-                      )
-        if block_diff > eta * block_diff_old:
-            beta = gamma * beta
-        z_k = z_kp1
-        u_k = u_kp1
-        x_k = x_kp1
-        block_diff_old = block_diff
-        block_diff_list.append(block_diff)
-
-        if block_diff < convergence_crit:
-            break
+    denoiser, lamb_param = get_denoiser(regularizer,
+                                        regularizer_params,
+                                        denoiser_iterations)
+
+    def likelihood_update(x_k, u_k, z_kp1, z_k, beta, x_relaxed):
+        return admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db, L, beta,
+                                      newton_iterations,
+                                      newton_tol=newton_tol,
+                                      Lm=Lm,
+                                      x_relaxed=x_relaxed)
+
+    run_params = {'L': L,
+                  'Lm': Lm,
+                  'regularizer': regularizer,
+                  'regularizer_params': regularizer_params,
+                  'newton_iterations': newton_iterations,
+                  'newton_tol': newton_tol,
+                  'denoiser_iterations': denoiser_iterations,
+                  'acceleration': acceleration,
+                  'acceleration_params': acceleration_params}
+    x_k, block_diff_list = run_admm(img_db,
+                                    likelihood_update,
+                                    denoiser,
+                                    lamb_param,
+                                    beta,
+                                    max_admm_iterations=max_admm_iterations,
+                                    convergence_crit=convergence_crit,
+                                    x_init=x_init,
+                                    checkpoint_path=checkpoint_path,
+                                    checkpoint_every=checkpoint_every,
+                                    checkpoint_interval=checkpoint_interval,
+                                    run_params=run_params,
+                                    acceleration=acceleration,
+                                    acceleration_params=acceleration_params)
 
     return np.power(10, x_k), block_diff_list
 
 
 def ratio_lklhd_iter(x_k, a_k, img, L, Lm, beta):
-    exp_diff = np.exp(img - x_k)
-    c = (Lm + L) * exp_diff / (Lm + L * exp_diff)
-    numer = beta * (x_k - a_k) + L * (1 - c)
-    denom = beta + L * c * (1 - L / (Lm + L) * c)
-    x_kp1 = x_k - numer / denom
-    return x_kp1
+    """
+    One Newton step of the x update of `admm_ratio_denoise` towards `a_k`
+    (all log10 scale); the same step as in `admm_likelihood_update`.
+    """
+    return _newton_step_numpy(x_k, a_k, img, L, Lm, beta)
@@ -2,20 +2,164 @@ from rasterio.warp import (calculate_default_transform,
                            reproject,
                            Resampling,
                            aligned_target)
+from rasterio.crs import CRS
 from rasterio.transform import xy
+from rasterio.windows import Window, from_bounds
 from affine import Affine
+import rasterio
 from rasterio import features
 from rasterio.features import shapes
 import numpy as np
 import fiona
-from typing import Union, Tuple
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import chain, islice
+from pathlib import Path
+import pickle
+import tempfile
+import threading
+from typing import Iterable, Iterator, Union, Tuple
+from .profiling import profile_stage
+from .quantize import get_decoded_profile, read_dataset
+
+
+def _polygonize_tile(arr_tile: np.ndarray,
+                     mask_tile: np.ndarray,
+                     transform: Affine,
+                     connectivity: int,
+                     on_top_border: bool,
+                     on_bottom_border: bool) -> Tuple[list, list]:
+    """
+    Polygonize a horizontal strip of a larger array and split the polygons
+    into those that are complete and those touching an interior strip border,
+    which need to be merged with the polygons of the adjacent strip.
+    """
+    y_top = transform.f
+    y_bottom = transform.f + transform.e * arr_tile.shape[0]
+    tol = abs(transform.e) * 1e-3
+
+    interior, border = [], []
+    for geometry, value in shapes(arr_tile,
+                                  mask=~mask_tile,
+                                  transform=transform,
+                                  connectivity=connectivity):
+        ys = [y for _, y in geometry['coordinates'][0]]
+        touches_border = ((on_top_border and
+                           abs(max(ys) - y_top) < tol) or
+                          (on_bottom_border and
+                           abs(min(ys) - y_bottom) < tol))
+        if touches_border:
+            border.append((geometry, value))
+        else:
+            interior.append((geometry, value))
+    return interior, border
+
+
+def _merge_border_polygons(border_shapes: list) -> Iterator[Tuple[dict,
+                                                                  float]]:
+    """
+    Merge the polygons touching strip borders that have the same value.
+    """
+    geometries_by_value = {}
+    for geometry, value in border_shapes:
+        geometries_by_value.setdefault(value, []).append(shape(geometry))
+
+    for value, geometries in geometries_by_value.items():
+        merged = unary_union(geometries)
+        polygons = getattr(merged, 'geoms', [merged])
+        for polygon in polygons:
+            yield mapping(polygon), value
+
+
+def generate_shapes_from_array(arr: np.ndarray,
+                               transform: Affine,
+                               mask: np.ndarray = None,
+                               connectivity: int = 4,
+                               tile_height: int = None,
+                               n_workers: int = 1) -> Iterator[Tuple[dict,
+                                                                     float]]:
+    """
+    Generator of (geometry, value) pairs grouping contiguous pixels with the
+    same value as polygons, just as `rasterio.features.shapes`.
+
+    If `tile_height` is specified, the array is polygonized in horizontal
+    strips of `tile_height` rows using `n_workers` processes. The polygons
+    touching the interior strip borders are merged afterwards (with shapely)
+    so that the polygons are the same as the untiled ones. Polygons only
+    connected diagonally across a strip border (with 8-connectivity) remain
+    separate. Tiling requires a north-up transform.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        The array of integers to group into contiguous polygons.
+    transform : Affine
+        Rasterio transform related to arr
+    mask : np.ndarray
+        Nodata mask in which true values indicate where nodata is located.
+    connectivity : int
+        4- or 8- connectivity of the polygonal features.
+    tile_height : int
+        The number of rows of each strip. Default is None, which does not
+        tile the array.
+    n_workers : int
+        The number of processes used to polygonize the strips. Default is 1.
+
+    Returns
+    -------
+    Iterator[Tuple[dict, float]]:
+        (GeoJSON-like geometry, value) pairs.
+    """
+    # see rasterio.features.shapes - needs all false values to be no data areas
+    if mask is None:
+        mask = np.zeros(arr.shape, dtype=bool)
+
+    height = arr.shape[0]
+    if (tile_height is None) or (tile_height >= height):
+        yield from shapes(arr,
+                          mask=~mask,
+                          transform=transform,
+                          connectivity=connectivity)
+        return
+
+    if (transform.b != 0) or (transform.d != 0):
+        raise ValueError('Tiled polygonization requires a north-up transform')
+
+    row_starts = list(range(0, height, tile_height))
+    tile_args = [(arr[row: row + tile_height],
+                  mask[row: row + tile_height],
+                  transform * Affine.translation(0, row),
+                  connectivity,
+                  row > 0,
+                  row + tile_height < height)
+                 for row in row_starts]
+
+    border_shapes = []
+    if n_workers == 1:
+        tile_results = (_polygonize_tile(*args) for args in tile_args)
+        for interior, border in tile_results:
+            yield from interior
+            border_shapes.extend(border)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            tile_results = executor.map(_polygonize_tile, *zip(*tile_args))
+            for interior, border in tile_results:
+                yield from interior
+                border_shapes.extend(border)
+
+    yield from _merge_border_polygons(border_shapes)
 
 
 def get_geopandas_features_from_array(arr: np.ndarray,
                                       transform: Affine,
                                       label_name: str = 'label',
                                       mask: np.ndarray = None,
-                                      connectivity: int = 4) -> list:
+                                      connectivity: int = 4,
+                                      tile_height: int = None,
+                                      n_workers: int = 1) -> list:
     """
     Obtains a list of geopandas features in which contigious integers are
     grouped as polygons for use as:
@@ -39,6 +183,11 @@ def get_geopandas_features_from_array(arr: np.ndarray,
         4- or 8- connectivity of the polygonal features.  See rasterio:
         https://rasterio.readthedocs.io/en/latest/api/rasterio.features.html#rasterio.features.shapes
         And see: https://en.wikipedia.org/wiki/Pixel_connectivity
+    tile_height : int
+        Polygonize in strips of `tile_height` rows. See
+        `generate_shapes_from_array`. Default is None.
+    n_workers : int
+        Number of processes used if `tile_height` is specified. Default is 1.
 
     Returns
     -------
@@ -46,31 +195,65 @@ def get_geopandas_features_from_array(arr: np.ndarray,
         List of features to use for constructing geopandas dataframe with
         gpd.GeoDataFrame.from_features
     """
-    # see rasterio.features.shapes - needs all false values to be no data areas
-    if mask is None:
-        mask = np.zeros(arr.shape, dtype=bool)
-    feature_list = list(shapes(arr,
-                               mask=~mask,
-                               transform=transform,
-                               connectivity=connectivity))
-    geo_features = list({'properties': {label_name: (value)},
-                         'geometry': geometry}
-                        for i, (geometry, value) in enumerate(feature_list))
-    return geo_features
+    results = generate_geopandas_features_from_array(arr,
+                                                     transform,
+                                                     label_name=label_name,
+                                                     mask=mask,
+                                                     connectivity=connectivity,
+                                                     tile_height=tile_height,
+                                                     n_workers=n_workers)
+    return list(results)
+
 
+def generate_geopandas_features_from_array(arr: np.ndarray,
+                                           transform: Affine,
+                                           label_name: str = 'label',
+                                           mask: np.ndarray = None,
+                                           connectivity: int = 4,
+                                           tile_height: int = None,
+                                           n_workers: int = 1) -> Iterator:
+    """
+    Generator version of `get_geopandas_features_from_array` so the features
+    can be consumed (e.g. written to disk) without holding them all in memory.
+    See `get_geopandas_features_from_array` for the parameters.
+
+    Returns
+    -------
+    Iterator:
+        Features of the form {'properties': {label_name: value},
+                              'geometry': geometry}
+    """
+    shape_generator = generate_shapes_from_array(arr,
+                                                 transform,
+                                                 mask=mask,
+                                                 connectivity=connectivity,
+                                                 tile_height=tile_height,
+                                                 n_workers=n_workers)
+    for geometry, value in shape_generator:
+        yield {'properties': {label_name: value},
+               'geometry': geometry}
 
+
+@profile_stage('polygonize_array_to_shapefile')
 def polygonize_array_to_shapefile(arr: np.ndarray,
                                   profile: dict,
                                   shape_file_dir: str,
                                   label_name: str = 'label',
                                   mask: np.ndarray = None,
-                                  connectivity: int = 4):
+                                  connectivity: int = 4,
+                                  driver: str = 'ESRI Shapefile',
+                                  batch_size: int = 10_000,
+                                  tile_height: int = None,
+                                  n_workers: int = 1):
     """
     Directly create a polygonal shapefile from an array of integers grouping
     pixels with the same value together into a polygon. Polygons with
     contiguous value in array will have attribute determined by `label_name`
     and value determined by arr.
 
+    The features are streamed to the file in batches of `batch_size` so that
+    they are never all held in memory.
+
     Parameters
     ----------
     arr : np.ndarray
@@ -89,6 +272,18 @@ def polygonize_array_to_shapefile(arr: np.ndarray,
         4- or 8- connectivity of the polygonal features.  See rasterio:
         https://rasterio.readthedocs.io/en/latest/api/rasterio.features.html#rasterio.features.shapes
         And see: https://en.wikipedia.org/wiki/Pixel_connectivity
+    driver : str
+        The fiona driver e.g. `ESRI Shapefile`, `GPKG` or `FlatGeobuf`. The
+        latter two are faster to write and not limited in size as shapefiles
+        are. Default is `ESRI Shapefile`.
+    batch_size : int
+        The number of features written per `writerecords` call. Default is
+        10,000.
+    tile_height : int
+        Polygonize in strips of `tile_height` rows. See
+        `generate_shapes_from_array`. Default is None.
+    n_workers : int
+        Number of processes used if `tile_height` is specified. Default is 1.
     """
     dtype = str(arr.dtype)
     if 'int' in dtype or 'bool' in dtype:
@@ -102,17 +297,23 @@ def polygonize_array_to_shapefile(arr: np.ndarray,
         dtype_for_shape_file = 'float'
 
     crs = profile['crs']
-    results = get_geopandas_features_from_array(arr,
-                                                profile['transform'],
-                                                label_name='label',
-                                                mask=mask,
-                                                connectivity=connectivity)
+    results = generate_geopandas_features_from_array(arr,
+                                                     profile['transform'],
+                                                     label_name=label_name,
+                                                     mask=mask,
+                                                     connectivity=connectivity,
+                                                     tile_height=tile_height,
+                                                     n_workers=n_workers)
     with fiona.open(shape_file_dir, 'w',
-                    driver='ESRI Shapefile',
+                    driver=driver,
                     crs=crs,
                     schema={'properties': [(label_name, dtype_for_shape_file)],
                             'geometry': 'Polygon'}) as dst:
-        dst.writerecords(results)
+        while True:
+            batch = list(islice(results, batch_size))
+            if not batch:
+                break
+            dst.writerecords(batch)
 
 
 def rasterize_shapes_to_array(shapes: list,
@@ -151,7 +352,7 @@ def rasterize_shapes_to_array(shapes: list,
 
     # this is where we create a generator of geom, value pairs to use in
     # rasterizing
-    shapes = [(geom, value) for geom, value in zip(shapes, attributes)]
+    shapes = zip(shapes, attributes)
     burned = features.rasterize(shapes=shapes,
                                 out=out_arr,
                                 transform=profile['transform'],
@@ -160,6 +361,232 @@ def rasterize_shapes_to_array(shapes: list,
     return burned
 
 
+def _rasterize_feature_index(shapes: Iterable,
+                             profile: dict,
+                             all_touched: bool = False,
+                             indices: Iterable = None) -> np.ndarray:
+    """
+    Burn the (1-based) position of each geometry into an int32 array with 0
+    as background. If `indices` is specified, these are burned instead of the
+    positions.
+    """
+    index_arr = np.zeros((profile['height'], profile['width']),
+                         dtype=np.int32)
+    if indices is None:
+        index_shapes = ((geom, k) for k, geom in enumerate(shapes, start=1))
+    else:
+        index_shapes = ((geom, k + 1) for geom, k in zip(shapes, indices))
+
+    # rasterio raises an error for an empty collection of shapes
+    first_shape = next(index_shapes, None)
+    if first_shape is None:
+        return index_arr
+    features.rasterize(shapes=chain([first_shape], index_shapes),
+                       out=index_arr,
+                       transform=profile['transform'],
+                       all_touched=all_touched)
+    return index_arr
+
+
+def _get_attribute_table(attributes: list, dtype: str) -> np.ndarray:
+    """
+    Stack the attributes into a (bands, n_shapes + 1) table with zeros in the
+    first column for the background.
+    """
+    attributes = np.asarray([np.asarray(attr) for attr in attributes])
+    attr_table = np.zeros((attributes.shape[0], attributes.shape[1] + 1),
+                          dtype=dtype)
+    attr_table[:, 1:] = attributes
+    return attr_table
+
+
+def rasterize_shapes_to_multiband_array(shapes: Iterable,
+                                        attributes: list,
+                                        profile: dict,
+                                        all_touched: bool = False,
+                                        dtype: str = np.float32) \
+                                                -> np.ndarray:
+    """
+    Rasterize several attributes of the same geometries into a
+    `(bands, height, width)` array. For example, `shapes = df.geometry` and
+    `attributes = [df.class_id, df.region_id, df.weight]`.
+
+    The geometries are rasterized once: the position of each geometry is
+    burned into an index array, which is then used to look up each of the
+    attributes. Hence, `shapes` can be any iterable (e.g. a generator) and
+    is only traversed once. Where geometries overlap, the last one is used,
+    as in `rasterize_shapes_to_array`.
+
+    Parameters
+    ----------
+    shapes : Iterable
+        Iterable of Shapely geometries.
+    attributes : list
+        List of the attributes for each band. Each entry is a sequence of
+        values corresponding to shapes.
+    profile : dict
+        Rasterio profile in which shapes will be projected into, importantly
+        the transform and dimensions specified.
+    all_touched : bool
+        Whether factionally covered pixels are written with specific value or
+        ignored. See `rasterio.features.rasterize`.
+    dtype : str
+        The dtype of the output array, which is zero outside of shapes.
+
+    Returns
+    -------
+    np.ndarray:
+        The `(bands, height, width)` array determined with profile.
+    """
+    index_arr = _rasterize_feature_index(shapes,
+                                         profile,
+                                         all_touched=all_touched)
+    attr_table = _get_attribute_table(attributes, dtype)
+    return attr_table[:, index_arr]
+
+
+@profile_stage('rasterize_shapes_to_tif')
+def rasterize_shapes_to_tif(shapes: Iterable,
+                            attributes: list,
+                            profile: dict,
+                            dest_path: str,
+                            tile_size: int = 1024,
+                            all_touched: bool = False,
+                            dtype: str = 'float32'):
+    """
+    Rasterize several attributes of the same geometries directly into a
+    (multi-band) GeoTiff determined by `profile`, tile by tile, so that only
+    one `tile_size x tile_size` tile is in memory at a time. See
+    `rasterize_shapes_to_multiband_array`.
+
+    `shapes` is consumed once and is not kept in memory: each geometry is
+    pickled into the bucket (a temporary file next to `dest_path`) of every
+    row of tiles its bounds intersect. The buckets are then read one at a
+    time, so that at most the geometries of one row of tiles are in memory,
+    and within each tile only the geometries whose bounds intersect the tile
+    are burned.
+
+    Parameters
+    ----------
+    shapes : Iterable
+        Iterable of Shapely geometries e.g. a generator over a large file.
+    attributes : list
+        List of the attributes for each band. Each entry is a sequence of
+        values corresponding to shapes.
+    profile : dict
+        Rasterio profile of the output raster.
+    dest_path : str
+        The path of the GeoTiff to write.
+    tile_size : int
+        The width and height of the tiles. Default is 1024.
+    all_touched : bool
+        See `rasterio.features.rasterize`.
+    dtype : str
+        The dtype of the output raster.
+    """
+    attr_table = _get_attribute_table(attributes, dtype)
+    height, width = profile['height'], profile['width']
+    n_tile_rows = (height + tile_size - 1) // tile_size
+    out_profile = profile.copy()
+    out_profile.update({'count': attr_table.shape[0],
+                        'dtype': dtype,
+                        'driver': 'GTiff'})
+
+    dest_dir = Path(dest_path).resolve().parent
+    with tempfile.TemporaryDirectory(dir=dest_dir) as spill_dir:
+        bucket_paths = [Path(spill_dir) / f'tile_row_{k}.pkl'
+                        for k in range(n_tile_rows)]
+        _spill_shapes_by_tile_row(shapes,
+                                  bucket_paths,
+                                  profile['transform'],
+                                  tile_size)
+
+        with rasterio.open(dest_path, 'w', **out_profile) as ds:
+            for tile_row, bucket_path in enumerate(bucket_paths):
+                indices, geometries = [], []
+                if bucket_path.exists():
+                    with open(bucket_path, 'rb') as f:
+                        indices, geometries = _read_bucket(f)
+                # left, bottom, right, top as in shapely
+                geom_bounds = np.array([geom.bounds
+                                        for geom in geometries]
+                                       ).reshape(-1, 4)
+                indices = np.array(indices, dtype=np.int64)
+
+                row = tile_row * tile_size
+                for col in range(0, width, tile_size):
+                    sy = np.s_[row: min(row + tile_size, height)]
+                    sx = np.s_[col: min(col + tile_size, width)]
+                    tile_profile = get_cropped_profile(profile, sx, sy)
+
+                    bounds = get_bounds_dict(tile_profile)
+                    left = min(bounds['left'], bounds['right'])
+                    right = max(bounds['left'], bounds['right'])
+                    bottom = min(bounds['bottom'], bounds['top'])
+                    top = max(bounds['bottom'], bounds['top'])
+                    in_tile = ((geom_bounds[:, 0] <= right) &
+                               (geom_bounds[:, 2] >= left) &
+                               (geom_bounds[:, 1] <= top) &
+                               (geom_bounds[:, 3] >= bottom))
+                    positions = np.nonzero(in_tile)[0]
+
+                    index_arr = _rasterize_feature_index(
+                                    (geometries[k] for k in positions),
+                                    tile_profile,
+                                    all_touched=all_touched,
+                                    indices=indices[positions])
+                    window = Window(sx.start,
+                                    sy.start,
+                                    tile_profile['width'],
+                                    tile_profile['height'])
+                    ds.write(attr_table[:, index_arr], window=window)
+
+
+def _spill_shapes_by_tile_row(shapes: Iterable,
+                              bucket_paths: list,
+                              transform: Affine,
+                              tile_size: int):
+    """
+    Pickle `(index, geometry)` for each geometry into the bucket files of the
+    rows of tiles its bounds intersect; geometries outside the raster are
+    dropped. The bucket files are only created if they receive a geometry.
+    """
+    inverse = ~transform
+    n_tile_rows = len(bucket_paths)
+    with ExitStack() as stack:
+        buckets = {}
+        for index, geom in enumerate(shapes):
+            left, bottom, right, top = geom.bounds
+            rows = [(inverse * corner)[1]
+                    for corner in [(left, bottom), (left, top),
+                                   (right, bottom), (right, top)]]
+            first = max(int(np.floor(min(rows))) // tile_size, 0)
+            last = min(int(np.floor(max(rows))) // tile_size,
+                       n_tile_rows - 1)
+            for tile_row in range(first, last + 1):
+                if tile_row not in buckets:
+                    buckets[tile_row] = stack.enter_context(
+                        open(bucket_paths[tile_row], 'wb'))
+                pickle.dump((index, geom),
+                            buckets[tile_row],
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_bucket(f) -> Tuple[list, list]:
+    """
+    The indices and geometries written by `_spill_shapes_by_tile_row`.
+    """
+    indices, geometries = [], []
+    while True:
+        try:
+            index, geom = pickle.load(f)
+        except EOFError:
+            return indices, geometries
+        indices.append(index)
+        geometries.append(geom)
+
+
+@profile_stage('reproject_arr_to_match_profile')
 def reproject_arr_to_match_profile(src_array: np.ndarray,
                                    src_profile: dict,
                                    ref_profile: dict,
@@ -233,7 +660,10 @@ def get_cropped_profile(profile: dict,
     """
     This is a tool for using a reference profile and numpy slices (i.e.
     np.s_[start: stop]) to create a new profile that is within the window of
-    slice_x, slice_y.
+    slice_x, slice_y. The slices are interpreted as numpy does for an array
+    with the shape of the raster: negative starts/stops are relative to the
+    end, stops are clipped to the raster and empty slices (e.g.
+    `np.s_[0: 0]`) give a width or height of 0.
 
     Parameters
     ----------
@@ -250,16 +680,13 @@ def get_cropped_profile(profile: dict,
         The rasterio dictionary from cropping.
     """
 
-    x_start = slice_x.start or 0
-    y_start = slice_y.start or 0
-    x_stop = slice_x.stop or profile['width']
-    y_stop = slice_y.stop or profile['height']
-
-    if (x_start < 0) | (x_stop < 0) | (y_start < 0) | (y_stop < 0):
-        raise ValueError('Slices must be positive')
+    x_start, x_stop, x_step = slice_x.indices(profile['width'])
+    y_start, y_stop, y_step = slice_y.indices(profile['height'])
+    if (x_step != 1) or (y_step != 1):
+        raise ValueError('Slices must have step 1')
 
-    width = x_stop - x_start
-    height = y_stop - y_start
+    width = max(x_stop - x_start, 0)
+    height = max(y_stop - y_start, 0)
 
     profile_cropped = profile.copy()
 
@@ -302,13 +729,161 @@ def get_bounds_dict(profile: dict) -> dict:
     return bounds_dict
 
 
+def get_window_from_slices(profile: dict,
+                           slice_x: slice,
+                           slice_y: slice) -> Window:
+    """
+    Convert numpy slices (i.e. np.s_[start: stop]) into a rasterio Window
+    relative to the raster with `profile`. This is the Window whose profile is
+    `get_cropped_profile(profile, slice_x, slice_y)`. Negative starts/stops
+    are relative to the end as in numpy.
+
+    Parameters
+    ----------
+    profile : dict
+        The rasterio profile of the raster to read from.
+    slice_x : slice
+        The horizontal slice.
+    slice_y : slice
+        The vertical slice.
+
+    Returns
+    -------
+    Window:
+        The rasterio window.
+    """
+    x_start, x_stop, x_step = slice_x.indices(profile['width'])
+    y_start, y_stop, y_step = slice_y.indices(profile['height'])
+    if (x_step != 1) or (y_step != 1):
+        raise ValueError('Slices must have step 1')
+    return Window(col_off=x_start,
+                  row_off=y_start,
+                  width=max(x_stop - x_start, 0),
+                  height=max(y_stop - y_start, 0))
+
+
+def get_window_from_profile(src_profile: dict,
+                            crop_profile: dict) -> Window:
+    """
+    Obtain the Window of the raster with `src_profile` covering the bounds of
+    `crop_profile`, both in the same CRS. The window is rounded to whole
+    pixels.
+
+    Parameters
+    ----------
+    src_profile : dict
+        The rasterio profile of the raster to read from.
+    crop_profile : dict
+        The profile whose bounds determine the window.
+
+    Returns
+    -------
+    Window:
+        The rasterio window.
+    """
+    bounds = get_bounds_dict(crop_profile)
+    window = from_bounds(bounds['left'],
+                         bounds['bottom'],
+                         bounds['right'],
+                         bounds['top'],
+                         transform=src_profile['transform'])
+    return window.round_offsets().round_lengths()
+
+
+def _read_window_from_dataset(ds: rasterio.io.DatasetReader,
+                              window: Window,
+                              indexes: Union[int, list] = None) \
+                                      -> Tuple[np.ndarray, dict]:
+    arr = read_dataset(ds, indexes, window=window)
+    profile = get_decoded_profile(ds)
+    profile.update({'transform': ds.window_transform(window),
+                    'height': arr.shape[-2],
+                    'width': arr.shape[-1],
+                    'count': arr.shape[0] if arr.ndim == 3 else 1})
+    return arr, profile
+
+
+@profile_stage('read_window')
+def read_window(path: str,
+                window: Window,
+                indexes: Union[int, list] = None) -> Tuple[np.ndarray, dict]:
+    """
+    Read only the `window` of a raster (see `get_window_from_slices` and
+    `get_window_from_profile`) rather than reading the whole raster and
+    slicing it afterwards.
+
+    Parameters
+    ----------
+    path : str
+        The path of the raster.
+    window : Window
+        The rasterio window to read.
+    indexes : Union[int, list]
+        The band(s) to read as in `rasterio.DatasetReader.read`. If an int,
+        a 2d array is returned. Default is None, which reads all bands.
+
+    Returns
+    -------
+    Tuple[np.ndarray, dict]:
+        (array, profile of the window)
+    """
+    with rasterio.open(path) as ds:
+        return _read_window_from_dataset(ds, window, indexes)
+
+
+@profile_stage('read_windows')
+def read_windows(path: str,
+                 windows: list,
+                 indexes: Union[int, list] = None,
+                 n_workers: int = 4) -> list:
+    """
+    Read a list of windows from a raster concurrently. Each thread opens its
+    own handle of the dataset (GDAL handles cannot be shared across threads)
+    and reuses it for all the windows it reads.
+
+    Parameters
+    ----------
+    path : str
+        The path of the raster.
+    windows : list
+        List of rasterio windows.
+    indexes : Union[int, list]
+        The band(s) to read. See `read_window`.
+    n_workers : int
+        The number of threads (and dataset handles). Default is 4.
+
+    Returns
+    -------
+    list:
+        List of (array, profile) in the same order as windows.
+    """
+    thread_data = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def read_one(window):
+        if not hasattr(thread_data, 'ds'):
+            thread_data.ds = rasterio.open(path)
+            with handles_lock:
+                handles.append(thread_data.ds)
+        return _read_window_from_dataset(thread_data.ds, window, indexes)
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            return list(executor.map(read_one, windows))
+    finally:
+        for ds in handles:
+            ds.close()
+
+
 def reproject_profile_to_new_crs(src_profile: dict,
                                  dst_crs: str,
                                  target_resolution: Union[float, int] = None)\
                                          -> dict:
     """
     Create a new profile into a new CRS based on a dst_crs. May specify
-    resolution.
+    resolution. The new grid is cached on (crs, transform, shape, dst_crs,
+    target_resolution) so repeated calls for images sharing a grid are fast.
 
     Parameters
     ----------
@@ -317,7 +892,7 @@ def reproject_profile_to_new_crs(src_profile: dict,
     dst_crs : str
         Destination CRS, as specified by rasterio.
     target_resolution : Union[float, int]
-        Target resolution
+        Target resolution; a number or an (x, y) pair.
 
     Returns
     -------
@@ -325,22 +900,21 @@ def reproject_profile_to_new_crs(src_profile: dict,
         Rasterio profile of new CRS
     """
     reprojected_profile = src_profile.copy()
-    bounds_dict = get_bounds_dict(src_profile)
-
-    src_crs = src_profile['crs']
-    w, h = src_profile['width'], src_profile['height']
-    dst_trans, dst_w, dst_h = calculate_default_transform(src_crs,
-                                                          dst_crs,
-                                                          w, h,
-                                                          **bounds_dict
-                                                          )
 
+    # the arguments of the memoized function must be hashable; CRS can be
+    # given as e.g. dicts and the resolution as a list
     if target_resolution is not None:
-        tr = target_resolution
-        dst_trans, dst_w, dst_h = aligned_target(dst_trans,
-                                                     dst_w,
-                                                     dst_h,
-                                                     tr)
+        target_resolution = tuple(np.broadcast_to(target_resolution,
+                                                  (2,)).tolist())
+    src_wkt = CRS.from_user_input(src_profile['crs']).to_wkt()
+    dst_wkt = CRS.from_user_input(dst_crs).to_wkt()
+    dst_trans, dst_w, dst_h = _get_reprojected_grid(src_wkt,
+                                                    src_profile['transform'],
+                                                    src_profile['width'],
+                                                    src_profile['height'],
+                                                    dst_wkt,
+                                                    target_resolution)
+
     reprojected_profile.update({
                                 'crs': dst_crs,
                                 'transform': dst_trans,
@@ -350,6 +924,39 @@ def reproject_profile_to_new_crs(src_profile: dict,
     return reprojected_profile
 
 
+@lru_cache(maxsize=1024)
+def _get_reprojected_grid(src_crs,
+                          src_transform: Affine,
+                          width: int,
+                          height: int,
+                          dst_crs,
+                          target_resolution: tuple = None) \
+                                  -> Tuple[Affine, int, int]:
+    """
+    The (transform, width, height) of the grid in dst_crs covering the source
+    grid. Memoized since many images of a time series share the same grid;
+    the CRSs are WKT strings and the resolution an (x, y) tuple so that the
+    arguments are hashable.
+    """
+    bounds_dict = get_bounds_dict({'transform': src_transform,
+                                   'width': width,
+                                   'height': height})
+    dst_trans, dst_w, dst_h = calculate_default_transform(src_crs,
+                                                          dst_crs,
+                                                          width, height,
+                                                          **bounds_dict
+                                                          )
+
+    if target_resolution is not None:
+        tr = target_resolution
+        dst_trans, dst_w, dst_h = aligned_target(dst_trans,
+                                                 dst_w,
+                                                 dst_h,
+                                                 tr)
+    return dst_trans, dst_w, dst_h
+
+
+@profile_stage('reproject_arr_to_new_crs')
 def reproject_arr_to_new_crs(src_array: np.ndarray,
                              src_profile: dict,
                              dst_crs: str,
@@ -403,29 +1010,29 @@ def reproject_arr_to_new_crs(src_array: np.ndarray,
     return dst_array, reprojected_profile
 
 
-def convert_4326_to_utm(lon: float, lat: float) -> str:
+def convert_4326_to_utm(lon: Union[float, np.ndarray],
+                        lat: Union[float, np.ndarray]) \
+                                -> Union[str, np.ndarray]:
     """
-    Obtain UTM zone from (lon, lat) coordinate.
+    Obtain UTM zone from (lon, lat) coordinate. The coordinates may also be
+    arrays, in which case an array of epsg strings is returned.
 
     From: https://gis.stackexchange.com/a/269552
 
     Parameters
     ----------
-    lon : float
+    lon : Union[float, np.ndarray]
         Longitude
-    lat : float
+    lat : Union[float, np.ndarray]
         Latitude
 
     Returns
     -------
-    str:
+    Union[str, np.ndarray]:
         epsg code, in the form `epsg:<epsg_num>`.
     """
-    utm_band = str(int((np.floor((lon + 180) / 6) % 60) + 1))
-    if len(utm_band) == 1:
-        utm_band = '0'+utm_band
-    if lat >= 0:
-        epsg_code = '326' + utm_band
-    else:
-        epsg_code = '327' + utm_band
-    return f'epsg:{epsg_code}'
+    utm_band = (np.floor((np.asarray(lon) + 180) / 6) % 60).astype(int) + 1
+    epsg_code = np.where(np.asarray(lat) >= 0, 32600, 32700) + utm_band
+    if epsg_code.ndim == 0:
+        return f'epsg:{epsg_code}'
+    return np.char.add('epsg:', epsg_code.astype(str))
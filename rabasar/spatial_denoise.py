@@ -1,11 +1,11 @@
-from skimage.restoration import denoise_tv_bregman
 import numpy as np
-from numpy.linalg import norm
 import scipy
-from tqdm import tqdm
-import bm3d
+from .admm import get_denoiser, run_admm
+from .kernels import _newton_step_numpy, admm_likelihood_update
+from .profiling import profile_stage
 
 
+@profile_stage('admm_spatial_denoise')
 def admm_spatial_denoise(img: np.ndarray,
                          L: float,
                          regularizer: str,
@@ -13,7 +13,14 @@ def admm_spatial_denoise(img: np.ndarray,
                          max_admm_iterations: int = 10,
                          newton_iterations: int = 3,
                          denoiser_iterations: int = 10,
-                         convergence_crit: float = 1e-5) -> np.ndarray:
+                         convergence_crit: float = 1e-5,
+                         x_init: np.ndarray = None,
+                         checkpoint_path: str = None,
+                         checkpoint_every: int = 1,
+                         checkpoint_interval: float = None,
+                         acceleration: str = None,
+                         acceleration_params: dict = None,
+                         newton_tol: float = None) -> np.ndarray:
 
     """
     We use the variables using Boyd's ADMM review article in [1].
@@ -75,6 +82,33 @@ def admm_spatial_denoise(img: np.ndarray,
     convergence_crit : float
         The value for the sum of the residuals to be smaller than and to stop
         ADMM. Default = 1e-5
+    x_init : np.ndarray
+        Initial guess for the despeckled image in log10 scale e.g.
+        `np.log10(previous_despeckled_img)`. Used to warm-start the ADMM
+        iterations. Default is None which uses `np.log10(img)`.
+    checkpoint_path : str
+        If specified, the ADMM state is checkpointed in this directory (see
+        `ADMMCheckpointer`) and, if a checkpoint of the same run exists, the
+        iterations are resumed from it. Default is None.
+    checkpoint_every : int
+        Checkpoint every `checkpoint_every` ADMM iterations; the last
+        iteration is always checkpointed. Default is 1.
+    checkpoint_interval : float
+        If specified, checkpoint at most every `checkpoint_interval` seconds
+        (in addition to `checkpoint_every`; see `ADMMCheckpointer`).
+    acceleration : str
+        The acceleration scheme of the ADMM iterations: None (the default
+        beta heuristic), `relaxation`, `anderson` or `residual_balancing`
+        (see `ADMMAccelerator`). Default is None.
+    acceleration_params : dict
+        Keyword arguments of `ADMMAccelerator` e.g. `{'alpha': 1.5}` for
+        `relaxation`. Default is None.
+    newton_tol : float
+        If specified, the Newton iterations of each pixel stop once its step
+        is at most `newton_tol` (log10 scale) and `newton_iterations` is the
+        maximum; only the pixels that have not converged are updated (see
+        `admm_likelihood_update`). Default is None, which always takes
+        `newton_iterations` steps.
 
     Returns
     -------
@@ -82,20 +116,6 @@ def admm_spatial_denoise(img: np.ndarray,
        Denoised Image
     """
 
-    if regularizer not in ['tv', 'bm3d']:
-        raise NotImplementedError('''Only bm3d and tv (using split-bregman)
-                                     is implemented''')
-
-    # Parameters
-    # Selected as in
-    # https://bitbucket.org/charles_deledalle/mulog/src/8a1172795c1ed598e4c7d1fe989876774fbded64/mulog/admm.m#lines-127:129
-    # They reference the Plug-and-Play paper by Chan et al.
-    eta = 0.95
-    gamma = 1.05
-
-    block_diff = block_diff_old = np.inf
-    block_diff_list = []
-
     # Log Image
     img_db = np.log10(img)
 
@@ -105,53 +125,38 @@ def admm_spatial_denoise(img: np.ndarray,
     var = float(scipy.special.polygamma(1, L))
     beta = (1 + 2/L) / var
 
-    ################
-    # Denoiser Setup
-    ################
-
-    if regularizer == 'tv':
-        lamb_param = regularizer_params['weight']
-        isotropic = regularizer_params.get('isotropic', True)
-
-        def denoiser(X, lamb):
-            return denoise_tv_bregman(X,
-                                      lamb,
-                                      max_iter=denoiser_iterations,
-                                      isotropic=isotropic)
-    elif regularizer == 'bm3d':
-        lamb_param = regularizer_params['weight']
-
-        def denoiser(X, lamb):
-            return bm3d.bm3d(X, lamb)
-    else:
-        pass
-
-    ###############################
-    # Begin Plug and Play ADMM Loop
-    ###############################
-
-    x_k = img_db.copy()
-    z_k = denoiser(x_k, lamb_param)
-    u_k = z_k - x_k
-
-    for k in tqdm(range(max_admm_iterations), desc='admm_iterations'):
-
-        z_kp1 = denoiser(x_k - u_k, (lamb_param * beta))
-        u_kp1 = u_k + z_kp1 - x_k
-        x_kp1 = x_k.copy()
-        for i in range(newton_iterations):
-            x_kp1 = newton_lklhd_iter(x_kp1, z_kp1 + u_kp1, img_db, L, beta)
-
-        block_diff = norm(x_k - x_kp1) + norm(u_k - u_kp1) + norm(z_k - z_kp1)
-        if block_diff > eta * block_diff_old:
-            beta = gamma * beta
-        z_k = z_kp1
-        u_k = u_kp1
-        x_k = x_kp1
-        block_diff_old = block_diff
-        block_diff_list.append(block_diff)
-        if block_diff < convergence_crit:
-            break
+    denoiser, lamb_param = get_denoiser(regularizer,
+                                        regularizer_params,
+                                        denoiser_iterations)
+
+    def likelihood_update(x_k, u_k, z_kp1, z_k, beta, x_relaxed):
+        return admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db, L, beta,
+                                      newton_iterations,
+                                      newton_tol=newton_tol,
+                                      x_relaxed=x_relaxed)
+
+    run_params = {'L': L,
+                  'regularizer': regularizer,
+                  'regularizer_params': regularizer_params,
+                  'newton_iterations': newton_iterations,
+                  'newton_tol': newton_tol,
+                  'denoiser_iterations': denoiser_iterations,
+                  'acceleration': acceleration,
+                  'acceleration_params': acceleration_params}
+    x_k, block_diff_list = run_admm(img_db,
+                                    likelihood_update,
+                                    denoiser,
+                                    lamb_param,
+                                    beta,
+                                    max_admm_iterations=max_admm_iterations,
+                                    convergence_crit=convergence_crit,
+                                    x_init=x_init,
+                                    checkpoint_path=checkpoint_path,
+                                    checkpoint_every=checkpoint_every,
+                                    checkpoint_interval=checkpoint_interval,
+                                    run_params=run_params,
+                                    acceleration=acceleration,
+                                    acceleration_params=acceleration_params)
 
     return np.power(10, x_k), block_diff_list
 
@@ -161,7 +166,8 @@ def newton_lklhd_iter(x_k: np.array,
                       img: np.array,
                       L: float,
                       beta: float) -> np.array:
-    numer = beta * (x_k - a_k) + L * (1 - np.exp(img - x_k))
-    denom = beta + L * np.exp(img - x_k)
-    x_kp1 = x_k - numer / denom
-    return x_kp1
+    """
+    One Newton step of the x update of `admm_spatial_denoise` towards `a_k`
+    (all log10 scale); the same step as in `admm_likelihood_update`.
+    """
+    return _newton_step_numpy(x_k, a_k, img, L, None, beta)
@@ -0,0 +1,480 @@
+import numpy as np
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+from .interpolate import interpolate_nn
+from .spatial_denoise import admm_spatial_denoise
+from .ratio_denoise import admm_ratio_denoise
+from .profiling import profile_stage
+
+
+class RunningTemporalAverage(object):
+    """
+    Keeps the per-pixel running sum and valid count of a time series so that
+    the temporal average I_ta can be updated one image at a time. Nodata is
+    assumed to be np.nan and is ignored in the average.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the images in the time series.
+    """
+
+    def __init__(self, shape: tuple):
+        self.img_sum = np.zeros(shape, dtype=np.float64)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.n_dates = 0
+
+    def add_img(self, img: np.ndarray):
+        valid = ~np.isnan(img)
+        np.add(self.img_sum, img, out=self.img_sum, where=valid)
+        self.count += valid
+        self.n_dates += 1
+
+    def remove_img(self, img: np.ndarray):
+        valid = ~np.isnan(img)
+        np.subtract(self.img_sum, img, out=self.img_sum, where=valid)
+        self.count -= valid
+        self.n_dates -= 1
+
+    def get_temporal_average(self) -> np.ndarray:
+        """
+        Returns
+        -------
+        np.ndarray:
+            The temporal average with np.nan where there is no valid data.
+        """
+        ta_img = np.full(self.img_sum.shape, np.nan)
+        np.divide(self.img_sum,
+                  self.count,
+                  out=ta_img,
+                  where=(self.count > 0))
+        return ta_img
+
+
+def _get_stage_kwargs(admm_kwargs: dict, stage: str) -> dict:
+    """
+    The ADMM keyword arguments of one denoising run of a chain; a
+    `checkpoint_path` is replaced by its subdirectory `stage` so that the
+    runs do not share (and invalidate) one checkpoint.
+    """
+    stage_kwargs = admm_kwargs.copy()
+    if stage_kwargs.get('checkpoint_path') is not None:
+        stage_kwargs['checkpoint_path'] = str(
+                                Path(stage_kwargs['checkpoint_path']) / stage)
+    return stage_kwargs
+
+
+@profile_stage('get_temporal_average')
+def get_temporal_average(imgs: list) -> np.ndarray:
+    """
+    The (nan-aware) temporal average I_ta of a list of images.
+
+    Parameters
+    ----------
+    imgs : list
+        List of linear-scale images of the same shape.
+
+    Returns
+    -------
+    np.ndarray:
+        The temporally averaged image.
+    """
+    running_average = RunningTemporalAverage(imgs[0].shape)
+    for img in imgs:
+        running_average.add_img(img)
+    return running_average.get_temporal_average()
+
+
+@profile_stage('despeckle_temporal_average')
+def despeckle_temporal_average(ta_img: np.ndarray,
+                               Lm: float,
+                               regularizer: str,
+                               regularizer_params: dict,
+                               ta_despeckled_prev: np.ndarray = None,
+                               **admm_kwargs) -> Tuple[np.ndarray, list]:
+    """
+    Spatially despeckle the temporally averaged reference with
+    `admm_spatial_denoise`. If the despeckled reference from an earlier run is
+    provided, the ADMM iterations are warm-started from it, which is usually
+    much closer to the solution than the noisy reference.
+
+    Nodata (np.nan) areas are filled with nearest neighbor before denoising
+    and returned as np.nan.
+
+    Parameters
+    ----------
+    ta_img : np.ndarray
+        The temporally averaged image I_ta.
+    Lm : float
+        The ENL of the temporally averaged image.
+    regularizer : str
+        `tv` or `bm3d`. See `admm_spatial_denoise`.
+    regularizer_params : dict
+        See `admm_spatial_denoise`.
+    ta_despeckled_prev : np.ndarray
+        The previously despeckled reference in linear scale. Default is None,
+        which means a cold start.
+    **admm_kwargs
+        Additional keyword arguments for `admm_spatial_denoise` e.g.
+        `max_admm_iterations` or `convergence_crit`.
+
+    Returns
+    -------
+    Tuple[np.ndarray, list]:
+        (despeckled reference, residual list)
+    """
+    mask = np.isnan(ta_img)
+    ta_img_filled = interpolate_nn(ta_img) if mask.any() else ta_img
+
+    x_init = None
+    if ta_despeckled_prev is not None:
+        x_init = np.log10(interpolate_nn(ta_despeckled_prev)
+                          if np.isnan(ta_despeckled_prev).any()
+                          else ta_despeckled_prev)
+
+    ta_despeckled, res_list = admm_spatial_denoise(ta_img_filled,
+                                                   Lm,
+                                                   regularizer,
+                                                   regularizer_params,
+                                                   x_init=x_init,
+                                                   **admm_kwargs)
+    ta_despeckled[mask] = np.nan
+    return ta_despeckled, res_list
+
+
+@profile_stage('rabasar_denoise_one')
+def rabasar_denoise_one(img: np.ndarray,
+                        ta_despeckled: np.ndarray,
+                        L: float,
+                        Lm: float,
+                        regularizer: str,
+                        regularizer_params: dict,
+                        **admm_kwargs) -> Tuple[np.ndarray, list]:
+    """
+    Despeckle a single image of the time series with RABASAR i.e. denoise
+    the ratio img / I_ta with `admm_ratio_denoise` and multiply the result by
+    the despeckled reference.
+
+    Nodata (np.nan) areas of the ratio are filled with nearest neighbor
+    before denoising and returned as np.nan.
+
+    Parameters
+    ----------
+    img : np.ndarray
+        The linear-scale image from the time series.
+    ta_despeckled : np.ndarray
+        The despeckled temporally averaged reference.
+    L : float
+        The ENL of img.
+    Lm : float
+        The ENL of the temporally averaged reference.
+    regularizer : str
+        `tv` or `bm3d`. See `admm_ratio_denoise`.
+    regularizer_params : dict
+        See `admm_ratio_denoise`.
+    **admm_kwargs
+        Additional keyword arguments for `admm_ratio_denoise`.
+
+    Returns
+    -------
+    Tuple[np.ndarray, list]:
+        (despeckled image, residual list)
+    """
+    ratio = img / ta_despeckled
+    mask = np.isnan(ratio)
+    ratio_filled = interpolate_nn(ratio) if mask.any() else ratio
+
+    ratio_despeckled, res_list = admm_ratio_denoise(ratio_filled,
+                                                    L,
+                                                    Lm,
+                                                    regularizer,
+                                                    regularizer_params,
+                                                    **admm_kwargs)
+    img_despeckled = ratio_despeckled * ta_despeckled
+    img_despeckled[mask] = np.nan
+    return img_despeckled, res_list
+
+
+def get_dates_to_rerun(ta_despeckled_old: np.ndarray,
+                       ta_despeckled_new: np.ndarray,
+                       masks: list,
+                       tol_db: float = .1) -> list:
+    """
+    Determine which previously despeckled dates need to be recomputed after
+    the reference has been updated. For each date, the mean absolute change
+    (in dB) of the despeckled reference over the date's valid area is compared
+    to `tol_db`.
+
+    Parameters
+    ----------
+    ta_despeckled_old : np.ndarray
+        The despeckled reference used for the existing products.
+    ta_despeckled_new : np.ndarray
+        The updated despeckled reference.
+    masks : list
+        Nodata masks (True = nodata) for each existing date. An entry may be
+        None to use the whole image.
+    tol_db : float
+        The tolerance in dB. Default is .1.
+
+    Returns
+    -------
+    list:
+        Indices of the dates in `masks` whose reference changed by more than
+        the tolerance.
+    """
+    change_db = np.abs(10 * np.log10(ta_despeckled_new / ta_despeckled_old))
+
+    indices = []
+    for k, mask in enumerate(masks):
+        change_db_date = change_db if mask is None else change_db[~mask]
+        if np.all(np.isnan(change_db_date)):
+            continue
+        if np.nanmean(change_db_date) > tol_db:
+            indices.append(k)
+    return indices
+
+
+def incremental_rabasar_update(img: np.ndarray,
+                               running_average: RunningTemporalAverage,
+                               ta_despeckled_prev: np.ndarray,
+                               L: float,
+                               Lm: float,
+                               regularizer: str,
+                               ta_regularizer_params: dict,
+                               ratio_regularizer_params: dict,
+                               masks: list = None,
+                               tol_db: float = .1,
+                               **admm_kwargs) -> Tuple[np.ndarray,
+                                                       np.ndarray,
+                                                       list]:
+    """
+    Update a RABASAR time series with a newly acquired image without
+    recomputing the whole chain:
+
+        1. The running sums of `running_average` are updated with img
+           (updated in place) to obtain the new I_ta.
+        2. I_ta is despeckled warm-starting from `ta_despeckled_prev`.
+        3. The new image is despeckled with the new reference.
+        4. The existing dates whose reference changed by more than `tol_db`
+           are reported so that only those need to be re-run with
+           `rabasar_denoise_one`.
+
+    Parameters
+    ----------
+    img : np.ndarray
+        The new linear-scale image with np.nan as nodata.
+    running_average : RunningTemporalAverage
+        The running state for the existing dates.
+    ta_despeckled_prev : np.ndarray
+        The despeckled reference used for the existing products. If None,
+        cold start the reference despeckling.
+    L : float
+        The ENL of img.
+    Lm : float
+        The ENL of the (updated) temporally averaged reference.
+    regularizer : str
+        `tv` or `bm3d`.
+    ta_regularizer_params : dict
+        The regularizer parameters for despeckling the reference.
+    ratio_regularizer_params : dict
+        The regularizer parameters for despeckling the ratio image.
+    masks : list
+        Nodata masks (True = nodata) for the existing dates. Used in
+        `get_dates_to_rerun`. If None, the whole image is compared for all
+        `running_average.n_dates` existing dates.
+    tol_db : float
+        Tolerance (dB) of the reference change. Default is .1.
+    **admm_kwargs
+        Additional keyword arguments for the ADMM denoisers. A
+        `checkpoint_path` is split into the subdirectories `reference` and
+        `ratio` for the two denoising runs.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, list]:
+        (despeckled img, updated despeckled reference, indices of existing
+        dates to re-run)
+    """
+    n_existing = running_average.n_dates
+    if masks is None:
+        masks = [None] * n_existing
+
+    running_average.add_img(img)
+    ta_img = running_average.get_temporal_average()
+    ta_despeckled, _ = despeckle_temporal_average(ta_img,
+                                                  Lm,
+                                                  regularizer,
+                                                  ta_regularizer_params,
+                                                  ta_despeckled_prev,
+                                                  **_get_stage_kwargs(
+                                                      admm_kwargs,
+                                                      'reference'))
+
+    img_despeckled, _ = rabasar_denoise_one(img,
+                                            ta_despeckled,
+                                            L,
+                                            Lm,
+                                            regularizer,
+                                            ratio_regularizer_params,
+                                            **_get_stage_kwargs(admm_kwargs,
+                                                                'ratio'))
+
+    if ta_despeckled_prev is None:
+        dates_to_rerun = list(range(n_existing))
+    else:
+        dates_to_rerun = get_dates_to_rerun(ta_despeckled_prev,
+                                            ta_despeckled,
+                                            masks,
+                                            tol_db=tol_db)
+    return img_despeckled, ta_despeckled, dates_to_rerun
+
+
+def get_windowed_temporal_averages(imgs: Iterable,
+                                   k: int) -> Iterator[Tuple[int,
+                                                             np.ndarray,
+                                                             np.ndarray,
+                                                             bool]]:
+    """
+    Iterate through a time series and yield the temporal average over the
+    window of +/- k dates around each date. The window has fixed width 2k + 1
+    and is shifted at the start and end of the series so that it stays within
+    the time series (if the series has fewer than 2k + 1 dates, all dates are
+    used).
+
+    The window average is kept as a rolling sum so stepping to the next date
+    reads exactly one new image and subtracts the one leaving the window.
+    Only the 2k + 1 images of the current window are kept in memory, so
+    `imgs` can be a lazy iterable e.g. `map(read_arr, paths)`.
+
+    Parameters
+    ----------
+    imgs : Iterable
+        The time series of linear-scale images with np.nan as nodata.
+    k : int
+        The half width of the window.
+
+    Returns
+    -------
+    Iterator[Tuple[int, np.ndarray, np.ndarray, bool]]:
+        (date index, image, window temporal average, whether the window
+        changed from the previous date)
+    """
+    if k < 0:
+        raise ValueError('k must be non-negative')
+
+    imgs = iter(imgs)
+    window = deque(islice(imgs, 2 * k + 1))
+    if not window:
+        return
+
+    running_average = RunningTemporalAverage(window[0].shape)
+    for img in window:
+        running_average.add_img(img)
+    ta_img = running_average.get_temporal_average()
+
+    window_start = 0
+    window_changed = True
+    t = 0
+    while t < window_start + len(window):
+        if t - k > window_start:
+            img_new = next(imgs, None)
+            if img_new is not None:
+                running_average.remove_img(window.popleft())
+                running_average.add_img(img_new)
+                window.append(img_new)
+                window_start += 1
+                ta_img = running_average.get_temporal_average()
+                window_changed = True
+        yield t, window[t - window_start], ta_img, window_changed
+        window_changed = False
+        t += 1
+
+
+def windowed_rabasar_denoise(imgs: Iterable,
+                             k: int,
+                             L: float,
+                             Lm: float,
+                             regularizer: str,
+                             ta_regularizer_params: dict,
+                             ratio_regularizer_params: dict,
+                             tol_db: float = None,
+                             **admm_kwargs) -> Iterator[Tuple[np.ndarray,
+                                                              np.ndarray]]:
+    """
+    RABASAR with a sliding temporal window reference: each date is despeckled
+    with the reference obtained from the temporal average of its +/- k
+    neighbours (see `get_windowed_temporal_averages`) so the per-date cost
+    does not grow with the length of the time series.
+
+    The despeckled reference is reused when the window does not change (at
+    the start and end of the series) or, if `tol_db` is specified, when the
+    window average changed by less than `tol_db` from the average last
+    despeckled. Otherwise, the despeckling is warm-started from the
+    previous window's despeckled reference.
+
+    Parameters
+    ----------
+    imgs : Iterable
+        The time series of linear-scale images with np.nan as nodata.
+    k : int
+        The half width of the window.
+    L : float
+        The ENL of the images.
+    Lm : float
+        The ENL of the window temporal average.
+    regularizer : str
+        `tv` or `bm3d`.
+    ta_regularizer_params : dict
+        The regularizer parameters for despeckling the references.
+    ratio_regularizer_params : dict
+        The regularizer parameters for despeckling the ratio images.
+    tol_db : float
+        Tolerance (dB) of the mean absolute change of the window average
+        below which the last despeckled reference is reused. Default is
+        None, which recomputes the reference whenever the window changes.
+    **admm_kwargs
+        Additional keyword arguments for the ADMM denoisers. A
+        `checkpoint_path` is split into the subdirectories `reference_<t>`
+        and `date_<t>` (t the date index) for the denoising runs.
+
+    Returns
+    -------
+    Iterator[Tuple[np.ndarray, np.ndarray]]:
+        (despeckled image, despeckled reference) for each date.
+    """
+    ta_img_despeckled_from = None
+    ta_despeckled = None
+    windows = get_windowed_temporal_averages(imgs, k)
+    for t, img, ta_img, window_changed in windows:
+        if window_changed:
+            reuse = ((tol_db is not None) and
+                     (ta_img_despeckled_from is not None) and
+                     not get_dates_to_rerun(ta_img_despeckled_from,
+                                            ta_img,
+                                            [None],
+                                            tol_db=tol_db))
+            if not reuse:
+                ta_despeckled, _ = despeckle_temporal_average(
+                                                        ta_img,
+                                                        Lm,
+                                                        regularizer,
+                                                        ta_regularizer_params,
+                                                        ta_despeckled,
+                                                        **_get_stage_kwargs(
+                                                            admm_kwargs,
+                                                            f'reference_{t}'))
+                ta_img_despeckled_from = ta_img
+
+        img_despeckled, _ = rabasar_denoise_one(img,
+                                                ta_despeckled,
+                                                L,
+                                                Lm,
+                                                regularizer,
+                                                ratio_regularizer_params,
+                                                **_get_stage_kwargs(
+                                                    admm_kwargs,
+                                                    f'date_{t}'))
+        yield img_despeckled, ta_despeckled
@@ -0,0 +1,196 @@
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from .pipeline import prefetch
+from .profiling import profile_stage
+from .quantize import read_dataset
+
+STATISTICS_BANDS = ['mean', 'variance', 'cv', 'min', 'max', 'count']
+
+
+class RunningTemporalStatistics(object):
+    """
+    Per-pixel temporal count, mean, variance, coefficient of variation and
+    extrema of a time series accumulated one image at a time with Welford's
+    update (numerically stable in one pass). Nodata is assumed to be np.nan
+    and is ignored.
+
+    Statistics accumulated separately (e.g. over different dates by different
+    workers) can be combined with `merge`.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the images in the time series.
+    """
+
+    def __init__(self, shape: tuple):
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+        self.min = np.full(shape, np.nan)
+        self.max = np.full(shape, np.nan)
+        self.n_dates = 0
+
+    def add_img(self, img: np.ndarray):
+        valid = ~np.isnan(img)
+        self.count += valid
+        delta = np.subtract(img, self.mean, dtype=np.float64)
+        update = np.zeros_like(self.mean)
+        np.divide(delta, self.count, out=update, where=valid)
+        self.mean += update
+        # delta * (img - new mean)
+        np.subtract(img, self.mean, out=update, where=valid)
+        np.multiply(delta, update, out=update, where=valid)
+        np.add(self.m2, update, out=self.m2, where=valid)
+        np.fmin(self.min, img, out=self.min)
+        np.fmax(self.max, img, out=self.max)
+        self.n_dates += 1
+
+    def merge(self, other: 'RunningTemporalStatistics'):
+        """
+        Combine the statistics of another (disjoint) set of images of the same
+        pixels into these (Chan et al.'s parallel update).
+        """
+        count = self.count + other.count
+        valid = count > 0
+        delta = other.mean - self.mean
+        weight = np.zeros_like(self.mean)
+        np.divide(other.count, count, out=weight, where=valid)
+        self.mean += delta * weight
+        self.m2 += other.m2 + delta ** 2 * self.count * weight
+        self.count = count
+        np.fmin(self.min, other.min, out=self.min)
+        np.fmax(self.max, other.max, out=self.max)
+        self.n_dates += other.n_dates
+
+    def get_statistics(self, ddof: int = 1) -> dict:
+        """
+        Parameters
+        ----------
+        ddof : int
+            Delta degrees of freedom of the variance. Default is 1.
+
+        Returns
+        -------
+        dict:
+            The images of `STATISTICS_BANDS` (mean, variance, cv = std / mean,
+            min, max and count) with np.nan where they are undefined.
+        """
+        mean = np.full(self.mean.shape, np.nan)
+        np.copyto(mean, self.mean, where=(self.count > 0))
+        variance = np.full(self.mean.shape, np.nan)
+        np.divide(self.m2,
+                  self.count - ddof,
+                  out=variance,
+                  where=(self.count > ddof))
+        cv = np.full(self.mean.shape, np.nan)
+        np.divide(np.sqrt(variance), mean, out=cv, where=(mean != 0))
+        return {'mean': mean,
+                'variance': variance,
+                'cv': cv,
+                'min': self.min.copy(),
+                'max': self.max.copy(),
+                'count': self.count.copy()}
+
+
+@profile_stage('get_temporal_statistics')
+def get_temporal_statistics(imgs: list, ddof: int = 1) -> dict:
+    """
+    The temporal statistics of an iterable of images in one pass (see
+    `RunningTemporalStatistics`).
+    """
+    imgs = iter(imgs)
+    img = next(imgs)
+    running_statistics = RunningTemporalStatistics(img.shape)
+    running_statistics.add_img(img)
+    for img in imgs:
+        running_statistics.add_img(img)
+    return running_statistics.get_statistics(ddof=ddof)
+
+
+def _get_tile_statistics(paths: list,
+                         window: Window,
+                         band: int,
+                         ddof: int) -> np.ndarray:
+    statistics = RunningTemporalStatistics((int(window.height),
+                                            int(window.width)))
+    for path in paths:
+        with rasterio.open(path) as ds:
+            statistics.add_img(read_dataset(ds, band, window=window)
+                               .astype(np.float64))
+    statistics_dict = statistics.get_statistics(ddof=ddof)
+    return np.stack([statistics_dict[name] for name in STATISTICS_BANDS])
+
+
+@profile_stage('write_temporal_statistics')
+def write_temporal_statistics(paths: list,
+                              dest_path: str,
+                              band: int = 1,
+                              ddof: int = 1,
+                              tile_size: int = 1024,
+                              n_workers: int = 4,
+                              compress: str = 'deflate') -> str:
+    """
+    Write the temporal statistics of a stack of co-registered rasters (e.g.
+    the original or despeckled time series) as a multi-band float32 GeoTiff
+    with bands `STATISTICS_BANDS` (mean, variance, cv, min, max, count; the
+    band descriptions are set accordingly).
+
+    The stack is read tile by tile (one pass over the dates per tile) so only
+    one tile of statistics per worker is in memory; tiles are computed by
+    `n_workers` threads and written in order.
+
+    Parameters
+    ----------
+    paths : list
+        The rasters of the time series.
+    dest_path : str
+        The statistics GeoTiff.
+    band : int
+        The band of the rasters. Default is 1.
+    ddof : int
+        Delta degrees of freedom of the variance. Default is 1.
+    tile_size : int
+        The tile (and block) size; multiple of 16. Default is 1024.
+    n_workers : int
+        The number of threads. Default is 4.
+    compress : str
+        The GeoTiff compression. Default is `deflate`.
+
+    Returns
+    -------
+    str:
+        dest_path
+    """
+    with rasterio.open(paths[0]) as ds:
+        profile = ds.profile
+    profile.update({'driver': 'GTiff',
+                    'count': len(STATISTICS_BANDS),
+                    'dtype': 'float32',
+                    'nodata': np.nan,
+                    'tiled': True,
+                    'blockxsize': tile_size,
+                    'blockysize': tile_size,
+                    'compress': compress})
+    height, width = profile['height'], profile['width']
+    windows = [Window(col,
+                      row,
+                      min(tile_size, width - col),
+                      min(tile_size, height - row))
+               for row in range(0, height, tile_size)
+               for col in range(0, width, tile_size)]
+
+    tiles = prefetch(windows,
+                     lambda window: _get_tile_statistics(paths,
+                                                         window,
+                                                         band,
+                                                         ddof),
+                     n_prefetch=n_workers,
+                     n_threads=n_workers)
+    with rasterio.open(dest_path, 'w', **profile) as ds:
+        for i, name in enumerate(STATISTICS_BANDS):
+            ds.set_band_description(i + 1, name)
+        for window, tile in zip(windows, tiles):
+            ds.write(tile.astype(np.float32), window=window)
+    return dest_path
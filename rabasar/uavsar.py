@@ -0,0 +1,210 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from tqdm import tqdm
+from .profiling import profile_stage
+
+
+def read_uavsar_annotation(ann_path: str) -> dict:
+    """
+    Parse a UAVSAR annotation (`.ann`) file into a dictionary of the (string)
+    values keyed by the names without units e.g. `hgt.set_rows`.
+    """
+    annotation = {}
+    with open(ann_path) as f:
+        for line in f:
+            # remove comments
+            line = line.split(';')[0].strip()
+            if '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            key = key.split('(')[0].strip()
+            annotation[key] = value.strip()
+    return annotation
+
+
+def get_uavsar_profile(ann_path: str,
+                       tile_size: int = 512,
+                       compress: str = 'deflate') -> dict:
+    """
+    The profile of the ground projected (`.grd`, `.rtc` and `.hgt`) grids of
+    a UAVSAR scene from its annotation file. The annotation gives the center
+    of the upper left pixel in EPSG:4326, so the transform is shifted by half
+    a pixel to the corner.
+
+    Parameters
+    ----------
+    ann_path : str
+        The `.ann` file.
+    tile_size : int
+        The block size of the tiled GeoTiff. Must be a multiple of 16.
+        Default is 512.
+    compress : str
+        The GeoTiff compression. Default is `deflate`.
+
+    Returns
+    -------
+    dict:
+        The rasterio profile.
+    """
+    annotation = read_uavsar_annotation(ann_path)
+    ul_lon = float(annotation['hgt.col_addr'])
+    ul_lat = float(annotation['hgt.row_addr'])
+    height = int(annotation['hgt.set_rows'])
+    width = int(annotation['hgt.set_cols'])
+    dy = float(annotation['hgt.row_mult'])
+    dx = float(annotation['hgt.col_mult'])
+
+    # dy is negative
+    transform = from_origin(ul_lon - dx / 2, ul_lat - dy / 2, dx, -dy)
+    return {'driver': 'GTiff',
+            'dtype': 'float32',
+            'nodata': np.nan,
+            'width': width,
+            'height': height,
+            'count': 1,
+            'crs': 'EPSG:4326',
+            'transform': transform,
+            'tiled': True,
+            'blockxsize': tile_size,
+            'blockysize': tile_size,
+            'compress': compress}
+
+
+def _memmap_grid(path: str, profile: dict) -> np.memmap:
+    # UAVSAR binary grids are little endian float32
+    return np.memmap(path,
+                     dtype='<f4',
+                     mode='r',
+                     shape=(profile['height'], profile['width']))
+
+
+@profile_stage('convert_uavsar_grid')
+def convert_uavsar_grid(src_path: str,
+                        dest_path: str,
+                        profile: dict,
+                        rtc_path: str = None,
+                        chunk_rows: int = None) -> str:
+    """
+    Convert a raw UAVSAR grid into a tiled GeoTiff. The binary grid (and the
+    RTC factor grid) are memory-mapped and processed in blocks of rows so
+    only `chunk_rows` rows are in memory at a time. Zeros are nodata
+    (np.nan).
+
+    Parameters
+    ----------
+    src_path : str
+        The `.grd` (backscatter) or `.hgt` (DEM) file.
+    dest_path : str
+        The GeoTiff path.
+    profile : dict
+        From `get_uavsar_profile`.
+    rtc_path : str
+        If specified, the `.rtc` file whose factor is applied to the grid
+        (for the backscatter, not the DEM). Default is None.
+    chunk_rows : int
+        The number of rows per block. Default is None, which uses the block
+        size of the profile (or 512).
+
+    Returns
+    -------
+    str:
+        dest_path
+    """
+    src = _memmap_grid(src_path, profile)
+    rtc = _memmap_grid(rtc_path, profile) if rtc_path is not None else None
+    chunk_rows = chunk_rows or profile.get('blockysize', 512)
+    height, width = profile['height'], profile['width']
+
+    with rasterio.open(dest_path, 'w', **profile) as ds:
+        for row in range(0, height, chunk_rows):
+            rows = np.s_[row: min(row + chunk_rows, height)]
+            chunk = np.array(src[rows], dtype=np.float32)
+            if rtc is not None:
+                chunk *= rtc[rows]
+            chunk[chunk == 0] = np.nan
+            window = Window(0, row, width, chunk.shape[0])
+            ds.write(chunk, 1, window=window)
+    return str(dest_path)
+
+
+def convert_uavsar_scene(data_dir: str,
+                         out_dir: str,
+                         tile_size: int = 512,
+                         compress: str = 'deflate',
+                         chunk_rows: int = None) -> list:
+    """
+    Convert a downloaded UAVSAR scene directory (`.ann`, `.rtc`, `.hgt` and
+    the `.grd` of each polarization) into GeoTiffs in
+    `<out_dir>/<data_dir name>/` as in
+    `radiometric_terrain_correction_transformation.ipynb`: the backscatter
+    is multiplied by the RTC factor and written as `<grd name>.tif` and the
+    DEM as `<hgt name>_dem.tif`. See `convert_uavsar_grid`.
+
+    Returns
+    -------
+    list:
+        The backscatter paths followed by the DEM path.
+    """
+    data_dir = Path(data_dir)
+    ann_path = _get_one(data_dir, '*.ann')
+    rtc_path = _get_one(data_dir, '*.rtc')
+    hgt_path = _get_one(data_dir, '*.hgt')
+    grd_paths = sorted(data_dir.glob('*.grd'))
+
+    dest_dir = Path(out_dir) / data_dir.name
+    dest_dir.mkdir(exist_ok=True, parents=True)
+    profile = get_uavsar_profile(ann_path,
+                                 tile_size=tile_size,
+                                 compress=compress)
+
+    dest_paths = [convert_uavsar_grid(grd_path,
+                                      dest_dir / f'{grd_path.stem}.tif',
+                                      profile,
+                                      rtc_path=rtc_path,
+                                      chunk_rows=chunk_rows)
+                  for grd_path in grd_paths]
+    dem_path = dest_dir / f'{hgt_path.stem}_dem.tif'
+    dest_paths.append(convert_uavsar_grid(hgt_path,
+                                          dem_path,
+                                          profile,
+                                          chunk_rows=chunk_rows))
+    return dest_paths
+
+
+def _get_one(data_dir: Path, pattern: str) -> Path:
+    paths = sorted(data_dir.glob(pattern))
+    if len(paths) != 1:
+        raise ValueError(f'Expected one {pattern} file in {data_dir}; '
+                         f'found {len(paths)}')
+    return paths[0]
+
+
+def convert_uavsar_scenes(data_dirs: list,
+                          out_dir: str,
+                          n_workers: int = 4,
+                          **convert_kwargs) -> list:
+    """
+    Convert several scene directories in parallel with `n_workers` processes
+    (see `convert_uavsar_scene`).
+
+    Returns
+    -------
+    list:
+        The list of written paths of each scene.
+    """
+    n = len(data_dirs)
+    args = ([str(data_dir) for data_dir in data_dirs], [str(out_dir)] * n)
+    if n_workers == 1:
+        return [convert_uavsar_scene(*arg, **convert_kwargs)
+                for arg in tqdm(zip(*args), total=n, desc='scenes')]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(convert_uavsar_scene,
+                                   *arg,
+                                   **convert_kwargs)
+                   for arg in zip(*args)]
+        return [future.result()
+                for future in tqdm(futures, total=n, desc='scenes')]
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 from os import path
 
 # file_dir = path.abspath(path.dirname(__file__))
@@ -36,5 +36,8 @@ setup(name='rabasar',
       # but rather use the requirements.txt to specify a valid environment and
       # not muddle the installation with pip and possibly conda.
       install_requires=[],
+      # numba compiles the fused ADMM kernels (see rabasar/kernels.py);
+      # without it a NumPy fallback is used
+      extras_require={'numba': ['numba>=0.50']},
       )
 
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rabasar.quantize import write_quantized
+
+
+@pytest.fixture
+def products(tmp_path):
+    """
+    The same two-date stack written as float32 and as quantized products.
+    """
+    rng = np.random.default_rng(0)
+    profile = {'driver': 'GTiff',
+               'dtype': 'float32',
+               'nodata': np.nan,
+               'width': 64,
+               'height': 48,
+               'count': 1,
+               'crs': 'EPSG:32615',
+               'transform': from_origin(0, 0, 30, 30)}
+    imgs = [(0.1 * rng.gamma(4, 1 / 4, (48, 64))).astype(np.float32)
+            for _ in range(2)]
+    imgs[0][:3, :5] = np.nan
+    float_paths, quantized_paths = [], []
+    for k, img in enumerate(imgs):
+        float_paths.append(str(tmp_path / f'float_{k}.tif'))
+        with rasterio.open(float_paths[-1], 'w', **profile) as ds:
+            ds.write(img, 1)
+        quantized_paths.append(write_quantized(img,
+                                               profile,
+                                               str(tmp_path / f'q_{k}.tif'),
+                                               tile_size=16))
+    return imgs, float_paths, quantized_paths
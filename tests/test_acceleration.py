@@ -0,0 +1,74 @@
+import numpy as np
+from rabasar.acceleration import ADMMAccelerator, get_denoiser_calls
+from rabasar.kernels import admm_likelihood_update
+
+
+def _get_admm_variables(shape=(40, 50)):
+    rng = np.random.default_rng(0)
+    img_db = np.log10(0.1 * rng.gamma(4, 1 / 4, shape))
+    x_k = img_db + 0.1 * rng.standard_normal(shape)
+    u_k = 0.05 * rng.standard_normal(shape)
+    z_k = x_k + 0.05 * rng.standard_normal(shape)
+    z_kp1 = z_k + 0.01 * rng.standard_normal(shape)
+    return x_k, u_k, z_kp1, z_k, img_db
+
+
+def test_relaxed_residual_uses_unrelaxed_x():
+    x_k, u_k, z_kp1, z_k, img_db = _get_admm_variables()
+    accelerator = ADMMAccelerator('relaxation', alpha=1.6)
+    x_relaxed, denoiser_input = accelerator.relax(x_k, z_k, u_k, x_k - u_k)
+    assert np.allclose(denoiser_input, x_relaxed - u_k)
+
+    x_kp1, u_kp1, _, block_diff = \
+        admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db, 4, 3., 3,
+                               x_relaxed=x_relaxed, use_numba=False)
+    assert np.allclose(u_kp1, u_k + z_kp1 - x_relaxed)
+    expected = (np.linalg.norm(x_k - x_kp1) +
+                np.linalg.norm(u_k - u_kp1) +
+                np.linalg.norm(z_k - z_kp1))
+    assert np.isclose(block_diff, expected)
+
+
+def test_relaxation_off_is_unchanged():
+    x_k, u_k, z_kp1, z_k, img_db = _get_admm_variables()
+    accelerator = ADMMAccelerator()
+    x_relaxed, _ = accelerator.relax(x_k, z_k, u_k, x_k - u_k)
+    assert x_relaxed is x_k
+    default = admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db, 4, 3., 3,
+                                     use_numba=False)
+    relaxed = admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db, 4, 3., 3,
+                                     x_relaxed=x_relaxed, use_numba=False)
+    for expected, arr in zip(default, relaxed):
+        assert np.array_equal(expected, arr)
+
+
+def test_anderson_accelerates_linear_fixed_point():
+    # the fixed point iteration s -> A s + b split as (x, u)
+    rng = np.random.default_rng(1)
+    n = 20
+    q, _ = np.linalg.qr(rng.standard_normal((2 * n, 2 * n)))
+    A = q @ np.diag(np.linspace(0.5, 0.95, 2 * n)) @ q.T
+    b = rng.standard_normal(2 * n)
+    s_star = np.linalg.solve(np.eye(2 * n) - A, b)
+
+    def run(acceleration, n_iterations=30):
+        accelerator = ADMMAccelerator(acceleration)
+        s = np.zeros(2 * n)
+        for _ in range(n_iterations):
+            g = A @ s + b
+            x_kp1, u_kp1, _, _ = accelerator.update(s[:n], None, s[n:],
+                                                    g[:n], None, g[n:],
+                                                    None, 1., 0., np.inf)
+            s = np.concatenate([x_kp1, u_kp1])
+        return np.linalg.norm(s - s_star), accelerator
+
+    error_plain, _ = run(None)
+    error_anderson, accelerator = run('anderson')
+    assert error_anderson < 1e-3 * error_plain
+    # the buffers are allocated once
+    assert accelerator._delta_f.shape == (accelerator.memory, 2 * n)
+
+
+def test_get_denoiser_calls():
+    assert get_denoiser_calls([1., .5, .05], .1) == 4
+    assert get_denoiser_calls([1., .5], .1) is None
@@ -0,0 +1,98 @@
+from functools import partial
+import numpy as np
+import pytest
+from rabasar.admm import get_denoiser, run_admm
+from rabasar.kernels import admm_likelihood_update
+from rabasar.spatial_denoise import admm_spatial_denoise
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def img():
+    rng = np.random.default_rng(0)
+    img = 0.1 * rng.gamma(4, 1 / 4, (48, 64))
+    img[10: 30, 20: 40] *= 4
+    return img
+
+
+def _run(img, max_admm_iterations, checkpoint_path=None, fail_at=None,
+         **kwargs):
+    img_db = np.log10(img)
+    tv, lamb_param = get_denoiser('tv', {'weight': 1})
+    n_calls = [0]
+
+    def denoiser(X, lamb):
+        n_calls[0] += 1
+        if n_calls[0] == fail_at:
+            raise Interrupted
+        return tv(X, lamb)
+
+    likelihood_update = partial(_likelihood_update, img_db)
+    return run_admm(img_db,
+                    likelihood_update,
+                    denoiser,
+                    lamb_param,
+                    1.,
+                    max_admm_iterations=max_admm_iterations,
+                    convergence_crit=0,
+                    checkpoint_path=checkpoint_path,
+                    run_params={'L': 4},
+                    **kwargs)
+
+
+def _likelihood_update(img_db, x_k, u_k, z_kp1, z_k, beta, x_relaxed):
+    return admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db, 4., beta, 3,
+                                  x_relaxed=x_relaxed)
+
+
+@pytest.mark.parametrize('acceleration', [None, 'relaxation'])
+def test_resume_is_bit_exact(img, tmp_path, acceleration):
+    expected, expected_diffs = _run(img, 6, acceleration=acceleration)
+    # killed during the denoiser call of the 5th iteration (the first call
+    # initializes z)
+    with pytest.raises(Interrupted):
+        _run(img, 6, checkpoint_path=tmp_path, fail_at=6,
+             acceleration=acceleration)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['iteration_4',
+                                                          'meta.json']
+    x_k, block_diffs = _run(img, 6, checkpoint_path=tmp_path,
+                            acceleration=acceleration)
+    assert np.array_equal(x_k, expected)
+    assert block_diffs == expected_diffs
+
+
+def test_last_iteration_saved_off_schedule(img, tmp_path):
+    _run(img, 5, checkpoint_path=tmp_path, checkpoint_every=3)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['iteration_5',
+                                                          'meta.json']
+    # nothing is left to run
+    x_k, _ = _run(img, 5, checkpoint_path=tmp_path, fail_at=1)
+    assert np.array_equal(x_k, _run(img, 5)[0])
+
+
+def test_checkpoint_interval(img, tmp_path):
+    # only the (forced) last iteration passes the time condition
+    _run(img, 4, checkpoint_path=tmp_path, checkpoint_interval=3600)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['iteration_4',
+                                                          'meta.json']
+
+
+def test_checkpoint_mismatch(img, tmp_path):
+    _run(img, 2, checkpoint_path=tmp_path)
+    with pytest.raises(ValueError):
+        _run(img * 2, 2, checkpoint_path=tmp_path)
+
+
+def test_admm_spatial_denoise_checkpoint(img, tmp_path):
+    args = (img, 4, 'tv', {'weight': 1})
+    expected, _ = admm_spatial_denoise(*args, max_admm_iterations=4)
+    admm_spatial_denoise(*args, max_admm_iterations=2,
+                         checkpoint_path=tmp_path)
+    resumed, block_diffs = admm_spatial_denoise(*args,
+                                                max_admm_iterations=4,
+                                                checkpoint_path=tmp_path)
+    assert np.array_equal(resumed, expected)
+    assert len(block_diffs) == 4
@@ -0,0 +1,138 @@
+import datetime
+import os
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform
+from rabasar.catalog import (SceneCatalog,
+                             get_date_from_path,
+                             get_polarization_from_path)
+
+
+def write_scene(path, crs, west, north, res, size=10):
+    profile = {'driver': 'GTiff',
+               'dtype': 'float32',
+               'width': size,
+               'height': size,
+               'count': 1,
+               'crs': crs,
+               'transform': from_origin(west, north, res, res)}
+    with rasterio.open(path, 'w', **profile) as ds:
+        ds.write(np.ones((1, size, size), dtype=np.float32))
+    return str(path)
+
+
+@pytest.fixture
+def scenes(tmp_path):
+    """
+    Two ALOS-1 scenes in EPSG:4326 (0.01 degree pixels) and a UAVSAR scene
+    in UTM 15N, all of size 10 x 10.
+    """
+    paths = [write_scene(tmp_path / 'alos_HV_RTC_20100615.tif',
+                         'EPSG:4326', -91.5, 29.6, 0.01),
+             write_scene(tmp_path / 'alos_HH_RTC_20101201.tif',
+                         'EPSG:4326', -90.5, 29.6, 0.01)]
+    # north west corner at (-91.45, 29.55)
+    (x,), (y,) = transform('EPSG:4326', 'EPSG:32615', [-91.45], [29.55])
+    paths.append(write_scene(tmp_path /
+                             'waxlak_27802_19070_010_190930_L090HVHV.tif',
+                             'EPSG:32615', x, y, 100))
+    return paths
+
+
+@pytest.mark.parametrize('name, date',
+                         [('alos_HV_RTC_20100615.tif',
+                           datetime.date(2010, 6, 15)),
+                          ('gulfco_27802_19070_010_190930_L090HHHH_CX.tif',
+                           datetime.date(2019, 9, 30)),
+                          ('waxlak_05720_21011_003_210208_L090_CX_01.tif',
+                           datetime.date(2021, 2, 8))])
+def test_get_date_from_path(name, date):
+    assert get_date_from_path(name) == date
+
+
+def test_get_date_from_path_fails(tmp_path):
+    with pytest.raises(ValueError):
+        get_date_from_path(tmp_path / 'scene.tif')
+
+
+@pytest.mark.parametrize('name, polarization',
+                         [('alos_HV_RTC_20100615.tif', 'HV'),
+                          ('alos_hh_RTC_20100615.tif', 'HH'),
+                          ('gulfco_27802_19070_010_190930_L090HVHV_CX.tif',
+                           'HV'),
+                          ('gulfco_27802_19070_010_190930_L090VVVV_CX.tif',
+                           'VV')])
+def test_get_polarization_from_path(name, polarization):
+    assert get_polarization_from_path(name) == polarization
+
+
+@pytest.mark.parametrize('name', ['alos_RTC_20100615.tif',
+                                  'gulfco_L090HVHH_CX.tif',
+                                  'CHHOSE_RTC_20100615.tif'])
+def test_get_polarization_from_path_fails(name):
+    with pytest.raises(ValueError):
+        get_polarization_from_path(name)
+
+
+def test_add_scenes_incremental(scenes, tmp_path):
+    db_path = tmp_path / 'scenes.db'
+    with SceneCatalog(db_path) as catalog:
+        assert catalog.add_scenes(scenes[:2], 'alos1', 'waxlake') == 2
+        assert catalog.add_scenes(scenes, 'alos1', 'waxlake') == 1
+        assert len(catalog) == 3
+
+    # the catalog persists and unchanged scenes are skipped
+    with SceneCatalog(db_path) as catalog:
+        assert catalog.add_scenes(scenes, 'alos1', 'waxlake') == 0
+        # a modified scene is read again
+        write_scene(scenes[0], 'EPSG:4326', -91.5, 29.6, 0.01, size=20)
+        stat = os.stat(scenes[0])
+        os.utime(scenes[0], (stat.st_atime, stat.st_mtime + 10))
+        assert catalog.add_scenes(scenes, 'alos1', 'waxlake') == 1
+        scene = catalog.query(start_date=datetime.date(2010, 6, 15),
+                              end_date=datetime.date(2010, 6, 15))[0]
+        assert scene['path'] == scenes[0]
+        assert scene['width'] == 20
+        assert scene['polarization'] == 'HV'
+        assert scene['month'] == 6
+        assert scene['crs'] == rasterio.crs.CRS.from_epsg(4326)
+
+
+def test_add_scenes_missing(scenes, tmp_path):
+    with SceneCatalog(tmp_path / 'scenes.db') as catalog:
+        catalog.add_scenes(scenes, 'alos1', 'waxlake')
+        os.remove(scenes[0])
+        with pytest.warns(UserWarning, match='missing'):
+            n_added = catalog.add_scenes(scenes + [str(tmp_path / 'x.tif')],
+                                         'alos1',
+                                         'waxlake')
+        assert n_added == 0
+        assert catalog.remove_missing() == 1
+        assert len(catalog) == 2
+
+
+def test_query(scenes, tmp_path):
+    with SceneCatalog(tmp_path / 'scenes.db') as catalog:
+        catalog.add_scenes(scenes, 'alos1', 'waxlake')
+        assert catalog.get_paths() == scenes
+        assert catalog.get_paths(polarization='hv') == [scenes[0],
+                                                        scenes[2]]
+        assert catalog.get_paths(months=range(5, 10)) == [scenes[0],
+                                                          scenes[2]]
+        # the UTM scene covers about (-91.45, 29.54, -91.44, 29.55)
+        bbox = (-91.46, 29.5, -91.43, 29.53)
+        assert catalog.get_paths(bbox=bbox) == [scenes[0]]
+        bbox = (-91.46, 29.5, -91.43, 29.56)
+        assert catalog.get_paths(bbox=bbox) == [scenes[0], scenes[2]]
+        # the same bbox in UTM 15N
+        xs, ys = transform('EPSG:4326', 'EPSG:32615',
+                           [bbox[0], bbox[2]], [bbox[1], bbox[3]])
+        utm_bbox = (min(xs), min(ys), max(xs), max(ys))
+        assert catalog.get_paths(bbox=utm_bbox,
+                                 bbox_crs='EPSG:32615') == [scenes[0],
+                                                            scenes[2]]
+        bbox = (-90.45, 29.5, -90.4, 29.55)
+        assert catalog.get_paths(bbox=bbox) == [scenes[1]]
+        assert catalog.get_paths(bbox=bbox, polarization='HV') == []
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from rabasar.enl import (get_enl_img, get_enl_imgs, get_enl_mode,
+                         get_enl_sampled)
+
+pytest.importorskip('astropy')
+
+ENL = 4.4
+
+
+@pytest.fixture
+def img():
+    rng = np.random.default_rng(0)
+    # gamma speckle with mean .1 (-10 dB) and ENL 4.4
+    img = 0.1 * rng.gamma(ENL, 1 / ENL, (600, 700))
+    img[50: 60, 100: 200] = np.nan
+    return img
+
+
+@pytest.mark.parametrize('window_size', [7, 15])
+def test_get_enl_sampled(img, window_size):
+    result = get_enl_sampled(img,
+                             window_size=window_size,
+                             n_windows=5000,
+                             random_state=0)
+    enl_full = get_enl_mode(get_enl_img(img, window_size))
+    low, high = result['confidence_interval']
+    assert low <= result['enl'] <= high
+    assert abs(result['enl'] - enl_full) <= 0.2
+    assert low - 0.1 <= enl_full <= high + 0.1
+    assert abs(result['enl'] - ENL) <= 0.3
+    assert result['n_windows'] == 5000
+
+
+def test_get_enl_sampled_matches_enl_img_at_centers(img):
+    # the samples are the values of get_enl_img at interior centers
+    window_size = 15
+    radius = window_size // 2
+    enl_img = get_enl_img(img, window_size)
+    result = get_enl_sampled(img,
+                             window_size=window_size,
+                             n_windows=500,
+                             random_state=0)
+    interior = np.sort(enl_img[radius: -radius, radius: -radius].ravel())
+    samples = result['enl_samples']
+    index = np.clip(np.searchsorted(interior, samples), 1, interior.size - 1)
+    distances = np.minimum(np.abs(interior[index] - samples),
+                           np.abs(interior[index - 1] - samples))
+    assert distances.max() < 1e-10
+
+
+@pytest.mark.parametrize('use_mask', [False, True])
+def test_get_enl_imgs_matches_get_enl_img(use_mask):
+    rng = np.random.default_rng(1)
+    img = 0.1 * rng.gamma(ENL, 1 / ENL, (120, 150))
+    img[10: 20, 30: 60] = np.nan
+    img[:3, :4] = np.nan
+    mask = None
+    if use_mask:
+        mask = np.zeros(img.shape, dtype=bool)
+        mask[60: 90, 100:] = True
+    window_sizes = [3, 7, 15, 31]
+    enl_imgs = get_enl_imgs(img, window_sizes, mask=mask)
+    assert sorted(enl_imgs) == window_sizes
+    for window_size in window_sizes:
+        expected = get_enl_img(img, window_size, mask=mask)
+        result = enl_imgs[window_size]
+        assert np.array_equal(np.isnan(result), np.isnan(expected))
+        # the integral images accumulate rounding errors
+        np.testing.assert_allclose(result, expected, atol=1e-4, rtol=0)
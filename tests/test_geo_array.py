@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from rabasar.geo_array import GeoArray
+
+
+@pytest.fixture
+def geo_arr():
+    arr = np.arange(12, dtype=np.float32).reshape(3, 4)
+    return GeoArray(arr, {'height': 3, 'width': 4, 'dtype': 'float32'})
+
+
+def test_array_no_copy(geo_arr):
+    assert np.asarray(geo_arr) is geo_arr.arr
+    assert np.asarray(geo_arr, dtype=np.float32) is geo_arr.arr
+    assert geo_arr.__array__(copy=False) is geo_arr.arr
+    assert geo_arr.__array__(np.float32, copy=False) is geo_arr.arr
+
+
+def test_array_copy(geo_arr):
+    arr = geo_arr.__array__(copy=True)
+    assert arr is not geo_arr.arr
+    assert arr.dtype == np.float32
+    np.testing.assert_array_equal(arr, geo_arr.arr)
+    arr[0, 0] = -1
+    assert geo_arr.arr[0, 0] == 0
+
+
+def test_array_dtype(geo_arr):
+    arr = np.asarray(geo_arr, dtype=np.float64)
+    assert arr.dtype == np.float64
+    np.testing.assert_array_equal(arr, geo_arr.arr)
+    assert geo_arr.__array__(np.float64, copy=True).dtype == np.float64
+    with pytest.raises(ValueError):
+        geo_arr.__array__(np.float64, copy=False)
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+import pytest
+
+HEAVY_MODULES = ['astropy', 'skimage', 'bm3d', 'fiona']
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True,
+                          text=True,
+                          check=True)
+
+
+@pytest.mark.parametrize('statement',
+                         ['import rabasar',
+                          'from rabasar import scale_img'])
+def test_heavy_modules_not_imported(statement):
+    code = (f'{statement}\n'
+            'import sys\n'
+            f'print([m for m in {HEAVY_MODULES!r} if m in sys.modules])')
+    result = _run(code)
+    assert result.stdout.strip() == '[]'
+
+
+def test_import_time():
+    # -X importtime writes `import time: self [us] | cumulative | name`
+    result = _run('import rabasar')
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            cumulative[fields[2].strip()] = int(fields[1])
+    # only the package itself (numpy etc. are not imported eagerly)
+    assert cumulative['rabasar'] < 200_000
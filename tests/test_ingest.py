@@ -0,0 +1,168 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import hashlib
+import json
+import threading
+import pytest
+from rabasar import ingest
+from rabasar.ingest import download_file, download_files
+
+FILES = {f'/file_{k}.bin': bytes(range(256)) * (40 * (k + 1))
+         for k in range(3)}
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves FILES with Range support. Paths in `server.drop_once` are cut off
+    halfway the first time they are requested and paths in
+    `server.fail_once` return a 503 the first time.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+            drop = self.path in server.drop_once
+            fail = self.path in server.fail_once
+            server.drop_once.discard(self.path)
+            server.fail_once.discard(self.path)
+        if self.path not in FILES:
+            self.send_error(404)
+            return
+        if fail:
+            self.send_error(503)
+            return
+        data = FILES[self.path]
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header is not None:
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if drop:
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # no backoff waits in the tests
+    monkeypatch.setattr(ingest.time, 'sleep', lambda seconds: None)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _RangeHandler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.drop_once = set()
+    httpd.fail_once = set()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def test_resume_after_dropped_connection(server, tmp_path):
+    path = '/file_1.bin'
+    server.drop_once.add(path)
+    dest_path = download_file(server.url + path,
+                              tmp_path / 'file_1.bin',
+                              checksum=_md5(FILES[path]))
+    assert Path(dest_path).read_bytes() == FILES[path]
+    half = len(FILES[path]) // 2
+    assert server.requests == [(path, None), (path, f'bytes={half}-')]
+    assert not (tmp_path / 'file_1.bin.part').exists()
+
+
+def test_resume_existing_part_file(server, tmp_path):
+    path = '/file_2.bin'
+    (tmp_path / 'file_2.bin.part').write_bytes(FILES[path][:1000])
+    dest_path = download_file(server.url + path, tmp_path / 'file_2.bin')
+    assert Path(dest_path).read_bytes() == FILES[path]
+    assert server.requests == [(path, 'bytes=1000-')]
+
+
+def test_complete_part_file_416(server, tmp_path):
+    path = '/file_0.bin'
+    (tmp_path / 'file_0.bin.part').write_bytes(FILES[path])
+    dest_path = download_file(server.url + path,
+                              tmp_path / 'file_0.bin',
+                              checksum=_md5(FILES[path]))
+    assert Path(dest_path).read_bytes() == FILES[path]
+    assert server.requests == [(path, f'bytes={len(FILES[path])}-')]
+
+
+def test_retry_server_error(server, tmp_path):
+    path = '/file_0.bin'
+    server.fail_once.add(path)
+    dest_path = download_file(server.url + path, tmp_path / 'file_0.bin')
+    assert Path(dest_path).read_bytes() == FILES[path]
+    assert len(server.requests) == 2
+
+
+def test_size_mismatch(server, tmp_path):
+    path = '/file_0.bin'
+    with pytest.raises(ValueError, match='expected'):
+        download_file(server.url + path,
+                      tmp_path / 'file_0.bin',
+                      expected_size=len(FILES[path]) + 1)
+    assert not list(tmp_path.iterdir())
+
+
+def test_download_files_manifest(server, tmp_path):
+    urls = [server.url + path for path in FILES]
+    checksums = {server.url + path: _md5(data)
+                 for path, data in FILES.items()}
+    server.drop_once.add('/file_2.bin')
+    dest_paths = download_files(urls,
+                                dest_dir=tmp_path,
+                                checksums=checksums,
+                                n_workers=3)
+    for dest_path, data in zip(dest_paths, FILES.values()):
+        assert Path(dest_path).read_bytes() == data
+
+    manifest = json.loads((tmp_path / 'download_manifest.json').read_text())
+    assert manifest == {dest_path: {'url': url,
+                                    'size': len(data),
+                                    'checksum': _md5(data)}
+                        for dest_path, url, data in zip(dest_paths,
+                                                        urls,
+                                                        FILES.values())}
+
+    # completed files are skipped when rerun
+    n_requests = len(server.requests)
+    download_files(urls, dest_dir=tmp_path, checksums=checksums)
+    assert len(server.requests) == n_requests
+
+
+def test_download_files_checksum_mismatch(server, tmp_path):
+    urls = [server.url + path for path in FILES]
+    checksums = {urls[0]: _md5(b'not the file')}
+    with pytest.raises(RuntimeError, match='1 of 3 downloads failed'):
+        download_files(urls, dest_dir=tmp_path, checksums=checksums)
+    assert not (tmp_path / 'file_0.bin').exists()
+    assert not (tmp_path / 'file_0.bin.part').exists()
+    manifest = json.loads((tmp_path / 'download_manifest.json').read_text())
+    assert str(tmp_path / 'file_0.bin') not in manifest
+    assert len(manifest) == 2
@@ -0,0 +1,86 @@
+from pathlib import Path
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import rabasar
+from rabasar.kernels import admm_likelihood_update
+from rabasar.ratio_denoise import ratio_lklhd_iter
+from rabasar.spatial_denoise import newton_lklhd_iter
+
+from rabasar import kernels
+
+requires_numba = pytest.mark.skipif(kernels.numba is None,
+                                    reason='numba is not installed')
+
+
+@requires_numba
+@pytest.mark.parametrize('Lm', [None, 20.])
+@pytest.mark.parametrize('newton_tol', [None, 1e-6])
+@pytest.mark.parametrize('relaxed', [False, True])
+def test_numba_matches_numpy(Lm, newton_tol, relaxed):
+    rng = np.random.default_rng(0)
+    shape = (64, 80)
+    img_db = np.log10(rng.gamma(4, 1 / 4, shape))
+    x_k = img_db + 0.1 * rng.standard_normal(shape)
+    z_kp1 = x_k + 0.05 * rng.standard_normal(shape)
+    z_k = z_kp1 + 0.01 * rng.standard_normal(shape)
+    u_k = 0.01 * rng.standard_normal(shape)
+    x_relaxed = 1.6 * x_k - 0.6 * z_k if relaxed else None
+    kwargs = dict(L=4.,
+                  beta=0.5,
+                  newton_iterations=10,
+                  newton_tol=newton_tol,
+                  Lm=Lm,
+                  x_relaxed=x_relaxed)
+
+    out_numpy = admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db,
+                                       use_numba=False, **kwargs)
+    out_numba = admm_likelihood_update(x_k, u_k, z_kp1, z_k, img_db,
+                                       use_numba=True, **kwargs)
+    for arr_numpy, arr_numba in zip(out_numpy[:3], out_numba[:3]):
+        assert arr_numba.shape == shape
+        np.testing.assert_allclose(arr_numba, arr_numpy, rtol=0, atol=1e-10)
+    np.testing.assert_allclose(out_numba[3], out_numpy[3], rtol=1e-10)
+
+
+@requires_numba
+@pytest.mark.parametrize('cache_dir', [None, 'numba_cache'])
+def test_numba_cache_location(cache_dir, tmp_path):
+    package_cache = Path(rabasar.__file__).parent / '__pycache__'
+
+    def get_package_cache_files():
+        return set(package_cache.glob('kernels.*.nb*'))
+
+    before = get_package_cache_files()
+    env = {k: v for k, v in os.environ.items() if k != 'NUMBA_CACHE_DIR'}
+    if cache_dir is not None:
+        env['NUMBA_CACHE_DIR'] = str(tmp_path / cache_dir)
+    code = ('import numpy as np\n'
+            'from rabasar.kernels import admm_likelihood_update\n'
+            'x = np.zeros(10)\n'
+            'admm_likelihood_update(x, x, x, x, x, L=1., beta=1., '
+            'newton_iterations=1, use_numba=True)\n')
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+    assert get_package_cache_files() == before
+    cached = list(tmp_path.rglob('*.nbi'))
+    assert len(cached) == (0 if cache_dir is None else 1)
+
+
+@pytest.mark.parametrize('Lm', [None, 20.])
+def test_lklhd_iter_matches_kernel(Lm):
+    rng = np.random.default_rng(1)
+    img_db = np.log10(rng.gamma(4, 1 / 4, 500))
+    x_k = img_db + 0.1 * rng.standard_normal(500)
+    z_kp1 = x_k + 0.05 * rng.standard_normal(500)
+    u_k = 0.01 * rng.standard_normal(500)
+    x_kp1, u_kp1, _, _ = admm_likelihood_update(x_k, u_k, z_kp1, z_kp1,
+                                                img_db, 4., 0.5, 1, Lm=Lm,
+                                                use_numba=False)
+    a_k = z_kp1 + u_kp1
+    if Lm is None:
+        expected = newton_lklhd_iter(x_k, a_k, img_db, 4., 0.5)
+    else:
+        expected = ratio_lklhd_iter(x_k, a_k, img_db, 4., Lm, 0.5)
+    np.testing.assert_allclose(x_kp1, expected, rtol=1e-14)
@@ -0,0 +1,41 @@
+import numpy as np
+from rabasar.nd_tools import StreamingHistogram, get_percentile_bounds
+
+
+def test_streaming_histogram_matches_percentiles():
+    rng = np.random.default_rng(0)
+    data = rng.gamma(4, 1 / 4, 100_000)
+    histogram = StreamingHistogram()
+    for chunk in np.array_split(data, 7):
+        histogram.update(chunk)
+    expected = np.percentile(data, [2, 50, 98])
+    span = data.max() - data.min()
+    assert np.allclose(histogram.percentile([2, 50, 98]),
+                       expected,
+                       atol=2 * span / histogram.n_bins)
+
+
+def test_streaming_histogram_ignores_inf():
+    histogram = StreamingHistogram()
+    histogram.update(np.array([0.1, 0.5, np.inf]))
+    histogram.update(np.array([-np.inf, 0.3]))
+    assert histogram.n == 3
+    assert (histogram.min, histogram.max) == (0.1, 0.5)
+    assert np.all(np.isfinite(histogram.percentile([2, 50, 98])))
+
+
+def test_streaming_histogram_ignores_nodata_chunks():
+    histogram = StreamingHistogram()
+    histogram.update(np.full(10, np.nan))
+    histogram.update(np.array([np.nan, np.inf, -np.inf]))
+    assert histogram.n == 0
+    histogram.update(np.array([1., 2., np.nan]))
+    assert histogram.n == 2
+
+
+def test_get_percentile_bounds_db_with_zeros():
+    img = np.array([0., 0.01, 0.1, 1.])
+    with np.errstate(divide='ignore'):
+        img_db = 10 * np.log10(img)
+    lower, upper = get_percentile_bounds([img_db], percentiles=(0, 100))
+    assert (lower, upper) == (-20, 0)
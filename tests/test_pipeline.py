@@ -0,0 +1,130 @@
+import threading
+import time
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rabasar.pipeline import (denoise_rasters_pipelined, prefetch,
+                              run_pipelined, write_behind)
+
+
+class Counter:
+    """Tracks the number of calls running at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.current -= 1
+
+
+def test_prefetch_order_and_bound():
+    submitted = []
+    consumed = []
+
+    def read(item):
+        submitted.append(item)
+        # later items finish first
+        time.sleep(0.01 * (5 - item % 5))
+        return item ** 2
+
+    for result in prefetch(range(10), read, n_prefetch=3, n_threads=3):
+        # at most n_prefetch items are read ahead of the consumer
+        assert len(submitted) - len(consumed) <= 4
+        consumed.append(result)
+    assert consumed == [item ** 2 for item in range(10)]
+
+
+def test_write_behind_order_and_bound():
+    counter = Counter()
+    computed = []
+    written = []
+
+    def results():
+        for item in range(8):
+            computed.append(item)
+            # the outstanding writes are bounded by max_pending
+            assert len(computed) - len(written) <= 3
+            yield item, str(item)
+
+    def write(item, value):
+        with counter:
+            time.sleep(0.01 * (item % 3))
+            written.append(item)
+            return value
+
+    outputs = write_behind(results(), write, max_pending=2, n_threads=2)
+    assert outputs == [str(item) for item in range(8)]
+    assert counter.max <= 2
+
+
+def test_write_behind_raises_writer_exception():
+    def write(item):
+        if item == 3:
+            raise OSError('disk full')
+        return item
+
+    with pytest.raises(OSError, match='disk full'):
+        write_behind(((item,) for item in range(6)), write)
+
+
+def test_run_pipelined():
+    written = {}
+
+    def write(item, value):
+        written[item] = value
+        return item
+
+    outputs = run_pipelined(range(6), lambda item: item, lambda x: 2 * x,
+                            write, n_prefetch=2, max_pending_writes=1)
+    assert outputs == list(range(6))
+    assert written == {item: 2 * item for item in range(6)}
+
+    def bad_write(item, value):
+        raise RuntimeError(f'failed {item}')
+
+    with pytest.raises(RuntimeError, match='failed 0'):
+        run_pipelined(range(3), lambda item: item, lambda x: x, bad_write)
+
+
+@pytest.mark.parametrize('src_dtype, profile_updates, expected_dtype',
+                         [('float32', {}, 'float32'),
+                          ('uint16', {}, 'float32'),
+                          ('float32', {'dtype': 'float64'}, 'float64')])
+def test_denoise_rasters_pipelined_dtype(tmp_path,
+                                         src_dtype,
+                                         profile_updates,
+                                         expected_dtype):
+    profile = {'driver': 'GTiff',
+               'dtype': src_dtype,
+               'width': 8,
+               'height': 6,
+               'count': 1,
+               'crs': CRS.from_epsg(4326),
+               'transform': Affine(10, 0, 500, 0, -10, 800)}
+    src_paths, dest_paths = [], []
+    for k in range(3):
+        src_paths.append(tmp_path / f'src_{k}.tif')
+        dest_paths.append(tmp_path / f'dest_{k}.tif')
+        with rasterio.open(src_paths[-1], 'w', **profile) as ds:
+            ds.write(np.full((1, 6, 8), k + 1, dtype=src_dtype))
+
+    # returns float64 like the denoisers
+    def denoise(arr):
+        return arr.astype(np.float64) / 2, []
+
+    denoise_rasters_pipelined(src_paths, dest_paths, denoise,
+                              **profile_updates)
+    for k, path in enumerate(dest_paths):
+        with rasterio.open(path) as ds:
+            assert ds.dtypes[0] == expected_dtype
+            np.testing.assert_allclose(ds.read(1), (k + 1) / 2)
@@ -0,0 +1,97 @@
+import tracemalloc
+import numpy as np
+import pytest
+from rabasar.planner import (estimate_peak_memory,
+                             plan_execution,
+                             run_plan)
+from rabasar.spatial_denoise import admm_spatial_denoise
+
+
+def _get_peak_memory(img, **kwargs):
+    tracemalloc.start()
+    try:
+        admm_spatial_denoise(img, 4, 'tv', {'weight': 1},
+                             max_admm_iterations=4, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('acceleration, memory',
+                         [(None, 5),
+                          ('relaxation', 5),
+                          ('anderson', 2),
+                          ('anderson', 5)])
+def test_estimate_peak_memory_acceleration(acceleration, memory):
+    rng = np.random.default_rng(0)
+    img = (0.1 * rng.gamma(4, 1 / 4, (256, 256))).astype(np.float32)
+    # compile the kernels before measuring
+    admm_spatial_denoise(img[:32, :32], 4, 'tv', {'weight': 1},
+                         max_admm_iterations=2)
+    peak = _get_peak_memory(img,
+                            acceleration=acceleration,
+                            acceleration_params={'memory': memory})
+    estimate = estimate_peak_memory('admm_spatial_denoise',
+                                    img.shape,
+                                    acceleration=acceleration,
+                                    anderson_memory=memory,
+                                    safety_factor=1)
+    assert peak <= estimate <= 1.2 * peak
+
+
+def test_run_plan_acceleration():
+    img = np.ones((64, 64), dtype=np.float32)
+    plan = plan_execution('admm_spatial_denoise', img.shape, 1e9,
+                          acceleration='anderson', anderson_memory=3)
+    assert plan.peak_memory_per_tile > plan_execution(
+        'admm_spatial_denoise', img.shape, 1e9).peak_memory_per_tile
+    calls = []
+
+    def func(tile, **kwargs):
+        calls.append(kwargs)
+        return tile
+
+    run_plan(plan, func, img, verbose=False)
+    assert calls == [{'acceleration': 'anderson',
+                      'acceleration_params': {'memory': 3}}]
+    with pytest.raises(ValueError):
+        run_plan(plan, func, img, acceleration='relaxation', verbose=False)
+    with pytest.raises(ValueError):
+        run_plan(plan, func, img, acceleration_params={'memory': 5},
+                 verbose=False)
+    with pytest.raises(ValueError):
+        estimate_peak_memory('get_enl_img', img.shape,
+                             acceleration='anderson')
+
+
+@pytest.mark.parametrize('stage', ['admm_spatial_denoise',
+                                   'get_enl_img',
+                                   'interpolate_nn'])
+@pytest.mark.parametrize('max_memory', [5e7, 2e8, 1e9, 1e10])
+def test_plan_execution_within_budget(stage, max_memory):
+    shape = (3000, 5000)
+    kwargs = dict(dtype='float32', overlap=32, max_workers=8)
+    try:
+        plan = plan_execution(stage, shape, max_memory, **kwargs)
+    except MemoryError:
+        # the input and (float32) output images alone exceed the budget
+        assert 3000 * 5000 * (4 + 4) > max_memory
+        return
+    assert plan.peak_memory <= max_memory
+    assert 1 <= plan.n_workers <= 8
+    if plan.tile_size is None:
+        assert plan.peak_memory_per_tile == estimate_peak_memory(stage,
+                                                                 shape)
+        return
+    assert plan.tile_size % 64 == 0
+    assert plan.n_workers <= plan.n_tiles
+    if plan.n_workers > 1:
+        assert plan.tile_size >= 256
+    # the estimate is for the largest tile with its overlap
+    halo_size = plan.tile_size + 2 * plan.overlap
+    assert plan.peak_memory_per_tile == estimate_peak_memory(
+        stage, (min(halo_size, shape[0]), min(halo_size, shape[1])))
+    halo_shapes = {(halo[0].stop - halo[0].start,
+                    halo[1].stop - halo[1].start)
+                   for _, halo in plan.get_tile_slices()}
+    assert max(h * w for h, w in halo_shapes) <= halo_size ** 2
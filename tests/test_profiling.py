@@ -0,0 +1,66 @@
+import sys
+import time
+import numpy as np
+import pytest
+from rabasar.profiling import PipelineProfiler, profile_stage
+
+
+@profile_stage('outer')
+def outer(n_bytes: int):
+    arr = np.ones(n_bytes, dtype=np.uint8)
+    # long enough for the RSS sampler
+    time.sleep(0.05)
+    inner()
+    return int(arr[-1])
+
+
+@profile_stage('inner')
+def inner():
+    time.sleep(0.01)
+
+
+@profile_stage('failing')
+def failing():
+    raise RuntimeError('stage failed')
+
+
+def test_profile_stage_inactive():
+    assert outer(10) == 1
+    assert outer.__name__ == 'outer'
+
+
+def test_profile_stage(tmp_path):
+    with PipelineProfiler(profile_dir=str(tmp_path)) as profiler:
+        assert outer(10) == 1
+        outer(10)
+        with pytest.raises(RuntimeError):
+            failing()
+    assert set(profiler.records) == {('outer',),
+                                     ('outer', 'inner'),
+                                     ('failing',)}
+    assert profiler.records[('outer',)]['calls'] == 2
+    assert profiler.records[('outer', 'inner')]['calls'] == 2
+    assert profiler.records[('failing',)]['calls'] == 1
+    outer_wall = profiler.records[('outer',)]['wall']
+    inner_wall = profiler.records[('outer', 'inner')]['wall']
+    assert outer_wall >= 0.12
+    assert outer_wall >= inner_wall >= 0.02
+    assert 'outer;inner' in profiler.to_collapsed_stacks()
+    assert '  inner' in profiler.summary()
+    assert (tmp_path / 'outer.prof').exists()
+    # stages are no longer recorded after the profiler exits
+    outer(10)
+    assert profiler.records[('outer',)]['calls'] == 2
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='the current RSS is read from /proc')
+def test_profile_stage_rss_delta():
+    with PipelineProfiler() as profiler:
+        # warm up so the baseline includes the interpreter allocations
+        outer(10)
+        outer(200 * 2 ** 20)
+        outer(10)
+    # the 200 MB array is freed before the end of the stage
+    assert profiler.records[('outer',)]['peak_rss_delta_mb'] >= 150
+    assert profiler.records[('outer', 'inner')]['peak_rss_delta_mb'] < 50
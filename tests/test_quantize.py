@@ -0,0 +1,72 @@
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from rabasar.geo_array import GeoArray
+from rabasar.quantize import read_product
+from rabasar.rio_tools import read_window, read_windows
+from rabasar.temporal_stats import (STATISTICS_BANDS,
+                                    write_temporal_statistics)
+
+# half a quantization step in dB for the default range
+DB_TOLERANCE = 65 / 65534 / 2 * 1.01
+
+
+def assert_close_db(arr, expected):
+    assert arr.dtype == np.float32
+    assert np.array_equal(np.isnan(arr), np.isnan(expected))
+    error = np.abs(10 * np.log10(arr) - 10 * np.log10(expected))
+    assert np.nanmax(error) <= DB_TOLERANCE
+
+
+def test_read_product(products):
+    imgs, _, quantized_paths = products
+    arr, profile = read_product(quantized_paths[0])
+    assert profile['dtype'] == 'float32'
+    assert_close_db(arr, imgs[0])
+    arr_db, _ = read_product(quantized_paths[0], linear=False)
+    assert np.nanmax(np.abs(arr_db - 10 * np.log10(imgs[0]))) <= DB_TOLERANCE
+
+
+def test_geo_array_from_file(products):
+    imgs, _, quantized_paths = products
+    geo_arr = GeoArray.from_file(quantized_paths[0])
+    assert geo_arr.profile['dtype'] == 'float32'
+    assert_close_db(geo_arr.arr, imgs[0])
+    geo_arr_crop = GeoArray.from_file(quantized_paths[0],
+                                      slice_x=np.s_[5:40],
+                                      slice_y=np.s_[2:30])
+    assert_close_db(geo_arr_crop.arr, imgs[0][2:30, 5:40])
+
+
+def test_read_window(products):
+    imgs, _, quantized_paths = products
+    window = Window(5, 2, 35, 28)
+    arr, profile = read_window(quantized_paths[0], window, indexes=1)
+    assert profile['dtype'] == 'float32'
+    assert_close_db(arr, imgs[0][2:30, 5:40])
+    arr, _ = read_window(quantized_paths[0], window)
+    assert_close_db(arr[0], imgs[0][2:30, 5:40])
+
+
+def test_read_windows(products):
+    imgs, _, quantized_paths = products
+    windows = [Window(0, 0, 16, 16), Window(16, 16, 32, 32)]
+    results = read_windows(quantized_paths[0], windows, indexes=1)
+    assert_close_db(results[0][0], imgs[0][:16, :16])
+    assert_close_db(results[1][0], imgs[0][16:48, 16:48])
+
+
+def test_temporal_statistics(products, tmp_path):
+    _, float_paths, quantized_paths = products
+    stats = []
+    for name, paths in [('float', float_paths), ('q', quantized_paths)]:
+        dest_path = write_temporal_statistics(paths,
+                                              str(tmp_path / f'{name}.tif'),
+                                              tile_size=16)
+        with rasterio.open(dest_path) as ds:
+            stats.append(ds.read())
+    mean_index = STATISTICS_BANDS.index('mean')
+    assert np.allclose(stats[0][mean_index],
+                       stats[1][mean_index],
+                       rtol=1e-3,
+                       equal_nan=True)
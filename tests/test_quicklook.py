@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import rasterio
+from rabasar.quicklook import get_rgb_percentile_bounds, write_rgb_cog
+
+
+def test_quicklooks(products, tmp_path):
+    _, float_paths, quantized_paths = products
+    float_bounds = get_rgb_percentile_bounds([float_paths[0]],
+                                             [float_paths[1]],
+                                             decimation=2)
+    quantized_bounds = get_rgb_percentile_bounds([quantized_paths[0]],
+                                                 [quantized_paths[1]],
+                                                 decimation=2)
+    assert np.allclose(float_bounds, quantized_bounds, rtol=1e-3)
+
+    cogs = []
+    for name, paths in [('float', float_paths), ('q', quantized_paths)]:
+        cog_path = write_rgb_cog(paths[0],
+                                 paths[1],
+                                 str(tmp_path / f'{name}_rgb.tif'),
+                                 float_bounds,
+                                 tile_size=16,
+                                 overview_levels=[2])
+        with rasterio.open(cog_path) as ds:
+            cogs.append(ds.read().astype(int))
+    assert np.abs(cogs[0] - cogs[1]).max() <= 1
+
+
+def test_write_rgb_cog_cleanup_on_failure(products, tmp_path, monkeypatch):
+    _, float_paths, _ = products
+    out_dir = tmp_path / 'cog'
+    out_dir.mkdir()
+
+    def failing_copy(*args, **kwargs):
+        raise RuntimeError('copy failed')
+
+    monkeypatch.setattr('rabasar.quicklook.rio_copy', failing_copy)
+    with pytest.raises(RuntimeError, match='copy failed'):
+        write_rgb_cog(float_paths[0],
+                      float_paths[1],
+                      str(out_dir / 'rgb.tif'),
+                      np.array([(0., 1.)] * 3),
+                      tile_size=16,
+                      overview_levels=[2])
+    assert list(out_dir.iterdir()) == []
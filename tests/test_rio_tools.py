@@ -0,0 +1,105 @@
+from affine import Affine
+import numpy as np
+import pytest
+import rasterio
+from rasterio.crs import CRS
+from rasterio.windows import transform as window_transform
+from shapely.geometry import Point, box
+from rabasar.rio_tools import (_get_reprojected_grid,
+                               get_cropped_profile,
+                               get_window_from_slices,
+                               rasterize_shapes_to_multiband_array,
+                               rasterize_shapes_to_tif,
+                               reproject_profile_to_new_crs)
+
+PROFILE = {'height': 100,
+           'width': 90,
+           'count': 1,
+           'dtype': 'float32',
+           'crs': 'EPSG:32611',
+           'transform': Affine(10, 0, 500_000, 0, -10, 4_000_000)}
+
+
+def _get_shapes():
+    rng = np.random.default_rng(0)
+    centers = rng.uniform([500_000, 3_999_000], [500_900, 4_000_000],
+                          size=(40, 2))
+    radii = rng.uniform(5, 120, size=40)
+    shapes = [Point(x, y).buffer(r) for (x, y), r in zip(centers, radii)]
+    # partly and fully outside the raster
+    shapes.append(box(499_950, 3_999_500, 500_050, 4_000_100))
+    shapes.append(box(400_000, 3_000_000, 400_100, 3_000_100))
+    return shapes
+
+
+def test_rasterize_shapes_to_tif(tmp_path):
+    shapes = _get_shapes()
+    attributes = [np.arange(1, len(shapes) + 1),
+                  np.linspace(0.5, 2, len(shapes))]
+    expected = rasterize_shapes_to_multiband_array(shapes,
+                                                   attributes,
+                                                   PROFILE)
+    dest_path = tmp_path / 'rasterized.tif'
+    # a generator is consumed once
+    rasterize_shapes_to_tif((geom for geom in shapes),
+                            attributes,
+                            PROFILE,
+                            dest_path,
+                            tile_size=32)
+    with rasterio.open(dest_path) as ds:
+        arr = ds.read()
+    assert (expected[0] > 0).sum() > 1000
+    np.testing.assert_array_equal(arr, expected)
+    # the spilled buckets are removed
+    assert list(tmp_path.iterdir()) == [dest_path]
+
+
+@pytest.mark.parametrize('slice_x, slice_y',
+                         [(np.s_[:], np.s_[:]),
+                          (np.s_[0: 0], np.s_[:]),
+                          (np.s_[10: 20], np.s_[0: 0]),
+                          (np.s_[-30:], np.s_[5: -5]),
+                          (np.s_[-30: -10], np.s_[-1:]),
+                          (np.s_[80: 200], np.s_[:1000]),
+                          (np.s_[50: 40], np.s_[3: 7])])
+def test_slices_match_numpy(slice_x, slice_y):
+    arr = np.zeros((PROFILE['height'], PROFILE['width']))
+    expected_shape = arr[slice_y, slice_x].shape
+
+    window = get_window_from_slices(PROFILE, slice_x, slice_y)
+    assert (window.height, window.width) == expected_shape
+    cropped = get_cropped_profile(PROFILE, slice_x, slice_y)
+    assert (cropped['height'], cropped['width']) == expected_shape
+    assert cropped['transform'] == window_transform(window,
+                                                    PROFILE['transform'])
+
+
+def test_slices_step():
+    with pytest.raises(ValueError):
+        get_cropped_profile(PROFILE, np.s_[::2], np.s_[:])
+    with pytest.raises(ValueError):
+        get_window_from_slices(PROFILE, np.s_[:], np.s_[::2])
+
+
+def test_reproject_profile_to_new_crs_cache():
+    _get_reprojected_grid.cache_clear()
+    src_profile = PROFILE.copy()
+    expected = reproject_profile_to_new_crs(src_profile,
+                                            'EPSG:4326',
+                                            target_resolution=1e-4)
+    # the same grid given with other, also unhashable, representations
+    src_profile['crs'] = {'init': 'epsg:32611'}
+    for dst_crs, target_resolution in [(CRS.from_epsg(4326), [1e-4, 1e-4]),
+                                       ({'init': 'epsg:4326'}, (1e-4, 1e-4)),
+                                       ('EPSG:4326', 1e-4)]:
+        profile = reproject_profile_to_new_crs(src_profile,
+                                               dst_crs,
+                                               target_resolution)
+        assert profile['crs'] == dst_crs
+        for key in ['transform', 'width', 'height']:
+            assert profile[key] == expected[key]
+    cache_info = _get_reprojected_grid.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, 3)
+
+    profile = reproject_profile_to_new_crs(PROFILE, 'EPSG:4326')
+    assert profile['transform'] != expected['transform']
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from rabasar.temporal import (RunningTemporalAverage,
+                              despeckle_temporal_average,
+                              get_dates_to_rerun,
+                              get_temporal_average,
+                              incremental_rabasar_update,
+                              rabasar_denoise_one,
+                              windowed_rabasar_denoise)
+
+L = 4
+REGULARIZER_PARAMS = {'weight': 1}
+
+
+@pytest.fixture
+def imgs():
+    """
+    Four dates of gamma speckle over a piecewise constant scene with a
+    nodata area in the last date.
+    """
+    rng = np.random.default_rng(0)
+    scene = np.full((48, 64), 0.05)
+    scene[10: 30, 15: 45] = 0.2
+    imgs = [scene * rng.gamma(L, 1 / L, scene.shape) for _ in range(4)]
+    imgs[-1][:5, :8] = np.nan
+    return imgs
+
+
+def test_warm_start_matches_cold_start(imgs):
+    ta_img = get_temporal_average(imgs)
+    kwargs = dict(max_admm_iterations=100, convergence_crit=1e-4)
+    cold, _ = despeckle_temporal_average(ta_img, L * 4, 'tv',
+                                         REGULARIZER_PARAMS, **kwargs)
+    # warm start from the reference of the first three dates
+    prev, _ = despeckle_temporal_average(get_temporal_average(imgs[:3]),
+                                         L * 3, 'tv', REGULARIZER_PARAMS,
+                                         **kwargs)
+    warm, res_list = despeckle_temporal_average(ta_img, L * 4, 'tv',
+                                                REGULARIZER_PARAMS,
+                                                ta_despeckled_prev=prev,
+                                                **kwargs)
+    assert res_list[-1] < 1e-4
+    change_db = np.abs(10 * np.log10(warm / cold))
+    assert np.nanmax(change_db) < 0.1
+
+
+def test_get_dates_to_rerun():
+    old = np.ones((10, 10))
+    new = old.copy()
+    # +0.2 dB over the left half
+    new[:, :5] *= 10 ** (0.2 / 10)
+    # masks are True where there is no data
+    mask_left = np.zeros((10, 10), dtype=bool)
+    mask_left[:, :5] = True
+    masks = [None, ~mask_left, mask_left]
+    # mean changes: 0.1, 0.2 and 0 dB
+    assert get_dates_to_rerun(old, new, masks, tol_db=0.05) == [0, 1]
+    assert get_dates_to_rerun(old, new, masks, tol_db=0.15) == [1]
+    assert get_dates_to_rerun(old, new, masks, tol_db=0.25) == []
+    # dates whose valid area has no data are skipped
+    assert get_dates_to_rerun(old, new, [np.ones((10, 10), bool)],
+                              tol_db=0) == []
+
+
+def test_incremental_matches_full_recompute(imgs):
+    kwargs = dict(max_admm_iterations=5)
+    ta_full, _ = despeckle_temporal_average(get_temporal_average(imgs),
+                                            L * 4, 'tv', REGULARIZER_PARAMS,
+                                            **kwargs)
+    img_full, _ = rabasar_denoise_one(imgs[-1], ta_full, L, L * 4, 'tv',
+                                      REGULARIZER_PARAMS, **kwargs)
+
+    running_average = RunningTemporalAverage(imgs[0].shape)
+    for img in imgs[:-1]:
+        running_average.add_img(img)
+    img_inc, ta_inc, dates = incremental_rabasar_update(imgs[-1],
+                                                        running_average,
+                                                        None,
+                                                        L,
+                                                        L * 4,
+                                                        'tv',
+                                                        REGULARIZER_PARAMS,
+                                                        REGULARIZER_PARAMS,
+                                                        **kwargs)
+    np.testing.assert_allclose(ta_inc, ta_full, rtol=1e-12)
+    np.testing.assert_allclose(img_inc, img_full, rtol=1e-12)
+    assert np.array_equal(np.isnan(img_inc), np.isnan(imgs[-1]))
+    assert dates == [0, 1, 2]
+    assert running_average.n_dates == 4
+
+
+def test_checkpoint_path_per_stage(imgs, tmp_path):
+    running_average = RunningTemporalAverage(imgs[0].shape)
+    for img in imgs[:-1]:
+        running_average.add_img(img)
+    args = (L, L * 4, 'tv', REGULARIZER_PARAMS, REGULARIZER_PARAMS)
+    kwargs = dict(max_admm_iterations=3, checkpoint_path=str(tmp_path))
+    img_d, ta_d, _ = incremental_rabasar_update(imgs[-1], running_average,
+                                                None, *args, **kwargs)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['ratio',
+                                                          'reference']
+    # rerunning resumes each stage from its own (complete) checkpoint
+    running_average.remove_img(imgs[-1])
+    img_d2, ta_d2, _ = incremental_rabasar_update(imgs[-1], running_average,
+                                                  None, *args, **kwargs)
+    assert np.array_equal(img_d, img_d2, equal_nan=True)
+    assert np.array_equal(ta_d, ta_d2, equal_nan=True)
+
+
+def test_windowed_checkpoint_path_per_date(imgs, tmp_path):
+    results = list(windowed_rabasar_denoise(imgs, 1, L, L * 3, 'tv',
+                                            REGULARIZER_PARAMS,
+                                            REGULARIZER_PARAMS,
+                                            max_admm_iterations=2,
+                                            checkpoint_path=str(tmp_path)))
+    assert len(results) == 4
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names == ['date_0', 'date_1', 'date_2', 'date_3',
+                     'reference_0', 'reference_2']
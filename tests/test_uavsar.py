@@ -0,0 +1,54 @@
+import numpy as np
+import rasterio
+from rabasar.uavsar import convert_uavsar_scene, read_uavsar_annotation
+
+ANNOTATION = """; UAVSAR annotation (truncated)
+Site Description                      = Wax Lake ; comment
+hgt.set_rows              (pixels)    = {height}
+hgt.set_cols              (pixels)    = {width}
+hgt.row_addr              (deg)       = 29.6
+hgt.col_addr              (deg)       = -91.5
+hgt.row_mult              (deg/pixel) = -0.0001
+hgt.col_mult              (deg/pixel) = 0.0002
+"""
+
+
+def test_convert_uavsar_scene(tmp_path):
+    height, width = 20, 24
+    rng = np.random.default_rng(0)
+    data_dir = tmp_path / 'waxlak_27802_19070_010_190930_L090_CX_01'
+    data_dir.mkdir()
+    (data_dir / 'scene.ann').write_text(ANNOTATION.format(height=height,
+                                                          width=width))
+    grids = {}
+    for name in ['scene_HHHH.grd', 'scene_HVHV.grd', 'scene.rtc',
+                 'scene.hgt']:
+        grids[name] = rng.uniform(0.5, 2, (height, width)).astype('<f4')
+    # zeros are nodata
+    grids['scene_HVHV.grd'][:2, :3] = 0
+    for name, grid in grids.items():
+        grid.tofile(data_dir / name)
+
+    annotation = read_uavsar_annotation(data_dir / 'scene.ann')
+    assert annotation['Site Description'] == 'Wax Lake'
+    assert annotation['hgt.set_rows'] == str(height)
+
+    paths = convert_uavsar_scene(data_dir, tmp_path / 'out', tile_size=16,
+                                 chunk_rows=3)
+    out_dir = tmp_path / 'out' / data_dir.name
+    assert paths == [str(out_dir / 'scene_HHHH.tif'),
+                     str(out_dir / 'scene_HVHV.tif'),
+                     str(out_dir / 'scene_dem.tif')]
+    expected = [grids['scene_HHHH.grd'] * grids['scene.rtc'],
+                grids['scene_HVHV.grd'] * grids['scene.rtc'],
+                grids['scene.hgt']]
+    expected[1][:2, :3] = np.nan
+    for path, arr in zip(paths, expected):
+        with rasterio.open(path) as ds:
+            assert ds.crs.to_epsg() == 4326
+            assert ds.block_shapes == [(16, 16)]
+            # the annotation gives the center of the upper left pixel
+            np.testing.assert_allclose(ds.transform.c, -91.5 - 0.0001)
+            np.testing.assert_allclose(ds.transform.f, 29.6 + 0.00005)
+            assert ds.res == (0.0002, 0.0001)
+            np.testing.assert_array_equal(ds.read(1), arr)